@@ -0,0 +1,66 @@
+"""Ответы JSON API.
+
+Сериализация выполняется orjson, если он установлен: он в несколько
+раз быстрее стандартного json и сам кодирует datetime. Без orjson
+используется json с DjangoJSONEncoder.
+"""
+import json
+from functools import wraps
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class ApiError(Exception):
+    """Ошибка запроса к API; отдается клиенту как {"error": ...}"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def dumps(data):
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_UTC_Z)
+    return json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False,
+                      separators=(',', ':')).encode()
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def json_response(data, status=200):
+    return HttpResponse(dumps(data), status=status,
+                        content_type='application/json')
+
+
+def login_required(view):
+    """Анонимному клиенту - 401 вместо перенаправления на вход"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return json_response({'error': 'Требуется авторизация'}, 401)
+        return view(request, *args, **kwargs)
+
+    return wrapper
+
+
+def api_view(view):
+    """view возвращает данные для JSON; ApiError превращается
+    в ответ с ошибкой"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return json_response(view(request, *args, **kwargs))
+        except ApiError as error:
+            return json_response({'error': str(error)}, error.status)
+
+    return wrapper
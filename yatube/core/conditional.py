@@ -0,0 +1,67 @@
+"""Условные GET-запросы (ETag и Last-Modified).
+
+Валидаторы страницы вычисляются до вызова view. Если клиент прислал
+совпадающий If-None-Match (или If-Modified-Since), ответ 304 уходит
+без обращения к кэшу страниц и рендеринга шаблона.
+
+В отличие от django.views.decorators.http.condition, валидаторы
+вычисляются одной функцией: ETag и дата изменения обычно берутся
+из одного запроса к БД.
+"""
+import hashlib
+from calendar import timegm
+from functools import wraps
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(request, *parts):
+    """ETag страницы для текущего пользователя.
+
+    В ETag входят адрес страницы, пользователь и секрет CSRF: после
+    повторного входа сохраненная клиентом форма с прежним токеном
+    не должна считаться актуальной.
+    """
+    raw = '|'.join(map(str, [
+        request.get_full_path(), request.user.pk,
+        request.META.get('CSRF_COOKIE', ''), *parts
+    ]))
+    return quote_etag(hashlib.md5(raw.encode()).hexdigest())
+
+
+def conditional_page(get_validators):
+    """Отвечает 304, если страница не изменилась.
+
+    get_validators(request, *args, **kwargs) возвращает пару
+    (части ETag, дата изменения) или None, если валидаторов нет
+    (например, объект не найден) и view нужно вызвать как обычно.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            validators = get_validators(request, *args, **kwargs)
+            if validators is None:
+                return view(request, *args, **kwargs)
+            parts, modified = validators
+            etag = make_etag(request, *parts)
+            last_modified = (timegm(modified.utctimetuple())
+                             if modified else None)
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+            if response is not None:
+                return response
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200:
+                response.setdefault('ETag', etag)
+                if last_modified:
+                    response.setdefault('Last-Modified',
+                                        http_date(last_modified))
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,55 @@
+import logging
+from functools import wraps
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+# управление транзакциями не считается запросами к данным
+TRANSACTION_STATEMENTS = ('SAVEPOINT', 'RELEASE', 'ROLLBACK', 'BEGIN',
+                          'COMMIT')
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(max_queries):
+    """Ограничивает число SQL-запросов, выполняемых view-функцией.
+
+    Запросы считаются вместе с рендерингом шаблона, команды управления
+    транзакциями не учитываются. При превышении
+    бюджета в режиме settings.QUERY_BUDGET_MODE = 'raise' выбрасывается
+    QueryBudgetExceeded, в режиме 'log' пишется предупреждение,
+    'off' отключает подсчет.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            mode = settings.QUERY_BUDGET_MODE
+            if mode == 'off':
+                return view(request, *args, **kwargs)
+            executed = []
+
+            def count_query(execute, sql, params, many, context):
+                if not sql.lstrip().upper().startswith(
+                    TRANSACTION_STATEMENTS
+                ):
+                    executed.append(sql)
+                return execute(sql, params, many, context)
+
+            with connection.execute_wrapper(count_query):
+                response = view(request, *args, **kwargs)
+            if len(executed) > max_queries:
+                message = (f'{view.__name__}: {len(executed)} запросов '
+                           f'при бюджете {max_queries}')
+                if mode == 'raise':
+                    raise QueryBudgetExceeded(message)
+                logger.warning(message)
+            return response
+
+        wrapper.query_budget = max_queries
+        return wrapper
+
+    return decorator
@@ -0,0 +1,68 @@
+"""Кэш страниц для анонимных посетителей с версиями областей.
+
+Ключ страницы включает версии областей (scope), от которых она
+зависит. Изменение данных меняет версию области (bump), и все
+зависящие от нее страницы сразу перестают находиться в кэше,
+поэтому время жизни записей можно делать большим.
+"""
+import hashlib
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import stampede
+
+
+def version_key(scope):
+    return f'page_version:{scope}'
+
+
+def get_versions(scopes):
+    """Текущие версии областей; отсутствующие создаются"""
+    keys = [version_key(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    missing = {key: uuid.uuid4().hex for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def bump(*scopes):
+    """Делает недействительными страницы, зависящие от scopes"""
+    cache.set_many({version_key(scope): uuid.uuid4().hex
+                    for scope in scopes}, None)
+
+
+def page_key(request, scopes):
+    raw = '|'.join([request.get_full_path(), *scopes,
+                    *get_versions(scopes)])
+    return 'page:' + hashlib.md5(raw.encode()).hexdigest()
+
+
+def cache_anonymous_page(get_scopes, timeout=None):
+    """Кэширует ответ view для анонимных GET-запросов.
+
+    get_scopes(request, *args, **kwargs) возвращает список областей,
+    от которых зависит страница. Пересчет истекших страниц защищен
+    от одновременного выполнения (core.stampede).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if (request.method not in ('GET', 'HEAD')
+                    or request.user.is_authenticated):
+                return view(request, *args, **kwargs)
+            return stampede.get_or_set(
+                page_key(request, get_scopes(request, *args, **kwargs)),
+                lambda: view(request, *args, **kwargs),
+                timeout or settings.PAGE_CACHE_TIMEOUT,
+                cacheable=lambda response: (response.status_code == 200
+                                            and not response.streaming)
+            )
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,15 @@
+from django.core.cache import cache
+from django.db.models.signals import post_migrate
+from django.dispatch import receiver
+
+
+@receiver(post_migrate, dispatch_uid='core_clear_cache_after_migrate')
+def clear_cache_after_migrate(plan=None, **kwargs):
+    """Очищает общий кэш, если были применены миграции.
+
+    Кэш хранится в файле и переживает перезапуск процессов: сохраненные
+    в нем экземпляры моделей и страницы могут не соответствовать новой
+    схеме или, при запуске тестов, другой базе данных.
+    """
+    if plan:
+        cache.clear()
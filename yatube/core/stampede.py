@@ -0,0 +1,103 @@
+"""Защита кэша от одновременного пересчета (cache stampede).
+
+Когда запись истекает, все процессы, запросившие ее в этот момент,
+пересчитывают значение одновременно. get_or_set снижает нагрузку
+двумя способами:
+
+* вероятностный досрочный пересчет: по мере приближения срока
+  истечения растет вероятность того, что отдельный запрос обновит
+  значение заранее, пока остальные получают текущее;
+* single-flight: пересчитывает только процесс, захвативший
+  блокировку, остальные отдают устаревшее значение, которое хранится
+  в кэше еще STAMPEDE_STALE_TTL секунд после истечения.
+
+В кэше хранится кортеж (значение, момент истечения, время расчета).
+"""
+import math
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import cache as default_cache
+
+# интервал опроса кэша, пока значение считает другой процесс
+POLL_INTERVAL = 0.05
+
+
+def lock_key(key):
+    return f'{key}:lock'
+
+
+def set(key, value, timeout, delta=0.0, cache=None):
+    """Сохраняет значение; timeout = None - без срока истечения"""
+    cache = cache or default_cache
+    if timeout is None:
+        cache.set(key, (value, None, delta), None)
+    else:
+        cache.set(key, (value, time.time() + timeout, delta),
+                  timeout + settings.STAMPEDE_STALE_TTL)
+
+
+def should_recompute(expires_at, delta, beta):
+    """Решение о досрочном пересчете.
+
+    -log(u) при u из (0, 1] неотрицателен и изредка велик, поэтому
+    пересчет начинается тем раньше, чем дольше считается значение
+    (delta) и чем больше beta.
+    """
+    if expires_at is None:
+        return False
+    gap = -delta * beta * math.log(1.0 - random.random())
+    return time.time() + gap >= expires_at
+
+
+def _wait(cache, key):
+    """Ждет значение, которое считает другой процесс"""
+    deadline = time.monotonic() + settings.STAMPEDE_LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+    return None
+
+
+def get_or_set(key, compute, timeout, cache=None, cacheable=None,
+               beta=None, single_flight=None):
+    """Значение из кэша или результат compute().
+
+    cacheable(value) решает, сохранять ли посчитанное значение.
+    beta и single_flight по умолчанию берутся из настроек
+    STAMPEDE_BETA и STAMPEDE_SINGLE_FLIGHT.
+    """
+    cache = cache or default_cache
+    if beta is None:
+        beta = settings.STAMPEDE_BETA
+    if single_flight is None:
+        single_flight = settings.STAMPEDE_SINGLE_FLIGHT
+
+    entry = cache.get(key)
+    if entry is not None:
+        value, expires_at, delta = entry
+        if not should_recompute(expires_at, delta, beta):
+            return value
+    locked = single_flight and cache.add(
+        lock_key(key), True, settings.STAMPEDE_LOCK_TIMEOUT
+    )
+    if single_flight and not locked:
+        # значение уже пересчитывает другой процесс
+        if entry is None:
+            entry = _wait(cache, key)
+        if entry is not None:
+            return entry[0]
+
+    try:
+        started = time.monotonic()
+        value = compute()
+        delta = time.monotonic() - started
+        if cacheable is None or cacheable(value):
+            set(key, value, timeout, delta, cache)
+    finally:
+        if locked:
+            cache.delete(lock_key(key))
+    return value
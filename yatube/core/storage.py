@@ -0,0 +1,103 @@
+"""Хранилище файлов с адресацией по содержимому.
+
+Файл сохраняется под именем SHA-256 своего содержимого и
+раскладывается по вложенным каталогам по первым символам хэша:
+
+    posts/photo.jpg -> posts/3f/a2/3fa2...e9.jpg
+
+Каталог верхнего уровня и расширение берутся из исходного имени.
+Повторная загрузка того же содержимого не создает копию, а возвращает
+имя уже сохраненного файла, поэтому один файл может принадлежать
+нескольким объектам: удалять его можно только после проверки ссылок.
+Повторная загрузка обновляет время изменения файла, по нему удаление
+отличает только что выданные файлы (см. posts/images.py).
+"""
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+# число уровней вложенных каталогов и символов хэша на уровень
+SHARD_DEPTH = 2
+SHARD_WIDTH = 2
+
+HASHED_NAME = re.compile(
+    r'^(?:[^/]+/)?' + r'[0-9a-f]{%d}/' % SHARD_WIDTH * SHARD_DEPTH
+    + r'(?P<digest>[0-9a-f]{64})(?:\.\w+)?$'
+)
+
+# mkstemp создает файл с правами 0o600, а FileSystemStorage - с 0o666
+# за вычетом umask процесса; umask читается один раз при импорте
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def content_hash(content):
+    """SHA-256 содержимого файла, прочитанного кусками"""
+    digest = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return digest.hexdigest()
+
+
+def hashed_name(name, digest):
+    directory = name.split('/', 1)[0] if '/' in name else ''
+    extension = os.path.splitext(name)[1].lower()
+    shards = [digest[i * SHARD_WIDTH:(i + 1) * SHARD_WIDTH]
+              for i in range(SHARD_DEPTH)]
+    return '/'.join(filter(None, [directory, *shards, digest + extension]))
+
+
+def is_hashed_name(name):
+    return HASHED_NAME.match(name) is not None
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+
+    def get_available_name(self, name, max_length=None):
+        # итоговое имя определяется содержимым в _save
+        return name
+
+    def _save(self, name, content):
+        name = hashed_name(name, content_hash(content))
+        path = self.path(name)
+        try:
+            os.utime(path)
+            return name
+        except FileNotFoundError:
+            pass
+        directory = os.path.dirname(path)
+        if self.directory_permissions_mode is not None:
+            old_umask = os.umask(0)
+            try:
+                os.makedirs(directory, self.directory_permissions_mode,
+                            exist_ok=True)
+            finally:
+                os.umask(old_umask)
+        else:
+            os.makedirs(directory, exist_ok=True)
+        # файл пишется во временный и переименовывается атомарно:
+        # параллельная загрузка того же содержимого запишет те же байты
+        descriptor, temporary = tempfile.mkstemp(dir=directory,
+                                                 prefix='.upload-')
+        try:
+            with os.fdopen(descriptor, 'wb') as destination:
+                for chunk in content.chunks():
+                    destination.write(chunk)
+            os.chmod(temporary, self.file_permissions_mode
+                     if self.file_permissions_mode is not None
+                     else 0o666 & ~_UMASK)
+            os.replace(temporary, path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        return name
@@ -0,0 +1,69 @@
+"""Тег {% cache %} с защитой от одновременного пересчета.
+
+Синтаксис совпадает со стандартным тегом django:
+
+    {% load stampede_cache %}
+    {% cache 20 index_page page_obj.number %} ... {% endcache %}
+
+Фрагмент сохраняется через core.stampede.get_or_set.
+"""
+from django import template
+from django.core.cache import InvalidCacheBackendError, caches
+from django.core.cache.utils import make_template_fragment_key
+from django.templatetags.cache import CacheNode, do_cache
+
+from core import stampede
+
+register = template.Library()
+
+
+class StampedeCacheNode(CacheNode):
+    def render(self, context):
+        vary_on = [var.resolve(context) for var in self.vary_on]
+        return stampede.get_or_set(
+            make_template_fragment_key(self.fragment_name, vary_on),
+            lambda: self.nodelist.render(context),
+            self.get_expire_time(context),
+            cache=self.get_cache(context)
+        )
+
+    def get_expire_time(self, context):
+        try:
+            expire_time = self.expire_time_var.resolve(context)
+        except template.VariableDoesNotExist:
+            raise template.TemplateSyntaxError(
+                f'"cache" tag got an unknown variable: '
+                f'{self.expire_time_var.var!r}'
+            )
+        if expire_time is not None:
+            try:
+                expire_time = int(expire_time)
+            except (ValueError, TypeError):
+                raise template.TemplateSyntaxError(
+                    f'"cache" tag got a non-integer timeout value: '
+                    f'{expire_time!r}'
+                )
+        return expire_time
+
+    def get_cache(self, context):
+        if self.cache_name:
+            cache_name = self.cache_name.resolve(context)
+            try:
+                return caches[cache_name]
+            except InvalidCacheBackendError:
+                raise template.TemplateSyntaxError(
+                    f'Invalid cache name specified for cache tag: '
+                    f'{cache_name!r}'
+                )
+        try:
+            return caches['template_fragments']
+        except InvalidCacheBackendError:
+            return caches['default']
+
+
+@register.tag('cache')
+def do_stampede_cache(parser, token):
+    node = do_cache(parser, token)
+    return StampedeCacheNode(node.nodelist, node.expire_time_var,
+                             node.fragment_name, node.vary_on,
+                             node.cache_name)
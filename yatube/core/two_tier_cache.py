@@ -0,0 +1,339 @@
+"""Двухуровневый кэш: LRU в памяти процесса перед общим SQLite-файлом.
+
+Первый уровень (local) - ограниченный по числу записей LRU внутри
+процесса, второй (shared) - таблица в SQLite-файле, общая для всех
+процессов сервера на одной машине.
+
+Каждая запись в общем хранилище помечается штампом (stamp) - номером
+изменения из общего счетчика. Удаление оставляет пустую запись
+(tombstone) с новым штампом. Процесс не чаще раза в SYNC_INTERVAL
+секунд запрашивает ключи со штампом больше последнего увиденного
+и выбрасывает их устаревшие копии из своего LRU, поэтому изменение,
+сделанное в одном процессе, доходит до остальных. clear() меняет
+поколение (generation) кэша, и локальные копии сбрасываются целиком.
+
+Настройка:
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.two_tier_cache.TwoTierCache',
+            'LOCATION': '/path/to/cache.sqlite3',
+            'OPTIONS': {
+                'MAX_ENTRIES': 100000,      # записей в общем хранилище
+                'LOCAL_MAX_ENTRIES': 1000,  # записей в LRU процесса
+                'SYNC_INTERVAL': 0.2,       # секунд между сверками штампов
+                'TOMBSTONE_TTL': 300,       # секунд хранения tombstone
+            },
+        },
+    }
+
+Счетчики попаданий и промахов по уровням возвращает stats().
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache_entries ('
+    ' key TEXT PRIMARY KEY, value BLOB, expires REAL,'
+    ' stamp INTEGER NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS cache_entries_stamp_idx'
+    ' ON cache_entries (stamp)',
+    'CREATE TABLE IF NOT EXISTS cache_meta ('
+    ' name TEXT PRIMARY KEY, value INTEGER NOT NULL)',
+    "INSERT OR IGNORE INTO cache_meta VALUES ('stamp', 0),"
+    " ('generation', 0), ('culled_stamp', 0)",
+)
+
+TIERS = ('local', 'shared')
+
+
+class TwoTierCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = location
+        self._local_max_entries = int(options.get('LOCAL_MAX_ENTRIES',
+                                                  1000))
+        self._sync_interval = float(options.get('SYNC_INTERVAL', 0.2))
+        self._tombstone_ttl = int(options.get('TOMBSTONE_TTL', 300))
+        # key -> (pickled value, expires, stamp)
+        self._local = OrderedDict()
+        self._lock = threading.RLock()
+        self._connections = threading.local()
+        self._last_stamp = None
+        self._generation = None
+        self._synced_at = 0.0
+        self._writes = 0
+        self.reset_stats()
+
+    # счетчики
+
+    def reset_stats(self):
+        self._stats = {f'{tier}_{kind}': 0
+                       for tier in TIERS for kind in ('hits', 'misses')}
+
+    def stats(self):
+        """Попадания и промахи по уровням с момента запуска процесса"""
+        with self._lock:
+            return dict(self._stats, local_entries=len(self._local))
+
+    def _count(self, tier, hits, misses):
+        with self._lock:
+            self._stats[f'{tier}_hits'] += hits
+            self._stats[f'{tier}_misses'] += misses
+
+    # общее хранилище
+
+    def _db(self):
+        connection = getattr(self._connections, 'connection', None)
+        # соединение SQLite нельзя использовать после fork
+        if connection is None or self._connections.pid != os.getpid():
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self._path, timeout=30,
+                                         isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            for statement in SCHEMA:
+                connection.execute(statement)
+            self._connections.connection = connection
+            self._connections.pid = os.getpid()
+        return connection
+
+    def _meta(self, db, name):
+        return db.execute('SELECT value FROM cache_meta WHERE name = ?',
+                          (name,)).fetchone()[0]
+
+    def _write(self, rows, only_new=False):
+        """Записывает rows = [(key, pickled value, expires)] с новыми
+        штампами; возвращает записанные ключи и их штампы"""
+        db = self._db()
+        now = time.time()
+        written = []
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            stamp = self._meta(db, 'stamp')
+            if self._last_stamp is None:
+                # первая операция процесса - запись: сверка начнется
+                # с текущего штампа
+                with self._lock:
+                    self._last_stamp = stamp
+                    self._generation = self._meta(db, 'generation')
+            for key, value, expires in rows:
+                if only_new and db.execute(
+                    'SELECT 1 FROM cache_entries WHERE key = ?'
+                    ' AND value IS NOT NULL'
+                    ' AND (expires IS NULL OR expires > ?)', (key, now)
+                ).fetchone():
+                    continue
+                stamp += 1
+                db.execute('REPLACE INTO cache_entries VALUES (?, ?, ?, ?)',
+                           (key, value, expires, stamp))
+                written.append((key, stamp))
+            db.execute("UPDATE cache_meta SET value = ? WHERE name = 'stamp'",
+                       (stamp,))
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        self._writes += len(written)
+        if self._writes >= self._max_entries // max(self._cull_frequency, 1):
+            self._writes = 0
+            self._cull()
+        return written
+
+    def _cull(self):
+        """Удаляет истекшие записи и самые старые живые записи сверх
+        MAX_ENTRIES"""
+        db = self._db()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            # после удаления tombstone процессы, не успевшие его увидеть,
+            # сбросят свои LRU целиком (см. _sync)
+            culled = db.execute(
+                'SELECT MAX(stamp) FROM cache_entries'
+                ' WHERE value IS NULL AND expires < ?', (time.time(),)
+            ).fetchone()[0]
+            if culled is not None:
+                db.execute("UPDATE cache_meta SET value = MAX(value, ?)"
+                           " WHERE name = 'culled_stamp'", (culled,))
+            db.execute('DELETE FROM cache_entries WHERE expires < ?',
+                       (time.time(),))
+            db.execute(
+                'DELETE FROM cache_entries WHERE key IN ('
+                ' SELECT key FROM cache_entries WHERE value IS NOT NULL'
+                ' ORDER BY stamp DESC LIMIT -1 OFFSET ?)', (self._max_entries,)
+            )
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+
+    # локальный уровень
+
+    def _sync(self, force=False):
+        """Выбрасывает из LRU ключи, измененные другими процессами"""
+        now = time.monotonic()
+        if not force and now - self._synced_at < self._sync_interval:
+            return
+        db = self._db()
+        meta = dict(db.execute('SELECT name, value FROM cache_meta'))
+        with self._lock:
+            self._synced_at = now
+            if (self._last_stamp is None
+                    or meta['generation'] != self._generation
+                    or meta['culled_stamp'] > self._last_stamp):
+                self._local.clear()
+            else:
+                for key, stamp in db.execute(
+                    'SELECT key, stamp FROM cache_entries WHERE stamp > ?',
+                    (self._last_stamp,)
+                ):
+                    entry = self._local.get(key)
+                    if entry is not None and entry[2] < stamp:
+                        del self._local[key]
+            self._last_stamp = meta['stamp']
+            self._generation = meta['generation']
+
+    def _local_get(self, key, now):
+        entry = self._local.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= now:
+            del self._local[key]
+            return None
+        self._local.move_to_end(key)
+        return entry
+
+    def _local_set(self, key, value, expires, stamp):
+        with self._lock:
+            current = self._local.get(key)
+            if current is not None and current[2] > stamp:
+                return
+            self._local[key] = (value, expires, stamp)
+            self._local.move_to_end(key)
+            while len(self._local) > self._local_max_entries:
+                self._local.popitem(last=False)
+
+    # API кэша django
+
+    def _get_entries(self, keys):
+        """Записи (pickled value, expires, stamp) по ключам backend-а"""
+        self._sync()
+        now = time.time()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._local_get(key, now)
+                if entry is not None:
+                    found[key] = entry
+        missing = [key for key in keys if key not in found]
+        self._count('local', len(found), len(missing))
+        if not missing:
+            return found
+        placeholders = ', '.join('?' * len(missing))
+        rows = self._db().execute(
+            f'SELECT key, value, expires, stamp FROM cache_entries'
+            f' WHERE key IN ({placeholders}) AND value IS NOT NULL'
+            f' AND (expires IS NULL OR expires > ?)', (*missing, now)
+        ).fetchall()
+        self._count('shared', len(rows), len(missing) - len(rows))
+        for key, value, expires, stamp in rows:
+            self._local_set(key, value, expires, stamp)
+            found[key] = (value, expires, stamp)
+        return found
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        entry = self._get_entries([key]).get(key)
+        if entry is None:
+            return default
+        return pickle.loads(entry[0])
+
+    def get_many(self, keys, version=None):
+        keys = {self.make_key(key, version=version): key for key in keys}
+        for key in keys:
+            self.validate_key(key)
+        entries = self._get_entries(list(keys))
+        return {keys[key]: pickle.loads(entry[0])
+                for key, entry in entries.items()}
+
+    def _set_many(self, data, timeout, version, only_new=False):
+        expires = self.get_backend_timeout(timeout)
+        rows = []
+        for key, value in data.items():
+            key = self.make_key(key, version=version)
+            self.validate_key(key)
+            rows.append((key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                         expires))
+        values = {key: value for key, value, _ in rows}
+        written = self._write(rows, only_new=only_new)
+        for key, stamp in written:
+            self._local_set(key, values[key], expires, stamp)
+        return written
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        self._set_many(data, timeout, version)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return bool(self._set_many({key: value}, timeout, version,
+                                   only_new=True))
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        entry = self._get_entries([key]).get(key)
+        if entry is None:
+            return False
+        expires = self.get_backend_timeout(timeout)
+        for key, stamp in self._write([(key, entry[0], expires)]):
+            self._local_set(key, entry[0], expires, stamp)
+        return True
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_key(key, version=version) for key in keys]
+        for key in keys:
+            self.validate_key(key)
+        with self._lock:
+            for key in keys:
+                self._local.pop(key, None)
+        tombstone_expires = time.time() + self._tombstone_ttl
+        self._write([(key, None, tombstone_expires) for key in keys])
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version=version)
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key in self._get_entries([key])
+
+    def clear(self):
+        db = self._db()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            db.execute('DELETE FROM cache_entries')
+            db.execute('UPDATE cache_meta SET value = value + 1'
+                       " WHERE name = 'generation'")
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        self._sync(force=True)
+
+    def close(self, **kwargs):
+        # соединение с файлом живет весь поток: открывать его на каждый
+        # запрос дороже, чем держать
+        pass
@@ -0,0 +1,12 @@
+"""Вспомогательные функции, общие для приложений проекта."""
+from itertools import islice
+
+
+def chunked(iterable, size):
+    """Списки по size элементов iterable; последний может быть короче"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
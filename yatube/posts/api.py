@@ -0,0 +1,155 @@
+"""JSON API лент и страницы поста, только для чтения.
+
+Строки собираются из values(): модели не создаются, связанные объекты
+не загружаются, в запрос попадают только запрошенные поля
+(?fields=id,text,author). Ленты листаются курсором по ключу
+(pub_date, id), как и HTML-страницы (posts/paginators.py):
+
+    {"results": [...], "next": "<курсор>", "previous": null}
+
+Размер страницы задается ?limit= (не больше API_MAX_PAGE_SIZE).
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+
+from core.api import ApiError, api_view, login_required
+from core.conditional import conditional_page
+from core.decorators import query_budget
+
+from . import conditional, follow_graph
+from .models import Comment, Group, Post
+from .paginators import CursorPaginator, InvalidCursor
+
+User = get_user_model()
+
+# поле ответа -> поле values()
+POST_FIELDS = {
+    'id': 'id',
+    'text': 'text',
+    'pub_date': 'pub_date',
+    'updated_at': 'updated_at',
+    'author': 'author__username',
+    'group': 'group__slug',
+    'image': 'image',
+    'image_width': 'image_width',
+    'image_height': 'image_height',
+    'comments_count': 'comments_count',
+}
+COMMENT_FIELDS = {
+    'id': 'id',
+    'text': 'text',
+    'author': 'author__username',
+    'created': 'created',
+}
+# ключ курсора выбирается всегда
+CURSOR_KEYS = ('pub_date', 'id')
+
+
+def get_fields(request, available, param='fields'):
+    """Запрошенные поля; без параметра - все"""
+    raw = request.GET.get(param)
+    if not raw:
+        return list(available)
+    fields = list(dict.fromkeys(field for field in raw.split(',')
+                                if field))
+    unknown = [field for field in fields if field not in available]
+    if unknown:
+        raise ApiError(f'Неизвестные поля: {", ".join(unknown)}')
+    return fields
+
+
+def get_limit(request):
+    try:
+        limit = int(request.GET.get('limit', settings.RECORDS_PER_PAGE))
+    except ValueError:
+        raise ApiError('limit должен быть числом')
+    return min(max(limit, 1), settings.API_MAX_PAGE_SIZE)
+
+
+def serialize(rows, fields, available):
+    items = []
+    for row in rows:
+        item = {field: row[available[field]] for field in fields}
+        if item.get('image'):
+            item['image'] = default_storage.url(item['image'])
+        elif 'image' in item:
+            item['image'] = None
+        items.append(item)
+    return items
+
+
+def feed(request, posts):
+    fields = get_fields(request, POST_FIELDS)
+    rows = posts.values(*{*CURSOR_KEYS,
+                          *(POST_FIELDS[field] for field in fields)})
+    paginator = CursorPaginator(rows, get_limit(request), keys=CURSOR_KEYS)
+    try:
+        page = paginator.cursor_page(request.GET.get('cursor'))
+    except InvalidCursor as error:
+        raise ApiError(str(error))
+    return {'results': serialize(page, fields, POST_FIELDS),
+            'next': page.next_cursor,
+            'previous': page.previous_cursor}
+
+
+def ensure_exists(data, queryset):
+    """Пустая лента несуществующей группы или автора - 404"""
+    if not data['results'] and not queryset.exists():
+        raise ApiError('Не найдено', 404)
+    return data
+
+
+@conditional_page(conditional.index_validators)
+@api_view
+@query_budget(1)
+def index(request):
+    return feed(request, Post.objects.all())
+
+
+@conditional_page(conditional.group_validators)
+@api_view
+@query_budget(2)
+def group_posts(request, slug):
+    return ensure_exists(
+        feed(request, Post.objects.filter(group__slug=slug)),
+        Group.objects.filter(slug=slug)
+    )
+
+
+@conditional_page(conditional.profile_validators)
+@api_view
+@query_budget(2)
+def profile(request, username):
+    return ensure_exists(
+        feed(request, Post.objects.filter(author__username=username)),
+        User.objects.filter(username=username)
+    )
+
+
+@login_required
+@conditional_page(conditional.follow_validators)
+@api_view
+@query_budget(1)
+def follow_index(request):
+    followees = follow_graph.for_request(request).followees(request.user)
+    return feed(request, Post.objects.filter(author_id__in=list(followees)))
+
+
+@conditional_page(conditional.post_validators)
+@api_view
+@query_budget(2)
+def post_detail(request, post_id):
+    fields = get_fields(request, POST_FIELDS)
+    row = Post.objects.filter(pk=post_id).values(
+        *{POST_FIELDS[field] for field in fields}
+    ).first()
+    if row is None:
+        raise ApiError('Не найдено', 404)
+    data = serialize([row], fields, POST_FIELDS)[0]
+    comment_fields = get_fields(request, COMMENT_FIELDS, 'comment_fields')
+    comments = Comment.objects.filter(post_id=post_id).values(
+        *{COMMENT_FIELDS[field] for field in comment_fields}
+    )
+    data['comments'] = serialize(comments, comment_fields, COMMENT_FIELDS)
+    return data
@@ -0,0 +1,280 @@
+"""Замеры времени ответа представлений и запросов лент.
+
+Каждое представление posts/urls.py вызывается через тестовый клиент,
+со всеми middleware, repeat раз; пути лент (движки ленты подписок
+и пагинация лент) вызываются напрямую. Первый вызов прогревает кэш
+и не учитывается. Для каждого замера сохраняются p50 и p99 времени
+в миллисекундах и медианное число SQL-запросов без команд управления
+транзакциями.
+
+Замеры идут с отдельным временным кэшем (isolated_cache): кэш сервера
+не очищается и не заполняется страницами откатанных данных.
+
+Результаты сравниваются с базовыми, сохраненными в JSON (по умолчанию
+во временном каталоге системы): регрессия - рост p50 больше чем
+в 1 + threshold раз (и больше чем на MIN_REGRESSION_MS) или рост числа
+запросов.
+"""
+import json
+import math
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import Count
+from django.test import Client, RequestFactory
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from core.decorators import TRANSACTION_STATEMENTS
+
+from . import counts, feeds, urls
+from .models import Group, Post
+from .paginators import paginate
+
+User = get_user_model()
+
+DEFAULT_BASELINE = os.path.join(tempfile.gettempdir(), 'yatube',
+                                'benchmark_baseline.json')
+# бэкенды кэша, хранящие данные в файле LOCATION
+FILE_BACKENDS = ('core.two_tier_cache.TwoTierCache',
+                 'django.core.cache.backends.filebased.FileBasedCache')
+# прирост p50 меньше этого считается шумом
+MIN_REGRESSION_MS = 1.0
+# адрес не из INTERNAL_IPS: иначе замер включает debug_toolbar
+REMOTE_ADDR = '192.0.2.1'
+
+# пользователь - None (аноним), 'reader', 'author' или 'staff'
+Scenario = namedtuple('Scenario', 'name url_name kwargs user method data')
+Scenario.__new__.__defaults__ = ('get', None)
+
+Context = namedtuple('Context', 'reader author staff group post own_post')
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+def find_context(prefix):
+    """Самые нагруженные объекты синтетических данных с префиксом:
+    читатель с наибольшим числом подписок, самый плодовитый автор,
+    самая большая группа и самый обсуждаемый пост"""
+    users = User.objects.filter(username__startswith=f'{prefix}_')
+    reader = users.order_by('-stats__following_count', 'pk').first()
+    author = users.order_by('-stats__posts_count', 'pk').first()
+    group = Group.objects.filter(slug__startswith=f'{prefix}-').annotate(
+        total=Count('posts')
+    ).order_by('-total', 'pk').first()
+    post = Post.objects.filter(author__in=users).order_by(
+        '-comments_count', 'pk'
+    ).first()
+    if None in (reader, author, group, post):
+        raise BenchmarkError(f'Нет данных с префиксом {prefix}, '
+                             f'запустите seed_benchmark_data')
+    staff, _ = User.objects.get_or_create(username=f'{prefix}_staff',
+                                          defaults={'is_staff': True})
+    own_post = author.posts.order_by('-pub_date', '-pk').first()
+    return Context(reader, author, staff, group, post, own_post)
+
+
+def view_scenarios(context):
+    slug = {'slug': context.group.slug}
+    username = {'username': context.author.username}
+    post = {'post_id': context.post.pk}
+    return [
+        Scenario('index', 'index', {}, None),
+        Scenario('index:auth', 'index', {}, 'reader'),
+        Scenario('group_list', 'group_list', slug, None),
+        Scenario('group_list:auth', 'group_list', slug, 'reader'),
+        Scenario('profile', 'profile', username, None),
+        Scenario('profile:auth', 'profile', username, 'reader'),
+        Scenario('post_detail', 'post_detail', post, None),
+        Scenario('post_detail:auth', 'post_detail', post, 'reader'),
+        Scenario('post_create', 'post_create', {}, 'reader'),
+        Scenario('post_edit', 'post_edit',
+                 {'post_id': context.own_post.pk}, 'author'),
+        Scenario('add_comment', 'add_comment', post, 'reader', 'post',
+                 {'text': 'Комментарий'}),
+        Scenario('follow_index', 'follow_index', {}, 'reader'),
+        Scenario('profile_follow', 'profile_follow', username, 'reader'),
+        Scenario('profile_unfollow', 'profile_unfollow', username,
+                 'reader'),
+        Scenario('export_data', 'export_data', {'dataset': 'posts'},
+                 'staff'),
+        Scenario('api_index', 'api_index', {}, None),
+        Scenario('api_group_list', 'api_group_list', slug, None),
+        Scenario('api_profile', 'api_profile', username, None),
+        Scenario('api_post_detail', 'api_post_detail', post, None),
+        Scenario('api_follow_index', 'api_follow_index', {}, 'reader'),
+    ]
+
+
+def uncovered(scenarios):
+    """Имена маршрутов posts/urls.py, для которых нет замера"""
+    covered = {scenario.url_name for scenario in scenarios}
+    return [pattern.name for pattern in urls.urlpatterns
+            if pattern.name not in covered]
+
+
+@contextmanager
+def isolated_cache():
+    """Подменяет CACHES копиями с хранилищем во временном каталоге,
+    который удаляется на выходе. Кэши не в файлах заменяются LocMemCache
+    процесса"""
+    directory = tempfile.mkdtemp(prefix='yatube-benchmark-cache-')
+    caches = {}
+    for alias, config in settings.CACHES.items():
+        if config['BACKEND'] in FILE_BACKENDS:
+            caches[alias] = {**config, 'LOCATION': os.path.join(
+                directory, f'{alias}.cache'
+            )}
+        else:
+            caches[alias] = {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': directory + alias,
+            }
+    try:
+        with override_settings(CACHES=caches):
+            yield
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def percentile(values, percent):
+    """Перцентиль по ближайшему рангу"""
+    ordered = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def measure(call, repeat):
+    timings, queries = [], []
+    for attempt in range(repeat + 1):
+        executed = []
+
+        def count_query(execute, sql, params, many, context):
+            if not sql.lstrip().upper().startswith(TRANSACTION_STATEMENTS):
+                executed.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count_query):
+            start = time.perf_counter()
+            call()
+            elapsed = time.perf_counter() - start
+        # первый вызов прогревает кэш и не учитывается
+        if attempt:
+            timings.append(elapsed * 1000)
+            queries.append(len(executed))
+    return {'p50': round(percentile(timings, 50), 3),
+            'p99': round(percentile(timings, 99), 3),
+            'queries': statistics.median(queries)}
+
+
+def view_call(client, scenario):
+    url = reverse(f'posts:{scenario.url_name}', kwargs=scenario.kwargs)
+
+    def call():
+        response = getattr(client, scenario.method)(url, scenario.data)
+        if response.status_code >= 400:
+            raise BenchmarkError(f'{scenario.name}: ответ '
+                                 f'{response.status_code}')
+        if response.streaming:
+            b''.join(response.streaming_content)
+
+    return call
+
+
+def feed_calls(context):
+    """Пути лент без middleware и шаблонов: движки ленты подписок
+    и пагинация лент главной страницы, группы и автора"""
+    factory = RequestFactory()
+
+    def request():
+        request = factory.get('/')
+        request.user = context.reader
+        return request
+
+    def engine_call(engine):
+        def call():
+            with override_settings(FOLLOW_FEED_ENGINE=engine):
+                list(feeds.follow_page(request()))
+        return call
+
+    def paginate_call(posts, count_scope):
+        def call():
+            list(paginate(request(), posts, count_scope=count_scope))
+        return call
+
+    calls = {f'feed:{engine}': engine_call(engine)
+             for engine in feeds.ENGINES}
+    calls['feed:index'] = paginate_call(
+        Post.objects.select_related('author', 'group'),
+        (counts.GLOBAL, None)
+    )
+    calls['feed:group'] = paginate_call(
+        context.group.posts.select_related('author'),
+        (counts.GROUP, context.group.pk)
+    )
+    calls['feed:profile'] = paginate_call(
+        context.author.posts.select_related('group'),
+        (counts.AUTHOR, context.author.pk)
+    )
+    return calls
+
+
+def run(context, repeat):
+    """Словарь замер -> {p50, p99, queries}"""
+    clients = {None: Client(REMOTE_ADDR=REMOTE_ADDR)}
+    for user in ('reader', 'author', 'staff'):
+        clients[user] = Client(REMOTE_ADDR=REMOTE_ADDR)
+        clients[user].force_login(getattr(context, user))
+    results = {}
+    for scenario in view_scenarios(context):
+        results[scenario.name] = measure(
+            view_call(clients[scenario.user], scenario), repeat
+        )
+    for name, call in feed_calls(context).items():
+        results[name] = measure(call, repeat)
+    return results
+
+
+def load_baseline(path):
+    try:
+        with open(path, encoding='utf-8') as baseline_file:
+            return json.load(baseline_file)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(path, results):
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as baseline_file:
+        json.dump(results, baseline_file, ensure_ascii=False, indent=2,
+                  sort_keys=True)
+
+
+def regressions(current, baseline, threshold):
+    """Сообщения о регрессиях замеров current (размер -> замер ->
+    результат) относительно baseline той же структуры"""
+    found = []
+    for size, results in current.items():
+        for name, result in results.items():
+            base = baseline.get(size, {}).get(name)
+            if base is None:
+                continue
+            if (result['p50'] > base['p50'] * (1 + threshold)
+                    and result['p50'] - base['p50'] > MIN_REGRESSION_MS):
+                found.append(f'{size} {name}: p50 {base["p50"]:.2f} -> '
+                             f'{result["p50"]:.2f} мс')
+            if result['queries'] > base['queries']:
+                found.append(f'{size} {name}: запросов '
+                             f'{base["queries"]} -> {result["queries"]}')
+    return found
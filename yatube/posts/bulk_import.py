@@ -0,0 +1,409 @@
+"""Массовая загрузка пользователей, постов, комментариев и подписок.
+
+Файл NDJSON или CSV (в формате выгрузки posts/export.py, можно сжатый
+gzip) читается потоком пачками по batch_size строк. Каждая пачка
+записывается одним bulk_create в своей транзакции: в памяти только одна
+пачка, а сбой не откатывает уже загруженные.
+
+Авторы, подписчики и группы указываются username и slug; словари
+username -> pk и slug -> pk строятся один раз на весь импорт. Посты
+и комментарии сохраняют id из файла, поэтому комментарии ссылаются
+на посты по id. Строки, которые уже есть в базе (тот же id, та же пара
+подписки или username), пропускаются: прерванный импорт можно
+запустить заново с тем же файлом.
+
+bulk_create заменяет даты полей с auto_now и auto_now_add текущим
+временем, поэтому даты из файла записываются следующим bulk_update
+в той же транзакции. Если СУБД не возвращает id из bulk_create
+(SQLite), строкам без id в файле id выдаются перед вставкой.
+
+bulk_create не отправляет сигналы (posts/signals.py), поэтому finish()
+пересчитывает счетчики затронутых постов и пользователей, пересобирает
+ленты подписок затронутых пользователей и сбрасывает в кэше то, что
+при сохранении по одной строке сбросили бы сигналы: страницы, счетчики
+лент и подписки.
+"""
+import csv
+import datetime
+import gzip
+import os
+import time
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core import page_cache as core_page_cache
+from core.api import loads
+from core.storage import HASHED_NAME
+from core.utils import chunked
+
+from . import counts, feeds, follow_graph, page_cache, stats, timelines
+from .models import Comment, Follow, Group, Post, UserStats
+
+User = get_user_model()
+
+MODELS = {
+    'users': User,
+    'posts': Post,
+    'comments': Comment,
+    'follows': Follow,
+}
+
+BATCH_SIZE = 500
+# секунд между сообщениями о ходе импорта
+PROGRESS_INTERVAL = 10
+
+
+class SkipRow(Exception):
+    """Строка пропускается; reason - ключ в статистике импорта"""
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def guess_format(path):
+    """Формат по расширению файла: .csv или .csv.gz - CSV,
+    иначе NDJSON"""
+    if path.endswith('.gz'):
+        path = path[:-3]
+    return 'csv' if os.path.splitext(path)[1] == '.csv' else 'ndjson'
+
+
+def open_input(path):
+    """Текстовый файл импорта; .gz распаковывается на лету"""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+
+def read_rows(lines, input_format):
+    """Словари строк файла; вместо испорченной строки NDJSON - None"""
+    if input_format == 'csv':
+        yield from csv.DictReader(lines)
+        return
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield loads(line)
+        except ValueError:
+            yield None
+
+
+def parse_moment(value):
+    """Дата со временем из ISO-строки; пустое значение - None"""
+    if not value:
+        return None
+    moment = value
+    if not isinstance(value, datetime.datetime):
+        moment = parse_datetime(value)
+        if moment is None:
+            raise ValueError(f'Некорректная дата: {value}')
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def parse_id(value):
+    return int(value) if value not in (None, '') else None
+
+
+def auto_date_fields(model):
+    """Поля модели, значения которых bulk_create заменяет текущим
+    временем"""
+    return [field for field in model._meta.concrete_fields
+            if getattr(field, 'auto_now', False)
+            or getattr(field, 'auto_now_add', False)]
+
+
+class Importer:
+    """Загружает строки набора dataset; stats - число созданных
+    (created) и пропущенных по причинам строк: duplicate - уже есть
+    в базе или в файле, unknown - неизвестный автор, группа или пост,
+    invalid - испорченная строка"""
+
+    def __init__(self, dataset, batch_size=BATCH_SIZE, progress=None,
+                 progress_interval=PROGRESS_INTERVAL):
+        self.dataset = dataset
+        self.model = MODELS[dataset]
+        self.build = getattr(self, f'build_{dataset}')
+        self.fresh = getattr(self, f'fresh_{dataset}')
+        self.batch_size = batch_size
+        self.progress = progress
+        self.progress_interval = progress_interval
+        self.dates = auto_date_fields(self.model)
+        self.stats = Counter()
+        self.users = dict(User.objects.values_list('username', 'pk'))
+        self.groups = dict(Group.objects.values_list('slug', 'pk'))
+        # авторы новых постов и пользователи с новыми подписками:
+        # их ленты (подписчиков авторов) пересобираются в finish()
+        self.authors = set()
+        self.followers = set()
+        # авторы, на которых появились подписки: их счетчики
+        # пересчитываются в finish()
+        self.followed = set()
+        # группы новых постов и посты новых комментариев: их страницы
+        # сбрасываются в finish()
+        self.group_ids = set()
+        self.post_ids = set()
+
+    def user_id(self, username):
+        if username not in self.users:
+            raise SkipRow('unknown')
+        return self.users[username]
+
+    def build_users(self, row, now):
+        if not row.get('username'):
+            raise ValueError('Не указан username')
+        return User(
+            username=row['username'],
+            first_name=row.get('first_name') or '',
+            last_name=row.get('last_name') or '',
+            email=row.get('email') or '',
+            # пароль в файле - уже хэш; без него вход по паролю закрыт
+            password=row.get('password') or make_password(None),
+            date_joined=parse_moment(row.get('date_joined')) or now,
+        )
+
+    def build_posts(self, row, now):
+        if not row.get('text'):
+            raise ValueError('Пустой текст')
+        author_id = self.user_id(row.get('author'))
+        slug = row.get('group')
+        if slug and slug not in self.groups:
+            raise SkipRow('unknown')
+        image = row.get('image') or ''
+        hashed = HASHED_NAME.match(image)
+        return Post(
+            id=parse_id(row.get('id')),
+            author_id=author_id,
+            group_id=self.groups[slug] if slug else None,
+            text=row['text'],
+            pub_date=parse_moment(row.get('pub_date')) or now,
+            updated_at=parse_moment(row.get('updated_at')) or now,
+            image=image,
+            image_hash=hashed['digest'] if hashed else '',
+        )
+
+    def build_comments(self, row, now):
+        if not row.get('text'):
+            raise ValueError('Пустой текст')
+        post_id = parse_id(row.get('post'))
+        if post_id is None:
+            raise ValueError('Не указан пост')
+        return Comment(
+            id=parse_id(row.get('id')),
+            post_id=post_id,
+            author_id=self.user_id(row.get('author')),
+            text=row['text'],
+            created=parse_moment(row.get('created')) or now,
+        )
+
+    def build_follows(self, row, now):
+        follow = Follow(user_id=self.user_id(row.get('user')),
+                        author_id=self.user_id(row.get('author')))
+        if follow.user_id == follow.author_id:
+            raise ValueError('Подписка на себя')
+        return follow
+
+    def skip(self, reason):
+        self.stats[reason] += 1
+
+    def fresh_by_pk(self, objects):
+        """Объекты, id которых нет ни в базе, ни раньше в пачке"""
+        existing = set(self.model.objects.filter(
+            pk__in=[obj.pk for obj in objects if obj.pk is not None]
+        ).values_list('pk', flat=True))
+        fresh = []
+        for obj in objects:
+            if obj.pk in existing:
+                self.skip('duplicate')
+                continue
+            if obj.pk is not None:
+                existing.add(obj.pk)
+            fresh.append(obj)
+        return fresh
+
+    def fresh_users(self, users):
+        fresh, seen = [], set()
+        for user in users:
+            if user.username in self.users or user.username in seen:
+                self.skip('duplicate')
+                continue
+            seen.add(user.username)
+            fresh.append(user)
+        return fresh
+
+    def fresh_posts(self, posts):
+        return self.fresh_by_pk(posts)
+
+    def fresh_comments(self, comments):
+        existing_posts = set(Post.objects.filter(
+            pk__in={comment.post_id for comment in comments}
+        ).values_list('pk', flat=True))
+        known = []
+        for comment in comments:
+            if comment.post_id in existing_posts:
+                known.append(comment)
+            else:
+                self.skip('unknown')
+        return self.fresh_by_pk(known)
+
+    def fresh_follows(self, follows):
+        existing = set(Follow.objects.filter(
+            user_id__in={follow.user_id for follow in follows},
+            author_id__in={follow.author_id for follow in follows},
+        ).values_list('user_id', 'author_id'))
+        fresh = []
+        for follow in follows:
+            pair = (follow.user_id, follow.author_id)
+            if pair in existing:
+                self.skip('duplicate')
+                continue
+            existing.add(pair)
+            fresh.append(follow)
+        return fresh
+
+    def created(self, objects):
+        """Запоминает то, что понадобится следующим пачкам и finish()"""
+        if self.dataset == 'users':
+            self.users.update(User.objects.filter(
+                username__in=[user.username for user in objects]
+            ).values_list('username', 'pk'))
+            UserStats.objects.bulk_create(
+                [UserStats(user_id=self.users[user.username])
+                 for user in objects],
+                ignore_conflicts=True
+            )
+        elif self.dataset == 'posts':
+            self.authors.update(post.author_id for post in objects)
+            self.group_ids.update(post.group_id for post in objects
+                                  if post.group_id)
+        elif self.dataset == 'comments':
+            self.post_ids.update(comment.post_id for comment in objects)
+        elif self.dataset == 'follows':
+            self.followers.update(follow.user_id for follow in objects)
+            self.followed.update(follow.author_id for follow in objects)
+
+    def assign_ids(self, objects):
+        """Выдает id объектам без id в файле, следующие за наибольшим
+        в таблице и в пачке"""
+        last = max([
+            self.model.objects.aggregate(last=Max('pk'))['last'] or 0,
+            *(obj.pk for obj in objects if obj.pk is not None),
+        ])
+        missing = [obj for obj in objects if obj.pk is None]
+        for pk, obj in enumerate(missing, last + 1):
+            obj.pk = pk
+
+    def insert(self, objects):
+        """bulk_create, сохраняющий даты из файла в полях dates"""
+        if not self.dates:
+            self.model.objects.bulk_create(objects)
+            return
+        if not connection.features.can_return_ids_from_bulk_insert:
+            # без id даты не записать по строкам
+            self.assign_ids(objects)
+        dates = [[getattr(obj, field.attname) for field in self.dates]
+                 for obj in objects]
+        self.model.objects.bulk_create(objects)
+        for obj, values in zip(objects, dates):
+            for field, value in zip(self.dates, values):
+                setattr(obj, field.attname, value)
+        self.model.objects.bulk_update(
+            objects, [field.name for field in self.dates]
+        )
+
+    def load(self, batch):
+        now = timezone.now()
+        objects = []
+        for row in batch:
+            try:
+                if not isinstance(row, dict):
+                    raise ValueError('Строка не является объектом')
+                objects.append(self.build(row, now))
+            except SkipRow as error:
+                self.skip(error.reason)
+            except ValueError:
+                self.skip('invalid')
+        with transaction.atomic():
+            objects = self.fresh(objects)
+            self.insert(objects)
+        self.stats['created'] += len(objects)
+        self.created(objects)
+
+    def run(self, rows):
+        started = reported = time.monotonic()
+        for batch in chunked(rows, self.batch_size):
+            self.load(batch)
+            now = time.monotonic()
+            if self.progress and now - reported >= self.progress_interval:
+                processed = sum(self.stats.values())
+                self.progress(self.stats, processed / (now - started))
+                reported = now
+        return self.stats
+
+    def finish(self):
+        """Делает то, что при сохранении по одной строке делают сигналы;
+        возвращает число пересобранных лент подписок"""
+        # id из файла не сдвигают последовательности PostgreSQL
+        sequence_sql = connection.ops.sequence_reset_sql(no_style(),
+                                                         [self.model])
+        with connection.cursor() as cursor:
+            for sql in sequence_sql:
+                cursor.execute(sql)
+        for post_ids in chunked(self.post_ids, self.batch_size):
+            stats.reconcile_posts(self.batch_size, post_ids)
+        for user_ids in chunked(
+            self.authors | self.followers | self.followed, self.batch_size
+        ):
+            stats.reconcile_users(self.batch_size, user_ids)
+        followers = set(self.followers)
+        for authors in chunked(self.authors, self.batch_size):
+            followers.update(Follow.objects.filter(
+                author_id__in=authors
+            ).values_list('user_id', flat=True))
+        for user_id in followers:
+            timelines.rebuild(user_id)
+        self.invalidate(followers)
+        return len(followers)
+
+    def page_scopes(self):
+        """Области кэша страниц (posts/page_cache.py) с новыми постами
+        и комментариями"""
+        if self.authors:
+            yield 'global'
+        for author_id in self.authors:
+            yield page_cache.author_scope(author_id)
+        slugs = {pk: slug for slug, pk in self.groups.items()}
+        for group_id in self.group_ids:
+            yield page_cache.group_scope(slugs[group_id])
+        for post_id in self.post_ids:
+            yield page_cache.post_scope(post_id)
+
+    def invalidate(self, followers):
+        """Сбрасывает кэш, как сигналы при сохранении по одной строке;
+        followers - пользователи, ленты которых пересобраны"""
+        for scopes in chunked(self.page_scopes(), self.batch_size):
+            core_page_cache.bump(*scopes)
+        count_scopes = [(counts.FOLLOW, user_id) for user_id in followers]
+        if self.authors:
+            count_scopes.append((counts.GLOBAL, None))
+        count_scopes += [(counts.AUTHOR, author_id)
+                         for author_id in self.authors]
+        count_scopes += [(counts.GROUP, group_id)
+                         for group_id in self.group_ids]
+        for scopes in chunked(count_scopes, self.batch_size):
+            counts.invalidate(*scopes)
+        for author_id in self.authors:
+            feeds.invalidate_author(author_id)
+        for user_id in self.followers:
+            follow_graph.invalidate(user_id)
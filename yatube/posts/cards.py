@@ -0,0 +1,45 @@
+"""Кэш фрагментов карточек постов (posts/includes/post_card.html).
+
+Ключ фрагмента включает все, что карточка выводит: кроме полей поста
+это имя и username автора и настройки миниатюр, от которых зависят
+адреса и размеры в srcset. Переименованный автор или новые размеры
+миниатюр дают новый ключ, а устаревшие фрагменты истекают через
+POST_CARD_CACHE_TIMEOUT.
+"""
+from django.core.cache import InvalidCacheBackendError, caches
+from django.core.cache.utils import make_template_fragment_key
+
+from . import thumbnails
+
+FRAGMENT_NAME = 'post_card'
+
+
+def key(post):
+    """Версия карточки поста"""
+    author = post.author
+    return '|'.join(map(str, [
+        post.pk, post.updated_at, post.comments_count,
+        author.username, author.get_full_name(),
+        thumbnails.config_digest(),
+    ]))
+
+
+def fragment_key(post):
+    """Ключ кэша, под которым тег {% cache %} хранит карточку"""
+    return make_template_fragment_key(FRAGMENT_NAME, [key(post)])
+
+
+def get_cache():
+    """Кэш фрагментов, как у тега {% cache %} (core/templatetags)"""
+    try:
+        return caches['template_fragments']
+    except InvalidCacheBackendError:
+        return caches['default']
+
+
+def uncached(posts):
+    """Посты, карточек которых нет в кэше: только им при рендеринге
+    понадобятся миниатюры"""
+    keys = {fragment_key(post): post for post in posts}
+    cached = get_cache().get_many(list(keys))
+    return [post for key, post in keys.items() if key not in cached]
@@ -0,0 +1,107 @@
+"""Валидаторы условных GET-запросов страниц posts
+(см. core/conditional.py).
+
+Ленты: дата последнего поста и число постов области (один запрос
+по индексу ленты) и версии областей кэша страниц; комментарий меняет
+версии областей своего поста, потому что на карточке выводится число
+комментариев. Страница поста: время изменения поста, время
+последнего комментария и число комментариев. Лента подписок: версия
+набора подписок и последняя запись материализованной ленты. Профиль
+авторизованного пользователя зависит и от версии его подписок: на нем
+кнопка подписки на автора.
+
+Last-Modified не отдается: ни дата последнего поста, ни время
+последнего комментария не меняются при правке и удалении, и клиент,
+присылающий только If-Modified-Since, получал бы устаревшую страницу.
+Страницы сравниваются только по ETag.
+
+Состояние запоминается в кэше под ключом из версий областей кэша
+страниц (core/page_cache.py): сигналы меняют версии при любом
+изменении постов, комментариев и подписок, поэтому повторная проверка
+неизменной страницы обходится без запросов к БД.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+from core import page_cache as core_page_cache
+
+from . import follow_graph, page_cache
+from .models import Post
+
+
+def cached_state(versions, compute):
+    """Состояние compute(), привязанное к версиям областей"""
+    key = 'page_state:' + hashlib.md5(
+        '|'.join(map(str, versions)).encode()
+    ).hexdigest()
+    state = cache.get(key)
+    if state is None:
+        state = compute()
+        if state is not None:
+            cache.set(key, state, settings.PAGE_CACHE_TIMEOUT)
+    return state
+
+
+def feed_state(queryset):
+    """(дата последней записи, число записей)"""
+    state = queryset.aggregate(latest=Max('pub_date'), total=Count('pk'))
+    return state['latest'], state['total']
+
+
+def feed_validators(posts, scopes):
+    versions = core_page_cache.get_versions(scopes)
+    latest, total = cached_state([*scopes, *versions],
+                                 lambda: feed_state(posts))
+    return [latest, total, *versions], None
+
+
+def index_validators(request):
+    return feed_validators(Post.objects.all(),
+                           page_cache.index_scopes(request))
+
+
+def group_validators(request, slug):
+    return feed_validators(Post.objects.filter(group__slug=slug),
+                           page_cache.group_scopes(request, slug))
+
+
+def profile_validators(request, username):
+    parts, modified = feed_validators(
+        Post.objects.filter(author__username=username),
+        page_cache.profile_scopes(request, username)
+    )
+    if request.user.is_authenticated:
+        parts.append(follow_graph.version(request.user.pk))
+    return parts, modified
+
+
+def post_validators(request, post_id):
+    scopes = page_cache.post_scopes(request, post_id)
+    versions = core_page_cache.get_versions(scopes)
+    state = cached_state(
+        [*scopes, *versions],
+        lambda: Post.objects.filter(pk=post_id).order_by().annotate(
+            latest_comment=Max('comments__created')
+        ).values_list('updated_at', 'latest_comment',
+                      'comments_count').first()
+    )
+    if state is None:
+        # страницу 404 отдает view
+        return None
+    return [*state, *versions], None
+
+
+def follow_validators(request):
+    user_id = request.user.pk
+    # global меняется при публикации, правке и удалении любого поста,
+    # в том числе постов авторов подписок
+    versions = [follow_graph.version(user_id),
+                *core_page_cache.get_versions(['global'])]
+    latest, total = cached_state(
+        [f'follow:{user_id}', *versions],
+        lambda: feed_state(request.user.timeline.all())
+    )
+    return [latest, total, *versions], None
@@ -0,0 +1,67 @@
+"""Кэшируемые счетчики постов для пагинаторов лент.
+
+Каждая лента считает посты в своей области (scope): все посты,
+посты группы, посты автора или посты авторов, на которых подписан
+пользователь. Значения хранятся в кэше и сбрасываются сигналами
+при сохранении/удалении постов и подписок (см. posts/signals.py).
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+GLOBAL = 'global'
+GROUP = 'group'
+AUTHOR = 'author'
+FOLLOW = 'follow'
+
+KEY_PREFIX = 'posts_count'
+
+
+def scope_key(scope, pk=None):
+    if scope == GLOBAL:
+        return f'{KEY_PREFIX}:{scope}'
+    return f'{KEY_PREFIX}:{scope}:{pk}'
+
+
+def estimate_count(model):
+    """Оценка числа строк таблицы без полного COUNT(*).
+
+    PostgreSQL хранит оценку в pg_class, для остальных СУБД
+    используется максимальный первичный ключ.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+                [model._meta.db_table]
+            )
+            row = cursor.fetchone()
+        return max(int(row[0]), 0) if row else 0
+    last = model.objects.order_by('-pk').values_list('pk', flat=True)
+    return last.first() or 0
+
+
+def get_count(queryset, scope, pk=None):
+    """Число постов области scope; COUNT(*) выполняется только
+    при промахе кэша.
+
+    В режиме FEED_COUNT_MODE = 'estimated' общий счетчик больших
+    таблиц берется из оценки СУБД.
+    """
+    key = scope_key(scope, pk)
+    count = cache.get(key)
+    if count is not None:
+        return count
+    if scope == GLOBAL and settings.FEED_COUNT_MODE == 'estimated':
+        count = estimate_count(queryset.model)
+        if count < settings.FEED_COUNT_ESTIMATE_THRESHOLD:
+            count = None
+    if count is None:
+        count = queryset.count()
+    cache.set(key, count, settings.FEED_COUNT_CACHE_TIMEOUT)
+    return count
+
+
+def invalidate(*scopes):
+    """Сбрасывает счетчики; scopes - пары (scope, pk)"""
+    cache.delete_many([scope_key(scope, pk) for scope, pk in scopes])
@@ -0,0 +1,138 @@
+"""Потоковая выгрузка постов, комментариев и подписок.
+
+Строки читаются через values_list().iterator(chunk_size), поэтому
+в памяти одновременно только одна пачка, и сразу кодируются в NDJSON
+(объект JSON на строку) или CSV. Выходные строки собираются в блоки
+по BLOCK_SIZE байт и при необходимости сжимаются gzip на лету.
+
+Инкрементальная выгрузка (since) берет посты по pub_date
+и комментарии по created; у подписок даты нет, они выгружаются
+целиком.
+"""
+import csv
+import datetime
+import zlib
+from collections import namedtuple
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from core.api import dumps
+
+from .models import Comment, Follow, Post
+
+Dataset = namedtuple('Dataset', 'model date_field fields')
+
+# поле выгрузки -> поле values_list()
+DATASETS = {
+    'posts': Dataset(Post, 'pub_date', {
+        'id': 'id',
+        'author': 'author__username',
+        'group': 'group__slug',
+        'text': 'text',
+        'pub_date': 'pub_date',
+        'updated_at': 'updated_at',
+        'image': 'image',
+        'comments_count': 'comments_count',
+    }),
+    'comments': Dataset(Comment, 'created', {
+        'id': 'id',
+        'post': 'post_id',
+        'author': 'author__username',
+        'text': 'text',
+        'created': 'created',
+    }),
+    'follows': Dataset(Follow, None, {
+        'id': 'id',
+        'user': 'user__username',
+        'author': 'author__username',
+    }),
+}
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+BLOCK_SIZE = 64 * 1024
+CHUNK_SIZE = 2000
+
+
+def parse_since(value):
+    """Момент времени из ISO-даты или даты со временем"""
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'Некорректная дата: {value}')
+        moment = datetime.datetime.combine(day, datetime.time())
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def rows(dataset, since=None, chunk_size=CHUNK_SIZE):
+    queryset = dataset.model.objects.order_by('pk')
+    if since is not None and dataset.date_field:
+        queryset = queryset.filter(**{f'{dataset.date_field}__gte': since})
+    return queryset.values_list(*dataset.fields.values()).iterator(
+        chunk_size=chunk_size
+    )
+
+
+def ndjson_lines(names, rows):
+    for row in rows:
+        yield dumps(dict(zip(names, row))) + b'\n'
+
+
+class Echo:
+    """Файл для csv.writer, который возвращает строку вместо записи"""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(names, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(names).encode()
+    for row in rows:
+        yield writer.writerow([
+            value.isoformat() if isinstance(value, datetime.datetime)
+            else value for value in row
+        ]).encode()
+
+
+def blocks(lines, size=BLOCK_SIZE):
+    """Склеивает строки в блоки не меньше size байт"""
+    block, length = [], 0
+    for line in lines:
+        block.append(line)
+        length += len(line)
+        if length >= size:
+            yield b''.join(block)
+            block, length = [], 0
+    if block:
+        yield b''.join(block)
+
+
+def gzip_blocks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export(name, export_format='ndjson', since=None, compress=False,
+           chunk_size=CHUNK_SIZE):
+    """Итератор блоков байт выгрузки набора name"""
+    dataset = DATASETS[name]
+    names = list(dataset.fields)
+    encode = ndjson_lines if export_format == 'ndjson' else csv_lines
+    chunks = blocks(encode(names, rows(dataset, since, chunk_size)))
+    return gzip_blocks(chunks) if compress else chunks
+
+
+def filename(name, export_format, compress=False):
+    return f'{name}.{export_format}' + ('.gz' if compress else '')
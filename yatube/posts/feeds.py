@@ -0,0 +1,148 @@
+"""Лента подписок пользователя.
+
+Способ сборки ленты задается settings.FOLLOW_FEED_ENGINE:
+'query' - выборка постов по списку авторов подписок,
+'timeline' - чтение материализованной ленты (posts/timelines.py),
+'merge' - k-way слияние кэшируемых списков последних постов авторов.
+"""
+import heapq
+from itertools import dropwhile, islice, takewhile
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import counts, follow_graph
+from .models import Post
+from .paginators import NEXT, paginate
+
+
+def author_recent_key(author_id):
+    return f'author_recent:{author_id}'
+
+
+def invalidate_author(author_id):
+    cache.delete(author_recent_key(author_id))
+
+
+RECENT_SQL = """
+    SELECT id, author_id, pub_date FROM (
+        SELECT id, author_id, pub_date, ROW_NUMBER() OVER (
+            PARTITION BY author_id ORDER BY pub_date DESC, id DESC
+        ) AS position
+        FROM {table} WHERE author_id IN ({authors})
+    ) recent WHERE position <= %s
+"""
+
+
+def load_recent(author_ids):
+    """Последние посты авторов одним запросом (оконная функция)"""
+    recent = {author_id: [] for author_id in author_ids}
+    if not author_ids:
+        return recent
+    sql = RECENT_SQL.format(table=Post._meta.db_table,
+                            authors=', '.join(['%s'] * len(author_ids)))
+    posts = Post.objects.raw(
+        sql, [*author_ids, settings.AUTHOR_RECENT_LENGTH]
+    )
+    for post in posts:
+        recent[post.author_id].append((post.pub_date, post.pk))
+    for items in recent.values():
+        items.sort(reverse=True)
+    return recent
+
+
+def author_recent(author_ids):
+    """Списки (pub_date, id) последних постов авторов по убыванию.
+
+    Списки хранятся в кэше, длина каждого ограничена
+    settings.AUTHOR_RECENT_LENGTH; промахи кэша загружаются
+    одним запросом.
+    """
+    keys = [author_recent_key(author_id) for author_id in author_ids]
+    cached = cache.get_many(keys)
+    missing = [author_id for author_id, key in zip(author_ids, keys)
+               if key not in cached]
+    if missing:
+        loaded = {author_recent_key(author_id): recent
+                  for author_id, recent in load_recent(missing).items()}
+        cache.set_many(loaded, settings.AUTHOR_RECENT_TIMEOUT)
+        cached.update(loaded)
+    return [cached[key] for key in keys]
+
+
+class MergedFeed:
+    """Лента, собранная слиянием списков последних постов авторов.
+
+    Посты страницы загружаются одним запросом in_bulk. Глубина ленты
+    ограничена длиной списков авторов.
+    """
+
+    def __init__(self, author_ids):
+        self.lists = author_recent(list(author_ids))
+
+    def __len__(self):
+        return sum(len(recent) for recent in self.lists)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        merged = heapq.merge(*self.lists, reverse=True)
+        return self._load(islice(merged, index.start, index.stop))
+
+    def keyset(self, direction, key, limit):
+        """Посты после (NEXT) или до (PREVIOUS) ключа (pub_date, id)"""
+        if direction == NEXT:
+            lists = self.lists if key is None else [
+                dropwhile(lambda item: item >= key, recent)
+                for recent in self.lists
+            ]
+            merged = heapq.merge(*lists, reverse=True)
+        else:
+            lists = [
+                reversed(list(takewhile(lambda item: item > key, recent)))
+                for recent in self.lists
+            ]
+            merged = heapq.merge(*lists)
+        return self._load(islice(merged, limit))
+
+    @staticmethod
+    def _load(items):
+        ids = [pk for pub_date, pk in items]
+        posts = Post.objects.select_related('author', 'group').in_bulk(ids)
+        return [posts[pk] for pk in ids if pk in posts]
+
+
+def query_page(request):
+    posts = Post.objects.select_related('author', 'group').filter(
+        author_id__in=request.user.follower.values_list(
+            'author',
+            flat=True
+        )
+    )
+    return paginate(request, posts,
+                    count_scope=(counts.FOLLOW, request.user.pk))
+
+
+def timeline_page(request):
+    entries = request.user.timeline.select_related('post__author',
+                                                   'post__group')
+    return paginate(request, entries,
+                    count_scope=(counts.FOLLOW, request.user.pk),
+                    keys=('pub_date', 'post_id'), item_attr='post')
+
+
+def merge_page(request):
+    author_ids = follow_graph.for_request(request).followees(request.user)
+    return paginate(request, MergedFeed(author_ids))
+
+
+ENGINES = {
+    'query': query_page,
+    'timeline': timeline_page,
+    'merge': merge_page,
+}
+
+
+def follow_page(request):
+    """Страница ленты подписок для запроса"""
+    return ENGINES[settings.FOLLOW_FEED_ENGINE](request)
@@ -0,0 +1,82 @@
+"""Граф подписок пользователей.
+
+Список авторов, на которых подписан пользователь, хранится в кэше
+компактным отсортированным массивом id и дополнительно запоминается
+на время запроса (см. for_request). Кэш сбрасывается сигналами
+подписки/отписки.
+
+Версия набора подписок (version) меняется вместе со сбросом кэша
+и служит валидатором ленты подписок (posts/conditional.py).
+"""
+import uuid
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Follow
+
+
+def followees_key(user_id):
+    return f'follow_graph:{user_id}'
+
+
+def version_key(user_id):
+    return f'follow_graph_version:{user_id}'
+
+
+def invalidate(user_id):
+    cache.delete_many([followees_key(user_id), version_key(user_id)])
+
+
+def version(user_id):
+    """Версия набора подписок пользователя; отсутствующая создается"""
+    key = version_key(user_id)
+    value = cache.get(key)
+    if value is None:
+        value = uuid.uuid4().hex
+        cache.set(key, value, None)
+    return value
+
+
+def _contains(ids, author_id):
+    position = bisect_left(ids, author_id)
+    return position < len(ids) and ids[position] == author_id
+
+
+class FollowGraph:
+    """Подписки пользователей с мемоизацией в пределах объекта"""
+
+    def __init__(self):
+        self._followees = {}
+
+    def followees(self, user):
+        """Отсортированный массив id авторов, на которых подписан user"""
+        if user is None or not user.is_authenticated:
+            return array('q')
+        if user.pk not in self._followees:
+            key = followees_key(user.pk)
+            ids = cache.get(key)
+            if ids is None:
+                ids = array('q', Follow.objects.filter(
+                    user_id=user.pk
+                ).order_by('author_id').values_list('author_id', flat=True))
+                cache.set(key, ids, settings.FOLLOW_GRAPH_TIMEOUT)
+            self._followees[user.pk] = ids
+        return self._followees[user.pk]
+
+    def is_following(self, user, author):
+        return _contains(self.followees(user), author.pk)
+
+    def is_following_many(self, user, authors):
+        """Словарь {id автора: подписан ли user} для списка авторов"""
+        ids = self.followees(user)
+        return {author.pk: _contains(ids, author.pk) for author in authors}
+
+
+def for_request(request):
+    """Граф подписок, общий для всех вызовов в пределах запроса"""
+    if not hasattr(request, '_follow_graph'):
+        request._follow_graph = FollowGraph()
+    return request._follow_graph
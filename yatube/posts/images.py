@@ -0,0 +1,296 @@
+"""Обработка загруженных изображений постов.
+
+После сохранения поста его изображение обрабатывается в пуле потоков
+(если он включен, см. submit), а не в потоке запроса:
+
+* ingest уменьшает исходник до POST_IMAGE_MAX_SIZE по большей стороне,
+  поворачивает по EXIF, перекодирует в POST_IMAGE_FORMAT (WEBP или
+  прогрессивный JPEG) с качеством POST_IMAGE_QUALITY и не переносит
+  метаданные; оригинал и его миниатюры удаляются;
+* затем создаются миниатюры (posts/thumbnails.py).
+
+Хранилище изображений адресует файлы по содержимому (core/storage.py),
+поэтому один файл может принадлежать нескольким постам: файлы удаляются
+только через discard, который проверяет ссылки.
+
+Анимированные изображения не перекодируются.
+
+Поток запроса не ждет обработки. Дождаться всех задач процесса можно
+через wait_pending: так делают тесты и команды, которые загружают
+изображения и затем удаляют созданные записи (load_test).
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from PIL import Image, ImageOps, features
+from sorl.thumbnail import delete
+
+from . import thumbnails
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp'}
+
+EXIF_ORIENTATION = 0x0112
+# значения ориентации с поворотом на 90 или 270 градусов
+ROTATED = (5, 6, 7, 8)
+
+# поля поста с метаданными изображения
+METADATA_FIELDS = ['image_width', 'image_height', 'image_hash']
+
+_executor = None
+
+# незавершенные задачи пула и файлы, миниатюры которых создаются
+_pending = set()
+_deferred = set()
+_pending_lock = threading.Lock()
+
+
+def read_metadata(image_file):
+    """(ширина, высота, SHA-256) файла изображения.
+
+    Файл читается кусками, Pillow разбирает только заголовок.
+    """
+    digest = hashlib.sha256()
+    image_file.seek(0)
+    for chunk in image_file.chunks():
+        digest.update(chunk)
+    image_file.seek(0)
+    with Image.open(image_file) as image:
+        width, height = image.size
+        if image.getexif().get(EXIF_ORIENTATION) in ROTATED:
+            # изображение показывается повернутым на 90 градусов
+            width, height = height, width
+    image_file.seek(0)
+    return width, height, digest.hexdigest()
+
+
+def set_metadata(post, image_file=None):
+    """Заполняет метаданные изображения поста"""
+    if image_file:
+        (post.image_width, post.image_height,
+         post.image_hash) = read_metadata(image_file)
+    else:
+        post.image_width = post.image_height = None
+        post.image_hash = ''
+
+
+def get_format():
+    """Формат хранения; без поддержки WebP в Pillow - JPEG"""
+    if settings.POST_IMAGE_FORMAT == 'WEBP' and features.check('webp'):
+        return 'WEBP'
+    return 'JPEG'
+
+
+def encode(image, image_format):
+    """Кодирует изображение без метаданных"""
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        # прозрачность JPEG не поддерживает: фон делаем белым
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    elif image_format == 'WEBP' and image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    buffer = BytesIO()
+    options = {'quality': settings.POST_IMAGE_QUALITY, 'optimize': True}
+    if image_format == 'JPEG':
+        options['progressive'] = True
+    image.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+def reencode(content):
+    """Перекодированные байты изображения или None, если оставить
+    исходник выгоднее"""
+    with Image.open(content) as image:
+        if getattr(image, 'is_animated', False):
+            return None
+        image_format = get_format()
+        has_metadata = bool(image.info.get('exif') or image.getexif())
+        original = ImageOps.exif_transpose(image)
+        resized = max(original.size) > settings.POST_IMAGE_MAX_SIZE
+        if resized:
+            original.thumbnail((settings.POST_IMAGE_MAX_SIZE,) * 2,
+                               Image.LANCZOS)
+        same_format = image.format == image_format
+        data = encode(original, image_format)
+    if (same_format and not resized and not has_metadata
+            and len(data) >= content.size):
+        return None
+    return data
+
+
+def modified(name):
+    """Время изменения файла хранилища; None, если файла нет"""
+    try:
+        return os.path.getmtime(default_storage.path(name))
+    except FileNotFoundError:
+        return None
+
+
+def discard(name, since=None):
+    """Удаляет файл и его миниатюры, если на него не ссылается
+    ни один пост.
+
+    Хранилище выдает один файл разным загрузкам, а пост ссылается
+    на файл только после сохранения. Поэтому файл, измененный позже
+    since (по умолчанию - POST_IMAGE_DISCARD_GRACE секунд назад),
+    не удаляется: его могла только что получить другая загрузка.
+    """
+    if since is None:
+        since = time.time() - settings.POST_IMAGE_DISCARD_GRACE
+    mtime = modified(name)
+    if mtime is not None and mtime > since:
+        return False
+    if Post.objects.filter(image=name).exists():
+        return False
+    delete(name)
+    thumbnails.invalidate()
+    return True
+
+
+def ingest(post_id, name):
+    """Перекодирует изображение поста; возвращает имя итогового файла.
+
+    Оригинал и новый файл удаляются, только если с момента их загрузки
+    этой обработкой хранилище не выдало их другой загрузке."""
+    uploaded = modified(name)
+    with default_storage.open(name) as content:
+        data = reencode(content)
+    if data is None:
+        return name
+    stem = os.path.splitext(name)[0]
+    content = ContentFile(data)
+    new_name = default_storage.save(
+        f'{stem}.{EXTENSIONS[get_format()]}', content
+    )
+    saved = modified(new_name)
+    post = Post.objects.filter(pk=post_id, image=name).first()
+    if post is None:
+        # пост удален или изображение заменено, пока шла обработка
+        discard(new_name, since=saved)
+        return None
+    post.image = new_name
+    set_metadata(post, content)
+    post.save(update_fields=['image', *METADATA_FIELDS, 'updated_at'])
+    if new_name != name:
+        # вместе с оригиналом удаляются его миниатюры
+        discard(name, since=uploaded)
+    return new_name
+
+
+def process_upload(post_id, name):
+    """Задача пула: обработка изображения и создание миниатюр"""
+    try:
+        if settings.POST_IMAGE_INGEST:
+            name = ingest(post_id, name)
+        if name and settings.POST_THUMBNAIL_PREGENERATE:
+            thumbnails.generate(name)
+    except Exception:
+        logger.exception('Не удалось обработать изображение %s', name)
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.POST_IMAGE_WORKERS,
+            thread_name_prefix='post-images'
+        )
+    return _executor
+
+
+def schedule(post):
+    """Ставит обработку изображения поста в очередь пула после
+    фиксации транзакции"""
+    if not post.image:
+        return
+    post_id, name = post.pk, post.image.name
+
+    transaction.on_commit(lambda: submit(process_upload, post_id, name))
+
+
+def _in_pool(function, *args):
+    try:
+        return function(*args)
+    finally:
+        # у потока пула собственные соединения с БД
+        connections.close_all()
+
+
+def submit(function, *args):
+    """Ставит задачу в пул и запоминает ее для wait_pending.
+
+    При POST_IMAGE_WORKERS = 0 (по умолчанию, пул включает
+    YATUBE_IMAGE_WORKERS) задача выполняется сразу в вызывающем потоке:
+    SQLite в памяти тестов не ждет снятия блокировок, взятых
+    параллельным пулом."""
+    if not settings.POST_IMAGE_WORKERS:
+        future = Future()
+        try:
+            future.set_result(function(*args))
+        except Exception as error:
+            future.set_exception(error)
+        return future
+    future = get_executor().submit(_in_pool, function, *args)
+    with _pending_lock:
+        _pending.add(future)
+    future.add_done_callback(_finished)
+    return future
+
+
+def _finished(future):
+    with _pending_lock:
+        _pending.discard(future)
+
+
+def generate_thumbnails(name):
+    """Задача пула: создание всех вариантов миниатюры.
+
+    Страницы и карточки постов с этим изображением уже собраны без части
+    вариантов, поэтому посты пересохраняются: новое updated_at меняет
+    ключ карточки, а сигналы сбрасывают страницы."""
+    try:
+        if thumbnails.generate(name):
+            for post in Post.objects.filter(image=name).select_related(
+                'group'
+            ):
+                post.save(update_fields=['updated_at'])
+    finally:
+        with _pending_lock:
+            _deferred.discard(name)
+
+
+def defer_thumbnails(name):
+    """Ставит создание вариантов миниатюры в очередь пула после
+    фиксации транзакции, если оно еще не поставлено"""
+
+    def defer():
+        with _pending_lock:
+            if name in _deferred:
+                return
+            _deferred.add(name)
+        submit(generate_thumbnails, name)
+
+    transaction.on_commit(defer)
+
+
+def wait_pending(timeout=None):
+    """Дожидается всех задач пула, поставленных в очередь процессом;
+    по умолчанию не дольше POST_IMAGE_WAIT_TIMEOUT секунд"""
+    with _pending_lock:
+        futures = list(_pending)
+    if futures:
+        wait(futures, timeout=(settings.POST_IMAGE_WAIT_TIMEOUT
+                               if timeout is None else timeout))
@@ -0,0 +1,360 @@
+"""Нагрузочное тестирование WSGI-приложения в одном процессе.
+
+yatube.wsgi.application запускается на локальном многопоточном
+WSGI-сервере Django (тот же, что у runserver), а concurrency потоков
+клиентов шлют ему запросы по HTTP через requests. Каждый запрос - один
+из сценариев SCENARIOS, выбранный случайно с весами из смеси трафика:
+чтение лент анонимом, лента подписок, комментарии и загрузка
+изображений авторизованными пользователями.
+
+Пользователи, посты и группы берутся из базы (например, созданные
+seed_benchmark_data). Авторизованные клиенты получают сессию напрямую,
+без проверки пароля. Записи, созданные при прогоне, помечены тегом
+прогона и удаляются по его окончании. После прогона проверяется, что
+счетчики затронутых постов и пользователей сходятся с данными
+(counter_drift в результатах).
+
+Чтобы сравнить базы данных или бэкенды кэша, тот же прогон запускается
+с другим модулем настроек (--settings) и результаты сравниваются.
+"""
+import random
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict, namedtuple
+from contextlib import contextmanager
+from importlib import import_module
+from io import BytesIO
+
+import requests
+from django.conf import settings
+from django.contrib.auth import (BACKEND_SESSION_KEY, HASH_SESSION_KEY,
+                                 SESSION_KEY, get_user_model)
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+from PIL import Image
+
+from . import stats
+from .benchmarks import percentile
+from .models import Comment, Group, Post
+
+User = get_user_model()
+
+DEFAULT_MIX = {
+    'index': 35,
+    'group': 10,
+    'profile': 10,
+    'post': 15,
+    'follow': 20,
+    'comment': 8,
+    'upload': 2,
+}
+# сколько последних постов, групп и авторов участвует в сценариях
+SAMPLE_SIZE = 1000
+TIMEOUT = 30
+
+Sample = namedtuple('Sample', 'post_ids group_ids slugs usernames')
+Record = namedtuple('Record', 'scenario latency error')
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    """Не пишет в журнал каждый запрос"""
+
+    def log_message(self, *args):
+        pass
+
+
+@contextmanager
+def serve(application):
+    """Запускает application в фоновом потоке; возвращает адрес"""
+    server = ThreadedWSGIServer(('127.0.0.1', 0), QuietRequestHandler)
+    server.set_app(application)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f'http://127.0.0.1:{server.server_port}'
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+def parse_mix(value):
+    """Смесь трафика из строки вида index=50,follow=20"""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f'Неизвестный сценарий: {name}')
+        mix[name] = float(weight)
+        if mix[name] < 0:
+            raise ValueError(f'Отрицательный вес: {part}')
+    if not any(mix.values()):
+        raise ValueError('Все веса нулевые')
+    return mix
+
+
+def login_session(user):
+    """Сессия авторизованного пользователя, как у Client.force_login"""
+    store = import_module(settings.SESSION_ENGINE).SessionStore()
+    store[SESSION_KEY] = user._meta.pk.value_to_string(user)
+    store[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    store[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    store.save()
+    return store
+
+
+def load_sample(size=SAMPLE_SIZE):
+    groups = list(Group.objects.values_list('pk', 'slug')[:size])
+    sample = Sample(
+        post_ids=list(Post.objects.order_by('-pk').values_list(
+            'pk', flat=True
+        )[:size]),
+        group_ids=[pk for pk, _ in groups],
+        slugs=[slug for _, slug in groups],
+        usernames=list(User.objects.filter(
+            posts__isnull=False
+        ).distinct().order_by('pk').values_list('username', flat=True)[
+            :size
+        ]),
+    )
+    if not sample.post_ids or not groups:
+        raise ValueError('В базе нет постов или групп, запустите '
+                         'seed_benchmark_data')
+    return sample
+
+
+def readers(count):
+    """Пользователи для авторизованных сценариев: сначала те,
+    у кого больше всего подписок"""
+    users = list(User.objects.order_by('-stats__following_count', 'pk')[
+        :count
+    ])
+    if not users:
+        raise ValueError('В базе нет пользователей')
+    return users
+
+
+def jpeg(size=(800, 600)):
+    """Небольшое JPEG-изображение для загрузки"""
+    image = Image.linear_gradient('L').resize(size).convert('RGB')
+    content = BytesIO()
+    image.save(content, 'JPEG', quality=85)
+    return content.getvalue()
+
+
+class VirtualUser:
+    """Клиент одного потока: анонимная и авторизованная сессии"""
+
+    def __init__(self, base_url, user, sample, tag, image, seed):
+        self.base_url = base_url
+        self.sample = sample
+        self.tag = tag
+        self.image = image
+        self.rng = random.Random(seed)
+        self.anonymous = requests.Session()
+        self.session = login_session(user)
+        self.user = requests.Session()
+        self.user.cookies.set(settings.SESSION_COOKIE_NAME,
+                              self.session.session_key)
+        # неподписанный секрет CSRF принимается и в cookie, и в форме
+        self.csrf_token = get_random_string(32)
+        self.user.cookies.set(settings.CSRF_COOKIE_NAME, self.csrf_token)
+
+    def url(self, name, **kwargs):
+        return self.base_url + reverse(f'posts:{name}', kwargs=kwargs)
+
+    def post_id(self):
+        return self.rng.choice(self.sample.post_ids)
+
+    def close(self):
+        self.anonymous.close()
+        self.user.close()
+        self.session.delete()
+
+
+def index(client):
+    return client.anonymous.get(client.url('index'), timeout=TIMEOUT), 200
+
+
+def group(client):
+    slug = client.rng.choice(client.sample.slugs)
+    return client.anonymous.get(client.url('group_list', slug=slug),
+                                timeout=TIMEOUT), 200
+
+
+def profile(client):
+    username = client.rng.choice(client.sample.usernames)
+    return client.anonymous.get(client.url('profile', username=username),
+                                timeout=TIMEOUT), 200
+
+
+def post(client):
+    return client.anonymous.get(
+        client.url('post_detail', post_id=client.post_id()),
+        timeout=TIMEOUT
+    ), 200
+
+
+def follow(client):
+    return client.user.get(client.url('follow_index'), timeout=TIMEOUT), 200
+
+
+def comment(client):
+    return client.user.post(
+        client.url('add_comment', post_id=client.post_id()),
+        {'text': f'{client.tag} комментарий',
+         'csrfmiddlewaretoken': client.csrf_token},
+        allow_redirects=False, timeout=TIMEOUT
+    ), 302
+
+
+def upload(client):
+    return client.user.post(
+        client.url('post_create'),
+        {'text': f'{client.tag} пост',
+         'group': client.rng.choice(client.sample.group_ids),
+         'csrfmiddlewaretoken': client.csrf_token},
+        files={'image': ('load.jpg', client.image, 'image/jpeg')},
+        allow_redirects=False, timeout=TIMEOUT
+    ), 302
+
+
+SCENARIOS = {
+    'index': index,
+    'group': group,
+    'profile': profile,
+    'post': post,
+    'follow': follow,
+    'comment': comment,
+    'upload': upload,
+}
+
+
+class LoadTest:
+    """Прогон смеси mix в concurrency потоков в течение duration секунд
+    или до total запросов"""
+
+    def __init__(self, concurrency=8, mix=None, duration=30, total=None,
+                 seed=0):
+        self.concurrency = concurrency
+        self.mix = mix or DEFAULT_MIX
+        self.duration = duration
+        self.total = total
+        self.seed = seed
+        # по тегу находятся записи, созданные прогоном
+        self.tag = f'load-{uuid.uuid4().hex[:12]}'
+        self.records = []
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.deadline = None
+        self.elapsed = 0
+        self.drift = 0
+
+    def take(self):
+        """Можно ли отправить еще один запрос"""
+        if time.monotonic() >= self.deadline:
+            return False
+        with self.lock:
+            if self.total is not None and self.sent >= self.total:
+                return False
+            self.sent += 1
+            return True
+
+    def work(self, client):
+        names = list(self.mix)
+        weights = list(self.mix.values())
+        records = []
+        while self.take():
+            name = client.rng.choices(names, weights)[0]
+            start = time.perf_counter()
+            try:
+                response, expected = SCENARIOS[name](client)
+                error = (None if response.status_code == expected
+                         else f'HTTP {response.status_code}')
+            except requests.RequestException as exception:
+                error = type(exception).__name__
+            records.append(Record(name, time.perf_counter() - start,
+                                  error))
+        with self.lock:
+            self.records.extend(records)
+
+    def run(self, application):
+        sample = load_sample()
+        users = readers(self.concurrency)
+        image = jpeg()
+        # иначе debug_toolbar встраивается в каждую страницу
+        # запросов с 127.0.0.1
+        with override_settings(INTERNAL_IPS=[]):
+            with serve(application) as base_url:
+                clients = [
+                    VirtualUser(base_url, users[index % len(users)], sample,
+                                self.tag, image, self.seed + index)
+                    for index in range(self.concurrency)
+                ]
+                threads = [threading.Thread(target=self.work,
+                                            args=(client,))
+                           for client in clients]
+                started = time.monotonic()
+                self.deadline = started + self.duration
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                self.elapsed = time.monotonic() - started
+                for client in clients:
+                    client.close()
+        self.drift = stats.drifted(
+            Comment.objects.filter(
+                text__startswith=self.tag
+            ).values('post_id'),
+            [user.pk for user in users]
+        )
+        return self.summary()
+
+    def cleanup(self):
+        """Удаляет комментарии и посты прогона; возвращает их число"""
+        comments, _ = Comment.objects.filter(
+            text__startswith=self.tag
+        ).delete()
+        posts, _ = Post.objects.filter(text__startswith=self.tag).delete()
+        return comments + posts
+
+    def summary(self):
+        """Пропускная способность, перцентили задержки в миллисекундах
+        и доля ошибок по сценариям и в целом"""
+        groups = defaultdict(list)
+        for record in self.records:
+            groups[record.scenario].append(record)
+        scenarios = {name: self.describe(records)
+                     for name, records in sorted(groups.items())}
+        return {
+            'database': settings.DATABASES['default']['ENGINE'],
+            'cache': settings.CACHES['default']['BACKEND'],
+            'concurrency': self.concurrency,
+            'mix': self.mix,
+            'elapsed': round(self.elapsed, 3),
+            'total': self.describe(self.records),
+            'scenarios': scenarios,
+            'counter_drift': self.drift,
+        }
+
+    def describe(self, records):
+        latencies = [record.latency * 1000 for record in records]
+        errors = Counter(record.error for record in records
+                         if record.error)
+        if not records:
+            return {'requests': 0}
+        return {
+            'requests': len(records),
+            'throughput': round(len(records) / self.elapsed, 2),
+            'p50': round(percentile(latencies, 50), 3),
+            'p90': round(percentile(latencies, 90), 3),
+            'p99': round(percentile(latencies, 99), 3),
+            'max': round(max(latencies), 3),
+            'error_rate': round(sum(errors.values()) / len(records), 4),
+            'errors': dict(errors),
+        }
@@ -0,0 +1,103 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from posts import benchmarks, feeds, timelines
+from posts.models import Follow, Post
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает движки ленты подписок на синтетическом графе '
+            'подписок. Данные создаются во временной транзакции '
+            'и откатываются после замеров, кэш - временный.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--authors', type=int, default=200,
+                            help='Число авторов')
+        parser.add_argument('--posts', type=int, default=50,
+                            help='Постов у каждого автора')
+        parser.add_argument('--followees', type=int, default=150,
+                            help='На скольких авторов подписан читатель')
+        parser.add_argument('--pages', type=int, default=5,
+                            help='Сколько страниц ленты листать по курсору')
+        parser.add_argument('--repeat', type=int, default=10,
+                            help='Число повторов для каждого движка')
+        parser.add_argument('--engines', nargs='+',
+                            default=list(feeds.ENGINES),
+                            choices=list(feeds.ENGINES))
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        # кэш заполняется откатываемыми данными, а их id достанутся
+        # следующим настоящим пользователям и постам
+        with benchmarks.isolated_cache(), transaction.atomic():
+            reader = self.build_graph(rng, options)
+            try:
+                for engine in options['engines']:
+                    self.run_engine(engine, reader, options)
+            finally:
+                transaction.set_rollback(True)
+
+    def build_graph(self, rng, options):
+        prefix = f'feed_bench_{rng.randrange(10 ** 9)}'
+        reader = User.objects.create_user(username=f'{prefix}_reader')
+        User.objects.bulk_create(
+            User(username=f'{prefix}_{i}') for i in range(options['authors'])
+        )
+        authors = list(User.objects.filter(
+            username__startswith=f'{prefix}_'
+        ).exclude(pk=reader.pk).values_list('pk', flat=True))
+        posts = [Post(author_id=rng.choice(authors), text=f'Пост {i}')
+                 for i in range(options['authors'] * options['posts'])]
+        Post.objects.bulk_create(posts)
+        followees = rng.sample(authors, min(options['followees'],
+                                            len(authors)))
+        Follow.objects.bulk_create(
+            Follow(user=reader, author_id=author_id)
+            for author_id in followees
+        )
+        timelines.rebuild(reader.pk)
+        self.stdout.write(
+            f'Граф: авторов {len(authors)}, постов {len(posts)}, '
+            f'подписок читателя {len(followees)}'
+        )
+        return reader
+
+    def run_engine(self, engine, reader, options):
+        factory = RequestFactory()
+        url = reverse('posts:follow_index')
+        timings, queries = [], []
+        with override_settings(FOLLOW_FEED_ENGINE=engine):
+            for attempt in range(options['repeat'] + 1):
+                cursor = None
+                for page_index in range(options['pages']):
+                    request = factory.get(url, {'cursor': cursor} if cursor
+                                          else {})
+                    request.user = reader
+                    with CaptureQueriesContext(connection) as context:
+                        start = time.perf_counter()
+                        page = feeds.follow_page(request)
+                        list(page)
+                        elapsed = time.perf_counter() - start
+                    # первый проход прогревает кэш и не учитывается
+                    if attempt:
+                        timings.append(elapsed * 1000)
+                        queries.append(len(context.captured_queries))
+                    cursor = page.next_cursor
+                    if not cursor:
+                        break
+        self.stdout.write(
+            f'{engine:>10}: p50 {statistics.median(timings):.2f} ms, '
+            f'max {max(timings):.2f} ms, '
+            f'запросов на страницу {statistics.mean(queries):.1f}'
+        )
@@ -0,0 +1,136 @@
+import multiprocessing
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+from PIL import Image
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.parsers import parse_geometry
+
+ENGINES = {
+    'default': 'sorl.thumbnail.engines.pil_engine.Engine',
+    'reduce': 'posts.thumbnail_engine.Engine',
+}
+
+EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp')
+
+
+def get_options():
+    """Опции миниатюр постов, дополненные настройками sorl"""
+    options = dict(default.backend.default_options)
+    for key, attr in default.backend.extra_options:
+        options[key] = getattr(thumbnail_settings, attr)
+    options.update(settings.POST_THUMBNAIL_OPTIONS)
+    return options
+
+
+def run_engine(engine_path, paths, repeat):
+    """Создает все варианты миниатюр для каждого файла корпуса;
+    возвращает (время CPU в секундах, прирост пикового RSS в КБ,
+    число миниатюр)"""
+    engine = import_string(engine_path)()
+    options = get_options()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    created = 0
+    start = time.process_time()
+    for _ in range(repeat):
+        for path in paths:
+            for geometry in settings.POST_THUMBNAIL_SIZES:
+                with open(path, 'rb') as source:
+                    image = engine.get_image(source)
+                    box = parse_geometry(
+                        geometry, engine.get_image_ratio(image, options)
+                    )
+                    thumbnail = engine.create(image, box, options)
+                    engine._get_raw_data(
+                        thumbnail, options['format'], options['quality'],
+                        engine.get_image_info(image),
+                        options['progressive']
+                    )
+                    created += 1
+    elapsed = time.process_time() - start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return elapsed, rss_after - rss_before, created
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает время CPU и пиковую память движков миниатюр '
+            'на корпусе изображений. Каждый движок работает в отдельном '
+            'процессе, чтобы пиковая память не смешивалась.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus',
+                            help='Каталог с изображениями; по умолчанию '
+                                 'создаются синтетические снимки')
+        parser.add_argument('--sizes', nargs='+',
+                            default=['1600x1200', '3000x2000', '4000x3000'],
+                            help='Размеры синтетических снимков')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Число проходов по корпусу')
+        parser.add_argument('--engines', nargs='+', default=list(ENGINES),
+                            choices=list(ENGINES))
+
+    def handle(self, *args, **options):
+        directory = None
+        if options['corpus']:
+            paths = sorted(
+                os.path.join(options['corpus'], name)
+                for name in os.listdir(options['corpus'])
+                if name.lower().endswith(EXTENSIONS)
+            )
+        else:
+            directory = tempfile.mkdtemp()
+            paths = self.build_corpus(directory, options['sizes'])
+        if not paths:
+            raise CommandError('В корпусе нет изображений')
+        try:
+            self.stdout.write(f'Корпус: изображений {len(paths)}, '
+                              f'проходов {options["repeat"]}')
+            results = {engine: self.measure(ENGINES[engine], paths,
+                                            options['repeat'])
+                       for engine in options['engines']}
+        finally:
+            if directory:
+                shutil.rmtree(directory, ignore_errors=True)
+        for engine, (cpu, rss, created) in results.items():
+            self.stdout.write(
+                f'{engine:>8}: CPU {cpu * 1000:.0f} ms, '
+                f'{cpu * 1000 / created:.1f} ms на миниатюру, '
+                f'пиковая память +{rss / 1024:.1f} МБ'
+            )
+        if {'default', 'reduce'} <= results.keys():
+            speedup = results['default'][0] / results['reduce'][0]
+            self.stdout.write(self.style.SUCCESS(
+                f'Ускорение: {speedup:.2f}x'
+            ))
+
+    def build_corpus(self, directory, sizes):
+        """Синтетические снимки: шум поверх градиента, чтобы JPEG
+        декодировался так же тяжело, как фотография"""
+        paths = []
+        for size in sizes:
+            width, height = map(int, size.split('x'))
+            channels = [
+                Image.blend(
+                    Image.linear_gradient('L').resize((width, height)),
+                    Image.effect_noise((width, height), 40 + 20 * band),
+                    0.5
+                )
+                for band in range(3)
+            ]
+            path = os.path.join(directory, f'{size}.jpg')
+            Image.merge('RGB', channels).save(path, 'JPEG', quality=90)
+            paths.append(path)
+        return paths
+
+    def measure(self, engine_path, paths, repeat):
+        # отдельный процесс: ru_maxrss растет только вверх
+        context = multiprocessing.get_context('fork')
+        with context.Pool(1) as pool:
+            return pool.apply(run_engine, (engine_path, paths, repeat))
@@ -0,0 +1,82 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from posts import benchmarks, seed
+
+
+class Command(BaseCommand):
+    help = ('Замеряет p50/p99 и число запросов всех представлений '
+            'posts/urls.py и путей лент на синтетических данных '
+            'нескольких размеров и сравнивает с базовыми результатами. '
+            'Данные создаются во временной транзакции и откатываются, '
+            'кэш - временный.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int,
+                            default=[1000, 5000],
+                            help='Число постов в наборах данных; '
+                                 'пользователей в 10 раз меньше')
+        parser.add_argument('--existing', action='store_true',
+                            help='Замерять на данных, уже созданных '
+                                 'seed_benchmark_data')
+        parser.add_argument('--prefix', default=seed.PREFIX)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--baseline',
+                            default=benchmarks.DEFAULT_BASELINE,
+                            help='JSON базовых результатов')
+        parser.add_argument('--save-baseline', action='store_true',
+                            help='Записать результаты как базовые')
+        parser.add_argument('--threshold', type=float, default=0.25,
+                            help='Допустимый рост p50 (доля)')
+
+    def measure(self, size, options):
+        """Результаты замеров на наборе size постов"""
+        # кэш свой у каждого набора: id откатанных строк используются
+        # снова
+        with benchmarks.isolated_cache(), transaction.atomic():
+            try:
+                if size is not None:
+                    prefix = f'{options["prefix"]}{size}'
+                    seed.generate(max(size // 10, 10), size, comments=size,
+                                  seed=options['seed'], prefix=prefix)
+                else:
+                    prefix = options['prefix']
+                context = benchmarks.find_context(prefix)
+                return benchmarks.run(context, options['repeat'])
+            except benchmarks.BenchmarkError as error:
+                raise CommandError(error)
+            finally:
+                transaction.set_rollback(True)
+
+    def report(self, size, results, baseline):
+        self.stdout.write(f'Набор {size}:')
+        for name, result in results.items():
+            line = (f'{name:>20}: p50 {result["p50"]:8.2f} мс, '
+                    f'p99 {result["p99"]:8.2f} мс, '
+                    f'запросов {result["queries"]:g}')
+            base = baseline.get(name)
+            if base:
+                line += f' (база: p50 {base["p50"]:.2f} мс)'
+            self.stdout.write(line)
+
+    def handle(self, *args, **options):
+        baseline = benchmarks.load_baseline(options['baseline'])
+        sizes = [None] if options['existing'] else options['sizes']
+        current = {}
+        for size in sizes:
+            label = 'existing' if size is None else str(size)
+            current[label] = self.measure(size, options)
+            self.report(label, current[label], baseline.get(label, {}))
+        if options['save_baseline']:
+            benchmarks.save_baseline(options['baseline'],
+                                     {**baseline, **current})
+            self.stdout.write(self.style.SUCCESS(
+                f'Базовые результаты сохранены в {options["baseline"]}'
+            ))
+            return
+        found = benchmarks.regressions(current, baseline,
+                                       options['threshold'])
+        if found:
+            raise CommandError('Обнаружены регрессии:\n' + '\n'.join(found))
+        self.stdout.write(self.style.SUCCESS('Регрессий нет'))
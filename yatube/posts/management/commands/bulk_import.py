@@ -0,0 +1,66 @@
+import sys
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import bulk_import
+
+
+class Command(BaseCommand):
+    help = ('Загружает пользователей, посты, комментарии или подписки '
+            'из NDJSON или CSV пачками через bulk_create')
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=list(bulk_import.MODELS))
+        parser.add_argument('input', help='Файл импорта; - для stdin')
+        parser.add_argument('--format', choices=['ndjson', 'csv'],
+                            help='По умолчанию - по расширению файла')
+        parser.add_argument('--batch-size', type=int,
+                            default=bulk_import.BATCH_SIZE,
+                            help='Строк в пачке и транзакции')
+        parser.add_argument('--progress-interval', type=float,
+                            default=bulk_import.PROGRESS_INTERVAL,
+                            help='Секунд между сообщениями о ходе импорта')
+        parser.add_argument('--no-finish', action='store_true',
+                            help='Не пересчитывать счетчики, ленты '
+                                 'и кэш после загрузки; после этого '
+                                 'нужно запустить reconcile_counters '
+                                 'и rebuild_timelines')
+
+    def report(self, stats, rate):
+        self.stdout.write(
+            f'Загружено: {stats["created"]}, '
+            f'пропущено: {sum(stats.values()) - stats["created"]}, '
+            f'{rate:.0f} строк/с'
+        )
+
+    def handle(self, *args, **options):
+        path = options['input']
+        input_format = options['format'] or bulk_import.guess_format(path)
+        importer = bulk_import.Importer(
+            options['dataset'], options['batch_size'], self.report,
+            options['progress_interval']
+        )
+        try:
+            lines = (nullcontext(sys.stdin) if path == '-'
+                     else bulk_import.open_input(path))
+        except OSError as error:
+            raise CommandError(error)
+        with lines:
+            stats = importer.run(bulk_import.read_rows(lines, input_format))
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено: {stats["created"]}, пропущено дубликатов: '
+            f'{stats["duplicate"]}, с неизвестными ссылками: '
+            f'{stats["unknown"]}, испорченных: {stats["invalid"]}'
+        ))
+        if options['no_finish']:
+            self.stderr.write(self.style.WARNING(
+                'Счетчики, ленты подписок и кэш не обновлены: запустите '
+                'reconcile_counters и rebuild_timelines; страницы из кэша '
+                'могут устаревать до PAGE_CACHE_TIMEOUT секунд'
+            ))
+            return
+        rebuilt = importer.finish()
+        self.stdout.write(self.style.SUCCESS(
+            f'Счетчики пересчитаны, пересобрано лент: {rebuilt}'
+        ))
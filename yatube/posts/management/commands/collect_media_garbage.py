@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from posts.media_gc import Collector
+
+
+class Command(BaseCommand):
+    help = ('Удаляет изображения, на которые не ссылается ни один пост, '
+            'их миниатюры и устаревшие записи kvstore sorl')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Размер пачки файлов и записей kvstore')
+        parser.add_argument('--rate', type=float, default=50,
+                            help='Не больше стольких удалений в секунду '
+                                 '(0 - без ограничения)')
+        parser.add_argument('--min-age', type=int, default=3600,
+                            help='Не трогать файлы моложе стольких секунд')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только посчитать, что будет удалено')
+
+    def handle(self, *args, **options):
+        stats = Collector(
+            chunk_size=options['chunk_size'], rate=options['rate'],
+            min_age=options['min_age'], dry_run=options['dry_run']
+        ).collect()
+        verb = 'Будет удалено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} исходников: {stats["sources"]}, '
+            f'записей kvstore: {stats["kvstore"]}, '
+            f'миниатюр: {stats["thumbnails"]}, '
+            f'освобождено {stats["bytes"] / 2 ** 20:.1f} МБ'
+        ))
@@ -0,0 +1,45 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import export
+
+
+class Command(BaseCommand):
+    help = ('Выгружает посты, комментарии или подписки в NDJSON или CSV '
+            'потоком, не загружая таблицу в память')
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=list(export.DATASETS))
+        parser.add_argument('--format', default='ndjson',
+                            choices=list(export.FORMATS))
+        parser.add_argument('--since',
+                            help='Только записи начиная с даты (ISO 8601)')
+        parser.add_argument('--gzip', action='store_true',
+                            help='Сжимать выгрузку gzip')
+        parser.add_argument('--output', default='-',
+                            help='Файл выгрузки; по умолчанию stdout')
+        parser.add_argument('--chunk-size', type=int,
+                            default=export.CHUNK_SIZE,
+                            help='Строк в пачке чтения из БД')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = export.parse_since(options['since'])
+            except ValueError as error:
+                raise CommandError(error)
+        chunks = export.export(options['dataset'], options['format'], since,
+                               options['gzip'], options['chunk_size'])
+        if options['output'] != '-':
+            with open(options['output'], 'wb') as output:
+                for chunk in chunks:
+                    output.write(chunk)
+        elif options['gzip']:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk.decode(), ending='')
@@ -0,0 +1,86 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import images, load_test
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный прогон yatube.wsgi.application на локальном '
+            'многопоточном WSGI-сервере со смесью сценариев; для '
+            'сравнения баз данных и кэшей запускайте с --settings')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='Число одновременных клиентов')
+        parser.add_argument('--duration', type=float, default=30,
+                            help='Длительность прогона, секунд')
+        parser.add_argument('--requests', type=int,
+                            help='Остановиться после стольких запросов')
+        parser.add_argument(
+            '--mix',
+            help='Веса сценариев, например index=50,follow=20; '
+                 f'сценарии: {", ".join(load_test.SCENARIOS)}'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Сохранить результаты в JSON')
+        parser.add_argument('--compare',
+                            help='JSON прежнего прогона для сравнения')
+        parser.add_argument('--keep', action='store_true',
+                            help='Не удалять созданные комментарии и посты')
+
+    def line(self, name, result, previous=None):
+        if not result['requests']:
+            return f'{name:>8}: нет запросов'
+        text = (f'{name:>8}: {result["requests"]:6d} запр., '
+                f'{result["throughput"]:8.1f} запр./с, '
+                f'p50 {result["p50"]:7.1f}, p90 {result["p90"]:7.1f}, '
+                f'p99 {result["p99"]:7.1f} мс, '
+                f'ошибок {result["error_rate"]:.1%}')
+        if previous and previous.get('requests'):
+            text += (f' (было {previous["throughput"]:.1f} запр./с, '
+                     f'p99 {previous["p99"]:.1f} мс)')
+        return text
+
+    def handle(self, *args, **options):
+        try:
+            mix = options['mix'] and load_test.parse_mix(options['mix'])
+        except ValueError as error:
+            raise CommandError(error)
+        previous = {}
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as compare_file:
+                previous = json.load(compare_file)
+        # импорт создает приложение, как это делает WSGI-сервер
+        from yatube.wsgi import application
+        test = load_test.LoadTest(options['concurrency'], mix,
+                                  options['duration'], options['requests'],
+                                  options['seed'])
+        try:
+            summary = test.run(application)
+        except ValueError as error:
+            raise CommandError(error)
+        finally:
+            # загруженные изображения обрабатываются в пуле процесса
+            images.wait_pending()
+            if not options['keep']:
+                test.cleanup()
+        self.stdout.write(f'{summary["database"]}, {summary["cache"]}, '
+                          f'клиентов {summary["concurrency"]}, '
+                          f'{summary["elapsed"]:.1f} с')
+        for name, result in summary['scenarios'].items():
+            self.stdout.write(self.line(
+                name, result, previous.get('scenarios', {}).get(name)
+            ))
+        self.stdout.write(self.line('всего', summary['total'],
+                                    previous.get('total')))
+        for error, count in summary['total'].get('errors', {}).items():
+            self.stdout.write(self.style.WARNING(f'{error}: {count}'))
+        if summary['counter_drift']:
+            self.stdout.write(self.style.ERROR(
+                f'Счетчики разошлись с данными у {summary["counter_drift"]} '
+                f'постов и пользователей'
+            ))
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(summary, output, ensure_ascii=False, indent=2)
@@ -0,0 +1,106 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from core import page_cache as core_page_cache
+from core.storage import HASHED_NAME, is_hashed_name
+from posts import images, page_cache
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = ('Переносит изображения постов с прежними именами '
+            'в хранилище с адресацией по содержимому')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Размер пачки постов')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только посчитать файлы для переноса')
+
+    def batches(self, batch_size):
+        """Пачки постов с изображениями по возрастанию pk; в памяти
+        одновременно только одна пачка"""
+        queryset = Post.objects.exclude(image='').select_related(
+            'group'
+        ).only('pk', 'image', 'author_id', 'group__slug')
+        last_pk = 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk).order_by('pk')[
+                :batch_size
+            ])
+            if not batch:
+                return
+            yield batch
+            last_pk = batch[-1].pk
+
+    def move(self, posts, moved):
+        """Сохраняет файлы постов в новом хранилище; moved - уже
+        перенесенные файлы (старое имя -> новое)"""
+        changed = []
+        for post in posts:
+            name = post.image.name
+            if name not in moved:
+                with default_storage.open(name) as content:
+                    moved[name] = default_storage.save(name, content)
+            post.image = moved[name]
+            post.image_hash = HASHED_NAME.match(moved[name])['digest']
+            changed.append(post)
+        return changed
+
+    def migrate(self, posts):
+        """Переносит файлы пачки; возвращает (перенесено постов,
+        отсутствующих файлов, удалено старых файлов)"""
+        pending = [post for post in posts
+                   if not is_hashed_name(post.image.name)]
+        present = [post for post in pending
+                   if default_storage.exists(post.image.name)]
+        # старые файлы не выдаются хранилищем повторно: их время
+        # изменения запоминается до переноса
+        seen = {post.image.name: images.modified(post.image.name)
+                for post in present}
+        moved = {}
+        changed = self.move(present, moved)
+        now = timezone.now()
+        for post in changed:
+            # updated_at входит в ключ кэша карточки поста
+            post.updated_at = now
+        with transaction.atomic():
+            Post.objects.bulk_update(
+                changed, ['image', 'image_hash', 'updated_at']
+            )
+        # bulk_update не отправляет сигналы: страницы сбрасываются здесь
+        scopes = {'global'}
+        for post in changed:
+            scopes.update([page_cache.post_scope(post.pk),
+                           page_cache.author_scope(post.author_id)])
+            if post.group_id:
+                scopes.add(page_cache.group_scope(post.group.slug))
+        if changed:
+            core_page_cache.bump(*scopes)
+        removed = sum(images.discard(name, since=seen[name])
+                      for name in moved)
+        return len(changed), len(pending) - len(present), removed
+
+    def handle(self, *args, **options):
+        totals = [0, 0, 0]
+        for batch in self.batches(options['batch_size']):
+            if options['dry_run']:
+                totals[0] += sum(not is_hashed_name(post.image.name)
+                                 for post in batch)
+                continue
+            for index, value in enumerate(self.migrate(batch)):
+                totals[index] += value
+            self.stdout.write(f'Пачка до поста {batch[-1].pk}: '
+                              f'перенесено {totals[0]}')
+        moved, missing, removed = totals
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(
+                f'Постов для переноса: {moved}'
+            ))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Перенесено постов: {moved}, файлов не найдено: {missing}, '
+            f'удалено старых файлов: {removed}'
+        ))
@@ -0,0 +1,40 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import timelines
+from posts.models import TimelineEntry
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает материализованные ленты подписок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'usernames', nargs='*',
+            help='Пользователи, ленты которых нужно пересобрать '
+                 '(по умолчанию - все)'
+        )
+
+    def handle(self, *args, **options):
+        users = User.objects.all()
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+            if users.count() != len(set(options['usernames'])):
+                raise CommandError('Не все пользователи найдены')
+        else:
+            TimelineEntry.objects.filter(
+                user__follower__isnull=True
+            ).delete()
+            users = users.filter(follower__isnull=False).distinct()
+        user_ids = users.order_by('pk').values_list('pk', flat=True)
+        rebuilt = 0
+        for user_id in user_ids.iterator():
+            timelines.rebuild(user_id)
+            rebuilt += 1
+            if rebuilt % 1000 == 0:
+                self.stdout.write(f'Пересобрано лент: {rebuilt}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово, пересобрано лент: {rebuilt}'
+        ))
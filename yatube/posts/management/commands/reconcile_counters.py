@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from posts import stats
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает денормализованные счетчики постов, '
+            'комментариев и подписок и исправляет расхождения')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Размер пачки записей')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        users = stats.reconcile_users(batch_size)
+        posts = stats.reconcile_posts(batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено счетчиков пользователей: {users}, '
+            f'постов: {posts}'
+        ))
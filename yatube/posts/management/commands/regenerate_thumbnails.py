@@ -0,0 +1,41 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = ('Создает заново миниатюры всех изображений постов '
+            '(например, после изменения POST_THUMBNAIL_SIZES)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Число потоков')
+        parser.add_argument('--force', action='store_true',
+                            help='Удалить существующие миниатюры')
+
+    def generate(self, name, force):
+        try:
+            return thumbnails.generate(name, force)
+        finally:
+            # у потока пула собственные соединения с БД
+            connections.close_all()
+
+    def handle(self, *args, **options):
+        names = (Post.objects.exclude(image='')
+                 .values_list('image', flat=True).distinct().iterator())
+        # Pillow отпускает GIL при декодировании и масштабировании,
+        # поэтому потоки загружают все ядра
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            results = list(executor.map(
+                lambda name: self.generate(name, options['force']),
+                names
+            ))
+        failed = results.count(False)
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано изображений: {len(results) - failed}, '
+            f'ошибок: {failed}'
+        ))
@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import seed
+
+
+class Command(BaseCommand):
+    help = ('Создает детерминированный синтетический набор данных '
+            'для замеров: пользователей, группы, посты, комментарии '
+            'и граф подписок со степенным распределением популярности')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--groups', type=int, default=10)
+        parser.add_argument('--comments', type=int, default=10000)
+        parser.add_argument('--follows', type=int, default=20,
+                            help='Среднее число подписок пользователя')
+        parser.add_argument('--exponent', type=float, default=1.0,
+                            help='Показатель степенного закона '
+                                 'популярности')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default=seed.PREFIX,
+                            help='Префикс имен пользователей и slug групп')
+        parser.add_argument('--replace', action='store_true',
+                            help='Удалить данные, созданные ранее '
+                                 'с тем же префиксом')
+
+    def progress(self, stats, rate):
+        self.stdout.write(f'Загружено: {stats["created"]}, '
+                          f'{rate:.0f} строк/с')
+
+    def handle(self, *args, **options):
+        if seed.exists(options['prefix']):
+            if not options['replace']:
+                raise CommandError(
+                    f'Данные с префиксом {options["prefix"]} уже есть, '
+                    f'используйте --replace'
+                )
+            seed.delete(options['prefix'])
+        started = time.monotonic()
+        created = seed.generate(
+            options['users'], options['posts'], options['groups'],
+            options['comments'], options['follows'], options['seed'],
+            options['exponent'], options['prefix'], progress=self.progress
+        )
+        summary = ', '.join(f'{name} {count}'
+                            for name, count in created.items())
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано: {summary} за {time.monotonic() - started:.1f} с'
+        ))
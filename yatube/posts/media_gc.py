@@ -0,0 +1,205 @@
+"""Сборка мусора в медиафайлах постов и kvstore sorl.
+
+Файлы изображений остаются на диске после замены картинки в post_edit
+и после удаления поста (в том числе каскадного, вместе с автором),
+а записи kvstore - после удаления файлов. Collector проходит по
+хранилищу и kvstore пачками, сверяет каждую пачку с живыми значениями
+Post.image одним запросом по индексу и удаляет:
+
+* исходники из каталога загрузок, на которые не ссылается ни один пост,
+  вместе с их миниатюрами и записями kvstore;
+* записи kvstore исходников без постов, миниатюр без файлов и списки
+  миниатюр без исходника;
+* файлы миниатюр, о которых не знает kvstore (sorl создаст их заново,
+  если они понадобятся).
+
+Файлы моложе min_age не трогаются: загрузка сохраняет файл раньше,
+чем пост ссылается на него. Хранилище выдает один файл разным
+загрузкам (core/storage.py), поэтому перед удалением исходника время
+изменения и ссылки постов проверяются еще раз. Удаления ограничены
+по частоте (rate в секунду), чтобы сборку можно было запускать
+на работающем сервере.
+"""
+import os
+import time
+from collections import Counter
+
+from sorl.thumbnail import default, delete
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore
+
+from core.utils import chunked
+
+from . import thumbnails
+from .models import Post
+
+UPLOAD_DIR = Post._meta.get_field('image').upload_to
+
+
+def walk(storage, directory):
+    """(имя, размер, время изменения) файлов каталога хранилища;
+    каталоги читаются по одному"""
+    root = storage.path('')
+    for path, _, files in os.walk(storage.path(directory)):
+        for filename in files:
+            full_path = os.path.join(path, filename)
+            try:
+                stat = os.stat(full_path)
+            except FileNotFoundError:
+                continue
+            name = os.path.relpath(full_path, root).replace(os.sep, '/')
+            yield name, stat.st_size, stat.st_mtime
+
+
+def live_images(names):
+    """Имена из names, на которые ссылаются посты"""
+    return set(Post.objects.filter(image__in=names).values_list(
+        'image', flat=True
+    ))
+
+
+def existing_keys(keys):
+    return set(KVStore.objects.filter(key__in=keys).values_list(
+        'key', flat=True
+    ))
+
+
+def kvstore_chunks(identity, size):
+    """Пачки (ключ, значение) kvstore с префиксом identity
+    по возрастанию ключа"""
+    prefix = add_prefix('', identity)
+    queryset = KVStore.objects.filter(key__startswith=prefix).order_by('key')
+    last_key = ''
+    while True:
+        chunk = list(queryset.filter(key__gt=last_key).values_list(
+            'key', 'value'
+        )[:size])
+        if not chunk:
+            return
+        yield chunk
+        last_key = chunk[-1][0]
+
+
+class RateLimiter:
+    """Не больше rate вызовов wait() в секунду; 0 - без ограничения"""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_at = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if self.next_at > now:
+            time.sleep(self.next_at - now)
+        self.next_at = max(now, self.next_at) + self.interval
+
+
+class Collector:
+
+    def __init__(self, chunk_size=500, rate=0, min_age=3600,
+                 dry_run=False):
+        self.chunk_size = chunk_size
+        self.limiter = RateLimiter(rate)
+        self.min_age = min_age
+        self.dry_run = dry_run
+        self.storage = default.storage
+        self.stats = Counter()
+
+    def remove(self, kind, action, size=0):
+        """Удаляет объект (или только считает его в режиме dry_run)"""
+        if not self.dry_run:
+            self.limiter.wait()
+            action()
+        self.stats[kind] += 1
+        self.stats['bytes'] += size
+
+    def is_recent(self, mtime):
+        return time.time() - mtime < self.min_age
+
+    def is_orphaned(self, name):
+        """Повторная проверка исходника перед удалением: за время прохода
+        хранилище могло выдать тот же файл новой загрузке (как в
+        images.discard)"""
+        try:
+            mtime = os.path.getmtime(self.storage.path(name))
+        except FileNotFoundError:
+            return False
+        return (not self.is_recent(mtime)
+                and not Post.objects.filter(image=name).exists())
+
+    def collect(self):
+        self.collect_sources()
+        self.collect_kvstore()
+        self.collect_thumbnails()
+        if not self.dry_run and (self.stats['sources']
+                                 or self.stats['thumbnails']
+                                 or self.stats['kvstore']):
+            thumbnails.invalidate()
+        return self.stats
+
+    def collect_sources(self):
+        """Исходники без постов: файл, миниатюры и записи kvstore"""
+        for chunk in chunked(walk(self.storage, UPLOAD_DIR),
+                             self.chunk_size):
+            live = live_images([name for name, _, _ in chunk])
+            for name, size, mtime in chunk:
+                if (name in live or self.is_recent(mtime)
+                        or not self.is_orphaned(name)):
+                    continue
+                self.remove('sources', lambda: delete(name), size)
+
+    def collect_kvstore(self):
+        kvstore = default.kvstore
+        for chunk in kvstore_chunks('image', self.chunk_size):
+            images = [(key, deserialize_image_file(value))
+                      for key, value in chunk]
+            live = live_images([image.name for _, image in images
+                                if image.name.startswith(UPLOAD_DIR)])
+            for key, image in images:
+                if image.name.startswith(UPLOAD_DIR):
+                    if image.name not in live:
+                        # файл, если он остался, удалит collect_sources
+                        # с учетом min_age
+                        self.remove('kvstore',
+                                    lambda: kvstore.delete(image))
+                elif not image.exists():
+                    self.remove('kvstore',
+                                lambda: kvstore._delete_raw(key))
+        for chunk in kvstore_chunks('thumbnails', self.chunk_size):
+            sources = {key: key.replace('||thumbnails||', '||image||', 1)
+                       for key, _ in chunk}
+            existing = existing_keys(list(sources.values()))
+            for key, source in sources.items():
+                if source not in existing:
+                    self.remove('kvstore', lambda: self.drop_thumbnails(key))
+
+    def drop_thumbnails(self, key):
+        """Удаляет миниатюры из списка key и сам список"""
+        kvstore = default.kvstore
+        for thumbnail_key in kvstore._get(
+            key.rsplit('||', 1)[1], identity='thumbnails'
+        ) or []:
+            thumbnail = kvstore._get(thumbnail_key)
+            if thumbnail:
+                kvstore.delete(thumbnail, delete_thumbnails=False)
+                thumbnail.delete()
+        kvstore._delete_raw(key)
+
+    def collect_thumbnails(self):
+        """Файлы миниатюр, о которых не знает kvstore"""
+        for chunk in chunked(
+            walk(self.storage, thumbnail_settings.THUMBNAIL_PREFIX),
+            self.chunk_size
+        ):
+            keys = {add_prefix(ImageFile(name, self.storage).key): name
+                    for name, _, _ in chunk}
+            known = {keys[key] for key in existing_keys(list(keys))}
+            for name, size, mtime in chunk:
+                if name in known or self.is_recent(mtime):
+                    continue
+                self.remove('thumbnails',
+                            lambda: self.storage.delete(name), size)
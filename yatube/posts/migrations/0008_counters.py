@@ -0,0 +1,72 @@
+# Generated by Django 2.2.16 on 2026-10-18 01:37
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def count_subquery(queryset, field):
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')}).order_by().values(
+            field
+        ).annotate(total=Count('pk')).values('total'),
+        output_field=IntegerField()
+    ), 0)
+
+
+def backfill_counters(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Follow = apps.get_model('posts', 'Follow')
+    UserStats = apps.get_model('posts', 'UserStats')
+    Post.objects.update(
+        comments_count=count_subquery(Comment.objects, 'post')
+    )
+    users = User.objects.annotate(
+        real_posts=count_subquery(Post.objects, 'author'),
+        real_followers=count_subquery(Follow.objects, 'author'),
+        real_following=count_subquery(Follow.objects, 'user'),
+    ).order_by('pk').values_list('pk', 'real_posts', 'real_followers',
+                                 'real_following')
+    batch = []
+    for user_id, posts, followers, following in users.iterator():
+        batch.append(UserStats(user_id=user_id, posts_count=posts,
+                               followers_count=followers,
+                               following_count=following))
+        if len(batch) >= 1000:
+            UserStats.objects.bulk_create(batch)
+            batch = []
+    UserStats.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('posts', '0007_timelineentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('posts_count', models.PositiveIntegerField(default=0, verbose_name='Число постов')),
+                ('followers_count', models.PositiveIntegerField(default=0, verbose_name='Число подписчиков')),
+                ('following_count', models.PositiveIntegerField(default=0, verbose_name='Число подписок')),
+            ],
+            options={
+                'verbose_name': 'счетчики пользователя',
+                'verbose_name_plural': 'Счетчики пользователей',
+            },
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число комментариев'),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
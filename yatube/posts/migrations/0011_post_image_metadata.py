@@ -0,0 +1,78 @@
+# Generated by Django 2.2.16 on 2026-10-18 02:04
+
+import hashlib
+
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+from PIL import Image
+
+BATCH_SIZE = 500
+FIELDS = ['image_width', 'image_height', 'image_hash']
+EXIF_ORIENTATION = 0x0112
+# значения ориентации с поворотом на 90 или 270 градусов
+ROTATED = (5, 6, 7, 8)
+
+
+def read_metadata(image_file):
+    """(ширина, высота, SHA-256) файла изображения с учетом поворота
+    по EXIF; копия posts.images.read_metadata на момент миграции"""
+    digest = hashlib.sha256()
+    for chunk in image_file.chunks():
+        digest.update(chunk)
+    image_file.seek(0)
+    with Image.open(image_file) as image:
+        width, height = image.size
+        if image.getexif().get(EXIF_ORIENTATION) in ROTATED:
+            width, height = height, width
+    return width, height, digest.hexdigest()
+
+
+def backfill_image_metadata(apps, schema_editor):
+    """Заполняет размеры и хэш изображений пачками по BATCH_SIZE,
+    не загружая все посты в память. Размеры читаются так же, как при
+    загрузке, с учетом поворота по EXIF"""
+    Post = apps.get_model('posts', 'Post')
+    posts = Post.objects.exclude(image='').only('pk', 'image').order_by(
+        'pk'
+    ).iterator(chunk_size=BATCH_SIZE)
+    batch = []
+    for post in posts:
+        try:
+            with default_storage.open(post.image.name) as image_file:
+                (post.image_width, post.image_height,
+                 post.image_hash) = read_metadata(image_file)
+        except (OSError, ValueError):
+            # файл отсутствует или не является изображением
+            continue
+        batch.append(post)
+        if len(batch) >= BATCH_SIZE:
+            Post.objects.bulk_update(batch, FIELDS)
+            batch = []
+    Post.objects.bulk_update(batch, FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_post_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, verbose_name='Хэш картинки'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='image_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Высота картинки'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Ширина картинки'),
+        ),
+        migrations.RunPython(backfill_image_metadata,
+                             migrations.RunPython.noop),
+    ]
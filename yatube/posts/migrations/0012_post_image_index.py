@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-18 02:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_post_image_metadata'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, db_index=True, upload_to='posts/', verbose_name='Картинка'),
+        ),
+    ]
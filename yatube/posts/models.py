@@ -1,11 +1,22 @@
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import models, transaction
 from django.urls import reverse
 
 User = get_user_model()
 
 
-class Post(models.Model):
+class AtomicSave:
+    """Сохраняет объект и выполняет обработчики post_save в одной
+    транзакции: счетчики (posts/stats.py) не расходятся с данными,
+    если их обновление не удалось. Удаление Django и так выполняет
+    вместе с post_delete в транзакции."""
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+
+class Post(AtomicSave, models.Model):
     text = models.TextField(verbose_name='Текст поста')
     pub_date = models.DateTimeField(auto_now_add=True,
                                     verbose_name='Дата публикации')
@@ -23,16 +34,58 @@ class Post(models.Model):
         null=True,
         verbose_name='Сообщество'
     )
+    # индекс нужен сборщику мусора (posts/media_gc.py): он сверяет
+    # файлы хранилища с живыми изображениями пачками image__in
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
-        blank=True
+        blank=True,
+        db_index=True
+    )
+    # размеры и SHA-256 содержимого изображения заполняются при загрузке
+    # (posts/images.py), чтобы не открывать файл ради метаданных
+    image_width = models.PositiveIntegerField(
+        'Ширина картинки',
+        null=True,
+        blank=True,
+        editable=False
+    )
+    image_height = models.PositiveIntegerField(
+        'Высота картинки',
+        null=True,
+        blank=True,
+        editable=False
+    )
+    image_hash = models.CharField(
+        'Хэш картинки',
+        max_length=64,
+        blank=True,
+        editable=False
+    )
+    comments_count = models.PositiveIntegerField(
+        'Число комментариев',
+        default=0,
+        editable=False
+    )
+    updated_at = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True
     )
 
     class Meta:
         ordering = ['-pub_date', ]
         verbose_name = 'запись'
         verbose_name_plural = 'Записи'
+        # ленты читаются по убыванию (pub_date, id): все посты,
+        # посты автора и посты группы
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='post_pub_date_idx'),
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='post_author_pub_date_idx'),
+            models.Index(fields=['group', '-pub_date', '-id'],
+                         name='post_group_pub_date_idx'),
+        ]
 
     def __str__(self):
         return self.text[:15]
@@ -56,7 +109,7 @@ class Group(models.Model):
         return self.title
 
 
-class Comment(models.Model):
+class Comment(AtomicSave, models.Model):
     post = models.ForeignKey(
         Post,
         on_delete=models.CASCADE,
@@ -79,12 +132,16 @@ class Comment(models.Model):
         verbose_name = 'комментарий'
         verbose_name_plural = 'Комментарии'
         ordering = ['-created', ]
+        indexes = [
+            models.Index(fields=['post', '-created'],
+                         name='comment_post_created_idx'),
+        ]
 
     def __str__(self):
         return self.text[:15]
 
 
-class Follow(models.Model):
+class Follow(AtomicSave, models.Model):
 
     user = models.ForeignKey(
         User,
@@ -103,3 +160,68 @@ class Follow(models.Model):
         verbose_name = 'подписка'
         verbose_name_plural = 'Подписки'
         ordering = ['pk', ]
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'author'],
+                                    name='unique_follow'),
+        ]
+
+
+class TimelineEntry(models.Model):
+    """Запись материализованной ленты подписок пользователя.
+
+    Заполняется при публикации поста (fan-out on write),
+    см. posts/timelines.py.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Читатель'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Запись'
+    )
+    pub_date = models.DateTimeField('Дата публикации записи')
+
+    class Meta:
+        verbose_name = 'запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+        ordering = ['-pub_date', '-post']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'post'],
+                                    name='unique_timeline_post'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-post'],
+                         name='timeline_user_pub_date_idx'),
+        ]
+
+
+class UserStats(models.Model):
+    """Денормализованные счетчики пользователя.
+
+    Поддерживаются сигналами (posts/signals.py), расхождения
+    исправляет команда reconcile_counters.
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Пользователь'
+    )
+    posts_count = models.PositiveIntegerField('Число постов', default=0)
+    followers_count = models.PositiveIntegerField('Число подписчиков',
+                                                  default=0)
+    following_count = models.PositiveIntegerField('Число подписок',
+                                                  default=0)
+
+    class Meta:
+        verbose_name = 'счетчики пользователя'
+        verbose_name_plural = 'Счетчики пользователей'
+
+    def __str__(self):
+        return str(self.user)
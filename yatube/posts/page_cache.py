@@ -0,0 +1,103 @@
+"""Области кэша страниц приложения posts (см. core/page_cache.py).
+
+global - общая лента, group:<slug> - лента группы,
+author:<id> - профиль и страницы постов автора, post:<id> - страница
+поста.
+
+Области автора привязаны к id: имя можно сменить. Соответствия
+поста и имени автору кэшируются, только если автор найден; запись
+имени сбрасывается при его смене и удалении пользователя
+(posts/signals.py).
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+
+from core import page_cache
+
+from .models import Post
+
+User = get_user_model()
+
+
+def author_scope(author_id):
+    return f'author:{author_id}'
+
+
+def group_scope(slug):
+    return f'group:{slug}'
+
+
+def post_scope(post_id):
+    return f'post:{post_id}'
+
+
+def username_key(username):
+    return f'author_id:{username}'
+
+
+def cached_author_id(key, ids):
+    """id автора из кэша или первый из ids; None не кэшируется"""
+    author_id = cache.get(key)
+    if author_id is None:
+        author_id = ids.first()
+        if author_id is not None:
+            cache.set(key, author_id, settings.PAGE_CACHE_TIMEOUT)
+    return author_id
+
+
+def post_author_id(post_id):
+    """id автора поста; автор поста не меняется"""
+    return cached_author_id(f'post_author:{post_id}', Post.objects.filter(
+        pk=post_id
+    ).values_list('author_id', flat=True))
+
+
+def author_id_by_username(username):
+    return cached_author_id(username_key(username), User.objects.filter(
+        username=username
+    ).values_list('pk', flat=True))
+
+
+def forget_username(username):
+    cache.delete(username_key(username))
+
+
+def index_scopes(request):
+    return ['global']
+
+
+def group_scopes(request, slug):
+    return [group_scope(slug)]
+
+
+def profile_scopes(request, username):
+    # страница несуществующего пользователя не кэшируется
+    user_id = author_id_by_username(username)
+    return [author_scope(user_id)] if user_id is not None else []
+
+
+def post_scopes(request, post_id):
+    # на странице поста выводится число постов автора
+    user_id = post_author_id(post_id)
+    return [post_scope(post_id),
+            *([author_scope(user_id)] if user_id is not None else [])]
+
+
+def bump_post(post, group_slugs=()):
+    """Сбрасывает страницы, на которых выводится пост"""
+    page_cache.bump('global', post_scope(post.pk),
+                    author_scope(post.author_id),
+                    *[group_scope(slug) for slug in group_slugs])
+
+
+def bump_author(author_id):
+    page_cache.bump(author_scope(author_id))
+
+
+def bump_post_detail(post_id):
+    page_cache.bump(post_scope(post_id))
+
+
+def bump_group(slug):
+    page_cache.bump(group_scope(slug))
@@ -0,0 +1,150 @@
+from django.conf import settings
+from django.core.paginator import InvalidPage, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.encoding import force_bytes, force_str
+from django.utils.functional import cached_property
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+from . import counts
+
+# направления перехода по курсору
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+class InvalidCursor(InvalidPage):
+    pass
+
+
+def encode_cursor(direction, pub_date, pk):
+    """Упаковывает ключ (pub_date, id) поста в непрозрачный токен"""
+    raw = f'{direction}|{pub_date.isoformat()}|{pk}'
+    return urlsafe_base64_encode(force_bytes(raw))
+
+
+def decode_cursor(cursor):
+    """Распаковывает токен курсора в (направление, pub_date, id)"""
+    try:
+        direction, pub_date, pk = force_str(
+            urlsafe_base64_decode(cursor)
+        ).split('|')
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (TypeError, ValueError):
+        raise InvalidCursor('Некорректный курсор')
+    if direction not in (NEXT, PREVIOUS) or pub_date is None:
+        raise InvalidCursor('Некорректный курсор')
+    return direction, pub_date, pk
+
+
+class CursorPaginator(Paginator):
+    """Пагинатор, листающий ленту по ключу (pub_date, id).
+
+    Страница по курсору выбирается условием по ключу вместо OFFSET
+    и не требует COUNT(*), поэтому стоит одинаково на любой глубине.
+    Обычная постраничная навигация (page/get_page) сохранена.
+    Если передана область count_scope - (scope, pk) из posts.counts,
+    число постов берется из кэшируемого счетчика.
+
+    keys - имена полей даты и id в object_list (объектов или словарей
+    values()); item_attr - атрибут
+    строки object_list, который попадает на страницу (например, post
+    у записи ленты подписок). Вместо QuerySet можно передать объект
+    с методом keyset(direction, key, limit), см. posts.feeds.MergedFeed.
+    """
+
+    def __init__(self, object_list, per_page, count_scope=None,
+                 keys=('pub_date', 'pk'), item_attr=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_scope = count_scope
+        self.keys = keys
+        self.item_attr = item_attr
+
+    @cached_property
+    def count(self):
+        if self.count_scope is None:
+            return super().count
+        return counts.get_count(self.object_list, *self.count_scope)
+
+    def cursor_page(self, cursor=None):
+        """Возвращает страницу, следующую за курсором (или первую)"""
+        direction, key = NEXT, None
+        if cursor:
+            direction, pub_date, pk = decode_cursor(cursor)
+            key = (pub_date, pk)
+        if hasattr(self.object_list, 'keyset'):
+            rows = self.object_list.keyset(direction, key,
+                                           self.per_page + 1)
+        else:
+            rows = self._keyset(direction, key)
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == NEXT:
+            has_next, has_previous = has_more, bool(cursor)
+        else:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+
+        page = self._get_page(rows, 1, self)
+        page.is_cursor = True
+        page.cursor = cursor or ''
+        page.next_cursor = (self._encode(NEXT, rows[-1])
+                            if has_next and rows else None)
+        page.previous_cursor = (self._encode(PREVIOUS, rows[0])
+                                if has_previous and rows else None)
+        return page
+
+    def _keyset(self, direction, key):
+        """Строки после (NEXT, по убыванию) или до (PREVIOUS,
+        по возрастанию) ключа key"""
+        queryset = self.object_list
+        date_key, id_key = self.keys
+        if key is not None:
+            pub_date, pk = key
+            lookup = 'lt' if direction == NEXT else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{date_key}__{lookup}': pub_date})
+                | Q(**{date_key: pub_date, f'{id_key}__{lookup}': pk})
+            )
+        if direction == NEXT:
+            queryset = queryset.order_by(f'-{date_key}', f'-{id_key}')
+        else:
+            queryset = queryset.order_by(date_key, id_key)
+        return list(queryset[:self.per_page + 1])
+
+    def _encode(self, direction, row):
+        date_key, id_key = self.keys
+        if isinstance(row, dict):
+            # строки values()
+            return encode_cursor(direction, row[date_key], row[id_key])
+        return encode_cursor(direction, getattr(row, date_key),
+                             getattr(row, id_key))
+
+    def _get_page(self, object_list, *args, **kwargs):
+        if self.item_attr is not None:
+            object_list = [getattr(row, self.item_attr)
+                           for row in object_list]
+        return super()._get_page(object_list, *args, **kwargs)
+
+    def get_cursor_page(self, cursor=None):
+        """Как cursor_page, но при некорректном курсоре отдает
+        первую страницу"""
+        try:
+            return self.cursor_page(cursor)
+        except InvalidCursor:
+            return self.cursor_page()
+
+
+def paginate(request, object_list, count_scope=None, **kwargs):
+    """Возвращает страницу ленты для запроса.
+
+    Если в запросе передан номер страницы (?page=) или курсорная
+    пагинация отключена - используется обычная пагинация.
+    """
+    paginator = CursorPaginator(object_list, settings.RECORDS_PER_PAGE,
+                                count_scope=count_scope, **kwargs)
+    page_number = request.GET.get('page')
+    if page_number is not None or not settings.CURSOR_PAGINATION:
+        return paginator.get_page(page_number)
+    return paginator.get_cursor_page(request.GET.get('cursor'))
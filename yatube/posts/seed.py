@@ -0,0 +1,149 @@
+"""Синтетические данные для замеров производительности.
+
+Все данные выводятся из seed: одинаковые параметры дают одинаковых
+пользователей, тексты, даты и граф подписок. Тексты и имена генерирует
+Faker, запись идет пачками через bulk_import.Importer.
+
+Популярность пользователей подчиняется степенному закону: пользователь
+ранга r получает вес 1 / r ** exponent. По этим весам выбираются авторы
+постов и подписок, поэтому несколько авторов пишут большую часть постов
+и собирают большую часть подписчиков. Число подписок пользователя
+распределено по Парето со средним follows.
+"""
+import datetime
+import itertools
+import random
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from faker import Faker
+
+from .bulk_import import Importer
+from .models import Group, Post
+
+User = get_user_model()
+
+PREFIX = 'bench'
+# даты не зависят от момента запуска
+START = datetime.datetime(2021, 1, 1, tzinfo=datetime.timezone.utc)
+PERIOD = datetime.timedelta(days=365)
+# параметр распределения Парето числа подписок
+PARETO_ALPHA = 2.0
+
+
+def usernames(count, prefix=PREFIX):
+    return [f'{prefix}_{index:07d}' for index in range(count)]
+
+
+def exists(prefix=PREFIX):
+    return User.objects.filter(username__startswith=f'{prefix}_').exists()
+
+
+def delete(prefix=PREFIX):
+    """Удаляет ранее созданные данные с префиксом prefix.
+
+    Удаление идет через ORM: каскад доходит до всех связанных строк,
+    а сигналы post_delete обновляют счетчики и сбрасывают кэш."""
+    with transaction.atomic():
+        User.objects.filter(username__startswith=f'{prefix}_').delete()
+        Group.objects.filter(slug__startswith=f'{prefix}-').delete()
+
+
+class Generator:
+    """Строки импорта для bulk_import.Importer"""
+
+    def __init__(self, users, groups, seed=0, exponent=1.0,
+                 prefix=PREFIX):
+        self.rng = random.Random(seed)
+        self.fake = Faker('ru_RU')
+        self.fake.seed_instance(seed)
+        self.usernames = usernames(users, prefix)
+        self.slugs = [f'{prefix}-{index}' for index in range(groups)]
+        # ранг популярности не совпадает с порядком создания
+        self.ranked = self.usernames[:]
+        self.rng.shuffle(self.ranked)
+        self.cum_weights = list(itertools.accumulate(
+            1 / (rank + 1) ** exponent for rank in range(users)
+        ))
+
+    def popular(self, count=1):
+        return self.rng.choices(self.ranked, cum_weights=self.cum_weights,
+                                k=count)
+
+    def moment(self, after=START, period=PERIOD):
+        return after + self.rng.random() * period
+
+    def groups(self):
+        return [Group(title=self.fake.catch_phrase()[:200], slug=slug,
+                      description=self.fake.sentence())
+                for slug in self.slugs]
+
+    def users(self):
+        for username in self.usernames:
+            yield {'username': username,
+                   'first_name': self.fake.first_name(),
+                   'last_name': self.fake.last_name()}
+
+    def follows(self, average):
+        scale = average * (PARETO_ALPHA - 1) / PARETO_ALPHA
+        limit = len(self.usernames) - 1
+        for username in self.usernames:
+            wanted = min(limit, int(self.rng.paretovariate(PARETO_ALPHA)
+                                    * scale))
+            authors = set()
+            # популярных авторов выбирают чаще, повторы отбрасываются
+            for _ in range(3):
+                authors.update(self.popular(wanted - len(authors)))
+                authors.discard(username)
+                if len(authors) >= wanted:
+                    break
+            for author in sorted(authors):
+                yield {'user': username, 'author': author}
+
+    def posts(self, count):
+        for _ in range(count):
+            group = (self.rng.choice(self.slugs)
+                     if self.slugs and self.rng.random() < 0.5 else None)
+            yield {'author': self.popular()[0],
+                   'group': group,
+                   'text': self.fake.text(max_nb_chars=300),
+                   'pub_date': self.moment()}
+
+    def comments(self, count, posts):
+        """posts - пары (id поста, дата публикации)"""
+        for _ in range(count):
+            post_id, pub_date = self.rng.choice(posts)
+            yield {'post': post_id,
+                   'author': self.rng.choice(self.usernames),
+                   'text': self.fake.sentence(),
+                   'created': self.moment(pub_date,
+                                          datetime.timedelta(days=7))}
+
+
+def generate(users, posts, groups=10, comments=0, follows=20, seed=0,
+             exponent=1.0, prefix=PREFIX, batch_size=1000, progress=None):
+    """Создает данные; возвращает словарь с числом созданных строк.
+
+    Подписки загружаются раньше постов, поэтому ленты подписок
+    пересобираются один раз, при завершении импорта постов."""
+    generator = Generator(users, groups, seed, exponent, prefix)
+    Group.objects.bulk_create(generator.groups())
+    created = {'groups': groups}
+    steps = [
+        ('users', generator.users),
+        ('follows', lambda: generator.follows(follows)),
+        ('posts', lambda: generator.posts(posts)),
+        ('comments', lambda: generator.comments(comments, list(
+            Post.objects.filter(
+                author__username__startswith=f'{prefix}_'
+            ).order_by('pk').values_list('pk', 'pub_date')
+        ))),
+    ]
+    for name, rows in steps:
+        if name == 'comments' and not (comments and posts):
+            break
+        importer = Importer(name, batch_size, progress)
+        created[name] = importer.run(rows())['created']
+        if name in ('posts', 'comments'):
+            importer.finish()
+    return created
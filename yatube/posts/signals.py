@@ -0,0 +1,172 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import (counts, feeds, follow_graph, images, page_cache, stats,
+               timelines)
+from .models import Comment, Follow, Group, Post, UserStats
+
+User = get_user_model()
+
+
+def follower_ids(author_id):
+    return list(Follow.objects.filter(
+        author_id=author_id
+    ).values_list('user_id', flat=True))
+
+
+def group_slugs(post):
+    """Slug группы поста (без запроса, если группа уже загружена)"""
+    return [post.group.slug] if post.group_id else []
+
+
+def commented_post(comment):
+    """Пост комментария с группой (без запроса, если они уже
+    загружены) или None, если пост уже удален"""
+    if Comment.post.is_cached(comment):
+        post = comment.post
+        if not post.group_id or Post.group.is_cached(post):
+            return post
+    return Post.objects.select_related('group').filter(
+        pk=comment.post_id
+    ).first()
+
+
+def bump_commented_post(comment):
+    """Сбрасывает страницу поста и ленты с его карточкой: на карточке
+    выводится число комментариев"""
+    post = commented_post(comment)
+    if post is None:
+        page_cache.bump_post_detail(comment.post_id)
+    else:
+        page_cache.bump_post(post, group_slugs(post))
+
+
+def follower_scopes(followers):
+    """Области лент подписок подписчиков автора"""
+    return [(counts.FOLLOW, user_id) for user_id in followers]
+
+
+@receiver(pre_save, sender=Post)
+def fill_image_metadata(sender, instance, **kwargs):
+    """Размеры и хэш нового изображения берутся из загруженного файла,
+    пока он не сохранен в хранилище"""
+    if instance.image and not instance.image._committed:
+        images.set_metadata(instance, instance.image.file)
+    elif not instance.image and instance.image_hash:
+        images.set_metadata(instance)
+
+
+@receiver(pre_save, sender=Post)
+def remember_post_group(sender, instance, **kwargs):
+    """Запоминает прежнюю группу редактируемого поста"""
+    if instance.pk is None:
+        return
+    instance._previous_group_id, instance._previous_group_slug = (
+        Post.objects.filter(pk=instance.pk).values_list(
+            'group_id', 'group__slug'
+        ).first() or (None, None)
+    )
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    if created:
+        followers = follower_ids(instance.author_id)
+        stats.bump_user(instance.author_id, posts_count=1)
+        timelines.fan_out(instance, followers)
+        feeds.invalidate_author(instance.author_id)
+        counts.invalidate((counts.GLOBAL, None),
+                          (counts.AUTHOR, instance.author_id),
+                          (counts.GROUP, instance.group_id),
+                          *follower_scopes(followers))
+        page_cache.bump_post(instance, group_slugs(instance))
+        return
+    previous_group_id = getattr(instance, '_previous_group_id', None)
+    if previous_group_id != instance.group_id:
+        counts.invalidate((counts.GROUP, previous_group_id),
+                          (counts.GROUP, instance.group_id))
+    previous_group_slug = getattr(instance, '_previous_group_slug', None)
+    page_cache.bump_post(instance, [
+        *group_slugs(instance),
+        *([previous_group_slug] if previous_group_slug else []),
+    ])
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    stats.bump_user(instance.author_id, posts_count=-1)
+    feeds.invalidate_author(instance.author_id)
+    counts.invalidate((counts.GLOBAL, None),
+                      (counts.AUTHOR, instance.author_id),
+                      (counts.GROUP, instance.group_id),
+                      *follower_scopes(follower_ids(instance.author_id)))
+    page_cache.bump_post(instance, group_slugs(instance))
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, **kwargs):
+    if created:
+        stats.bump_user(instance.user_id, following_count=1)
+        stats.bump_user(instance.author_id, followers_count=1)
+        timelines.add_author(instance.user_id, instance.author_id)
+    follow_graph.invalidate(instance.user_id)
+    counts.invalidate((counts.FOLLOW, instance.user_id))
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    stats.bump_user(instance.user_id, following_count=-1)
+    stats.bump_user(instance.author_id, followers_count=-1)
+    timelines.remove_author(instance.user_id, instance.author_id)
+    follow_graph.invalidate(instance.user_id)
+    counts.invalidate((counts.FOLLOW, instance.user_id))
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    if created:
+        stats.bump_post(instance.post_id, 1)
+        bump_commented_post(instance)
+    else:
+        page_cache.bump_post_detail(instance.post_id)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    stats.bump_post(instance.post_id, -1)
+    bump_commented_post(instance)
+
+
+@receiver(pre_save, sender=User)
+def remember_username(sender, instance, update_fields=None, **kwargs):
+    """Запоминает прежнее имя пользователя, если оно может измениться"""
+    if instance.pk is None or (update_fields is not None
+                               and 'username' not in update_fields):
+        return
+    instance._previous_username = User.objects.filter(
+        pk=instance.pk
+    ).values_list('username', flat=True).first()
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    if created:
+        UserStats.objects.get_or_create(user=instance)
+        return
+    previous = getattr(instance, '_previous_username', None)
+    if previous is not None and previous != instance.username:
+        page_cache.forget_username(previous)
+        page_cache.bump_author(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    page_cache.forget_username(instance.username)
+    page_cache.bump_author(instance.pk)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    page_cache.bump_group(instance.slug)
@@ -0,0 +1,127 @@
+"""Денормализованные счетчики постов, комментариев и подписок.
+
+Счетчики меняются атомарно через F()-выражения в сигналах
+(posts/signals.py) в транзакции сохранения или удаления объекта
+(см. AtomicSave в posts/models.py) и не опускаются ниже нуля;
+reconcile() пересчитывает их по данным БД.
+"""
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Comment, Follow, Post, UserStats
+
+User = get_user_model()
+
+
+def _bumped(field, delta):
+    """Новое значение счетчика; уже разошедшийся с данными счетчик
+    не нарушает ограничение неотрицательности при уменьшении"""
+    return Greatest(F(field) + delta, 0)
+
+
+def bump_user(user_id, **deltas):
+    """Изменяет счетчики пользователя на заданные величины"""
+    changes = {field: _bumped(field, delta)
+               for field, delta in deltas.items()}
+    updated = UserStats.objects.filter(user_id=user_id).update(**changes)
+    if not updated and all(delta > 0 for delta in deltas.values()):
+        UserStats.objects.get_or_create(user_id=user_id)
+        UserStats.objects.filter(user_id=user_id).update(**changes)
+
+
+def bump_post(post_id, delta):
+    """Изменяет число комментариев поста"""
+    Post.objects.filter(pk=post_id).update(
+        comments_count=_bumped('comments_count', delta)
+    )
+
+
+def _count(queryset, field):
+    """Подзапрос с числом строк queryset, связанных с внешним pk"""
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')}).order_by().values(
+            field
+        ).annotate(total=Count('pk')).values('total'),
+        output_field=IntegerField()
+    ), 0)
+
+
+def _batches(queryset, batch_size):
+    """Пачки объектов queryset по возрастанию pk"""
+    last_pk = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk).order_by('pk')[
+            :batch_size
+        ])
+        if not batch:
+            return
+        yield batch
+        last_pk = batch[-1].pk
+
+
+def drifted(post_ids=(), user_ids=()):
+    """Число постов из post_ids и пользователей из user_ids,
+    счетчики которых расходятся с данными"""
+    posts = Post.objects.filter(pk__in=post_ids).annotate(
+        real_comments=_count(Comment.objects, 'post')
+    ).exclude(comments_count=F('real_comments'))
+    users = UserStats.objects.filter(pk__in=user_ids).annotate(
+        real_posts=_count(Post.objects, 'author'),
+        real_followers=_count(Follow.objects, 'author'),
+        real_following=_count(Follow.objects, 'user'),
+    ).exclude(posts_count=F('real_posts'),
+              followers_count=F('real_followers'),
+              following_count=F('real_following'))
+    return posts.count() + users.count()
+
+
+def reconcile_users(batch_size=1000, user_ids=None):
+    """Пересчитывает счетчики пользователей (всех или user_ids),
+    возвращает число исправленных записей"""
+    users = User.objects.annotate(
+        real_posts=_count(Post.objects, 'author'),
+        real_followers=_count(Follow.objects, 'author'),
+        real_following=_count(Follow.objects, 'user'),
+    ).select_related('stats')
+    if user_ids is not None:
+        users = users.filter(pk__in=user_ids)
+    fixed = 0
+    for batch in _batches(users, batch_size):
+        changed = []
+        for user in batch:
+            stats = getattr(user, 'stats', None)
+            if stats is None:
+                stats = UserStats.objects.create(user=user)
+            real = (user.real_posts, user.real_followers,
+                    user.real_following)
+            if real != (stats.posts_count, stats.followers_count,
+                        stats.following_count):
+                (stats.posts_count, stats.followers_count,
+                 stats.following_count) = real
+                changed.append(stats)
+        UserStats.objects.bulk_update(
+            changed,
+            ['posts_count', 'followers_count', 'following_count']
+        )
+        fixed += len(changed)
+    return fixed
+
+
+def reconcile_posts(batch_size=1000, post_ids=None):
+    """Пересчитывает число комментариев постов (всех или post_ids),
+    возвращает число исправленных записей"""
+    posts = Post.objects.annotate(
+        real_comments=_count(Comment.objects, 'post')
+    ).only('pk', 'comments_count')
+    if post_ids is not None:
+        posts = posts.filter(pk__in=post_ids)
+    fixed = 0
+    for batch in _batches(posts, batch_size):
+        changed = [post for post in batch
+                   if post.comments_count != post.real_comments]
+        for post in changed:
+            post.comments_count = post.real_comments
+        Post.objects.bulk_update(changed, ['comments_count'])
+        fixed += len(changed)
+    return fixed
@@ -0,0 +1,17 @@
+from django import template
+from django.conf import settings
+
+from .. import cards
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_card_key(post):
+    """Версия карточки для ключа {% cache %} (см. posts/cards.py)"""
+    return cards.key(post)
+
+
+@register.simple_tag
+def post_card_timeout():
+    return settings.POST_CARD_CACHE_TIMEOUT
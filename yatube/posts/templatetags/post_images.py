@@ -0,0 +1,17 @@
+from django import template
+
+from .. import thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_thumbnail(post):
+    """Миниатюра изображения поста: {'src', 'srcset', 'width', 'height'}.
+
+    Берет данные, загруженные thumbnails.preload, и только при их
+    отсутствии обращается к kvstore.
+    """
+    if not hasattr(post, 'thumbnail'):
+        thumbnails.preload([post])
+    return post.thumbnail
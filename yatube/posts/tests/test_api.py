@@ -0,0 +1,113 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..api import POST_FIELDS
+from ..models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class ApiTest(TestCase):
+    """Тестирование JSON API."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.other = User.objects.create_user(username='other')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Группа', slug='group',
+                                         description='Описание')
+        cls.posts = [
+            Post.objects.create(author=cls.author, group=cls.group,
+                                text=f'Пост {i}', image='posts/photo.jpg')
+            for i in range(5)
+        ]
+        Post.objects.create(author=cls.other, text='Чужой пост')
+        cls.comment = Comment.objects.create(post=cls.posts[0],
+                                             author=cls.reader,
+                                             text='Комментарий')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, name, client=None, kwargs=None, **params):
+        response = (client or self.client).get(
+            reverse(f'posts:{name}', kwargs=kwargs), params
+        )
+        self.assertEqual(response['Content-Type'], 'application/json')
+        return response.status_code, json.loads(response.content)
+
+    def test_cursor_walks_whole_feed(self):
+        """Проверка: курсор проходит ленту группы целиком по убыванию
+        даты без повторов"""
+        ids, cursor = [], None
+        while True:
+            params = {'limit': 2, 'fields': 'id'}
+            if cursor:
+                params['cursor'] = cursor
+            status, data = self.get('api_group_list',
+                                    kwargs={'slug': 'group'}, **params)
+            self.assertEqual(status, 200)
+            ids += [item['id'] for item in data['results']]
+            cursor = data['next']
+            if not cursor:
+                break
+        self.assertEqual(ids, [post.pk for post in reversed(self.posts)])
+
+    def test_sparse_fields(self):
+        """Проверка: в ответ попадают только запрошенные поля"""
+        _, data = self.get('api_index', fields='id,author')
+        self.assertEqual(set(data['results'][0]), {'id', 'author'})
+        _, data = self.get('api_profile', kwargs={'username': 'author'})
+        item = data['results'][0]
+        self.assertEqual(set(item), set(POST_FIELDS))
+        self.assertEqual(item['author'], 'author')
+        self.assertEqual(item['group'], 'group')
+        self.assertEqual(item['image'], '/media/posts/photo.jpg')
+
+    def test_bad_requests(self):
+        """Проверка: неизвестное поле и испорченный курсор - 400,
+        несуществующие группа и автор - 404"""
+        requests = [
+            ('api_index', None, {'fields': 'id,password'}, 400),
+            ('api_index', None, {'cursor': 'испорчен'}, 400),
+            ('api_group_list', {'slug': 'missing'}, {}, 404),
+            ('api_profile', {'username': 'missing'}, {}, 404),
+            ('api_post_detail', {'post_id': 0}, {}, 404),
+        ]
+        for name, kwargs, params, expected in requests:
+            with self.subTest(name=name, params=params):
+                status, data = self.get(name, kwargs=kwargs, **params)
+                self.assertEqual(status, expected)
+                self.assertIn('error', data)
+
+    def test_post_detail_with_comments(self):
+        """Проверка: пост отдается с комментариями"""
+        status, data = self.get(
+            'api_post_detail', kwargs={'post_id': self.posts[0].pk},
+            fields='id,text', comment_fields='text,author'
+        )
+        self.assertEqual(status, 200)
+        self.assertEqual(data, {
+            'id': self.posts[0].pk,
+            'text': self.posts[0].text,
+            'comments': [{'text': 'Комментарий', 'author': 'reader'}],
+        })
+
+    def test_follow_feed(self):
+        """Проверка: лента подписок требует авторизации и содержит
+        только посты авторов подписок"""
+        status, _ = self.get('api_follow_index')
+        self.assertEqual(status, 401)
+        client = Client()
+        client.force_login(self.reader)
+        status, data = self.get('api_follow_index', client=client,
+                                fields='author', limit=100)
+        self.assertEqual(status, 200)
+        self.assertEqual([item['author'] for item in data['results']],
+                         ['author'] * len(self.posts))
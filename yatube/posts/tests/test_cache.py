@@ -0,0 +1,79 @@
+import os
+import tempfile
+
+from django.test import SimpleTestCase
+
+from core.two_tier_cache import TwoTierCache
+
+
+class TwoTierCacheTest(SimpleTestCase):
+    """Тестирование двухуровневого кэша."""
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.location = os.path.join(directory.name, 'cache.sqlite3')
+        # два экземпляра с общим файлом изображают два процесса
+        self.first = self.make_cache()
+        self.second = self.make_cache()
+
+    def make_cache(self, **options):
+        return TwoTierCache(self.location, {
+            'OPTIONS': {'SYNC_INTERVAL': 0, **options}
+        })
+
+    def test_value_shared_between_processes(self):
+        """Проверка: значение, записанное одним процессом, видно
+        другому."""
+        self.first.set('key', {'value': 1})
+        self.assertEqual(self.second.get('key'), {'value': 1})
+        self.assertEqual(self.second.get_many(['key', 'missing']),
+                         {'key': {'value': 1}})
+
+    def test_invalidation_reaches_other_process(self):
+        """Проверка: изменение и удаление в одном процессе сбрасывают
+        локальную копию в другом."""
+        self.first.set('key', 'old')
+        self.assertEqual(self.second.get('key'), 'old')
+        self.first.set('key', 'new')
+        self.assertEqual(self.second.get('key'), 'new')
+        self.first.delete('key')
+        self.assertIsNone(self.second.get('key'))
+
+    def test_clear_reaches_other_process(self):
+        """Проверка: clear() сбрасывает локальные копии всех
+        процессов."""
+        self.first.set('key', 'value')
+        self.second.get('key')
+        self.first.clear()
+        self.assertIsNone(self.second.get('key'))
+
+    def test_stats_per_tier(self):
+        """Проверка: попадания и промахи считаются по уровням."""
+        self.first.set('key', 'value')
+        self.second.get('key')
+        self.second.get('key')
+        self.second.get('missing')
+        self.assertEqual(self.second.stats(), {
+            'local_hits': 1, 'local_misses': 2,
+            'shared_hits': 1, 'shared_misses': 1,
+            'local_entries': 1,
+        })
+
+    def test_local_tier_is_bounded(self):
+        """Проверка: LRU процесса не растет сверх LOCAL_MAX_ENTRIES."""
+        cache = self.make_cache(LOCAL_MAX_ENTRIES=2)
+        for key in ('a', 'b', 'c'):
+            cache.set(key, key)
+        cache.get('a')
+        self.assertEqual(cache.stats()['local_entries'], 2)
+        self.assertEqual(cache.get('a'), 'a')
+
+    def test_add_and_expiry(self):
+        """Проверка: add не перезаписывает живую запись, истекшая
+        запись не возвращается."""
+        self.assertTrue(self.first.add('key', 'first'))
+        self.assertFalse(self.second.add('key', 'second'))
+        self.assertEqual(self.second.get('key'), 'first')
+        self.first.set('expired', 'value', 0)
+        self.assertIsNone(self.second.get('expired'))
+        self.assertTrue(self.second.add('expired', 'value'))
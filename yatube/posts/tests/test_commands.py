@@ -0,0 +1,694 @@
+import csv
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from sorl.thumbnail import delete, get_thumbnail
+from sorl.thumbnail.engines.pil_engine import Engine as DefaultEngine
+from sorl.thumbnail.parsers import parse_geometry
+
+from core.storage import is_hashed_name
+
+from .. import (benchmarks, follow_graph, images, load_test, media_gc,
+                thumbnails)
+from ..management.commands.benchmark_thumbnail_engine import get_options
+from ..models import Comment, Follow, Group, Post, TimelineEntry, UserStats
+from ..thumbnail_engine import Engine
+from .utils import SMALL_GIF, TEMP_MEDIA_ROOT
+
+User = get_user_model()
+
+
+class RebuildTimelinesCommandTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='author')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.posts = [
+            Post.objects.create(author=cls.author, text=f'Пост {i}')
+            for i in range(3)
+        ]
+
+    def test_rebuild_restores_timeline(self):
+        """Проверка: команда восстанавливает ленту подписок"""
+        TimelineEntry.objects.all().delete()
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertEqual(
+            list(self.reader.timeline.values_list('post', flat=True)),
+            [post.pk for post in reversed(self.posts)]
+        )
+
+    def test_rebuild_drops_stale_entries(self):
+        """Проверка: лента без подписок очищается"""
+        Follow.objects.all().delete()
+        TimelineEntry.objects.create(user=self.reader, post=self.posts[0],
+                                     pub_date=self.posts[0].pub_date)
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertFalse(TimelineEntry.objects.exists())
+
+
+class BenchmarkFollowFeedCommandTest(TestCase):
+
+    def test_benchmark_rolls_back_data(self):
+        """Проверка: бенчмарк печатает результаты и не оставляет данных"""
+        out = StringIO()
+        call_command('benchmark_follow_feed', authors=5, posts=3,
+                     followees=3, pages=2, repeat=1, stdout=out)
+        for engine in ('query', 'timeline', 'merge'):
+            with self.subTest(engine=engine):
+                self.assertIn(engine, out.getvalue())
+        self.assertFalse(User.objects.exists())
+        self.assertFalse(Post.objects.exists())
+
+    def test_benchmark_leaves_no_cache(self):
+        """Проверка: новый пользователь с id читателя бенчмарка
+        не получает его подписки из кэша"""
+        call_command('benchmark_follow_feed', authors=5, posts=3,
+                     followees=3, pages=2, repeat=1, stdout=StringIO())
+        user = User.objects.create_user(username='user')
+        author = User.objects.create_user(username='author')
+        self.assertIsNone(cache.get(follow_graph.followees_key(user.pk)))
+        self.assertFalse(follow_graph.FollowGraph().is_following(user,
+                                                                 author))
+
+
+class ReconcileCountersCommandTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='author')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.post = Post.objects.create(author=cls.author, text='Пост')
+        Comment.objects.create(author=cls.reader, post=cls.post,
+                               text='Комментарий')
+
+    def test_reconcile_fixes_drift(self):
+        """Проверка: команда исправляет разошедшиеся счетчики"""
+        UserStats.objects.update(posts_count=10, followers_count=10,
+                                 following_count=10)
+        UserStats.objects.filter(user=self.reader).delete()
+        Post.objects.update(comments_count=10)
+        call_command('reconcile_counters', stdout=StringIO())
+        expected = {self.reader.pk: (0, 0, 1), self.author.pk: (1, 1, 0)}
+        for user_id, counters in expected.items():
+            with self.subTest(user_id=user_id):
+                self.assertEqual(UserStats.objects.filter(
+                    user_id=user_id
+                ).values_list('posts_count', 'followers_count',
+                              'following_count').get(), counters)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class RegenerateThumbnailsCommandTest(TransactionTestCase):
+    # миниатюры создаются в потоках со своими соединениями с БД,
+    # поэтому данные теста должны быть зафиксированы
+
+    def setUp(self):
+        cache.clear()
+        author = User.objects.create_user(username='author')
+        self.post = Post.objects.create(
+            author=author, text='Пост с картинкой',
+            image=SimpleUploadedFile('small.gif', SMALL_GIF,
+                                     content_type='image/gif')
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_all_variants_created(self):
+        """Проверка: команда создает все варианты миниатюр"""
+        out = StringIO()
+        call_command('regenerate_thumbnails', '--force', stdout=out)
+        self.assertIn('Обработано изображений: 1, ошибок: 0',
+                      out.getvalue())
+        variants = thumbnails.get_variants(self.post.image)
+        self.assertEqual(len(variants), len(settings.POST_THUMBNAIL_SIZES))
+        for variant in variants:
+            with self.subTest(variant=variant.name):
+                self.assertTrue(default_storage.exists(variant.name))
+
+    def test_post_detail_serves_srcset(self):
+        """Проверка: без готовых миниатюр страница поста создает только
+        основной вариант, остальные создаются в пуле, после чего
+        страница отдает все варианты в srcset"""
+        # изображение обрабатывается в пуле после создания поста
+        images.wait_pending()
+        self.post.refresh_from_db()
+        delete(self.post.image.name, delete_file=False)
+        thumbnails.invalidate()
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        response = self.client.get(url)
+        main = get_thumbnail(self.post.image.name,
+                             settings.POST_THUMBNAIL_DEFAULT,
+                             **settings.POST_THUMBNAIL_OPTIONS)
+        self.assertContains(response, main.url)
+        images.wait_pending()
+        # сброс страницы из потока пула доходит до локального уровня
+        # кэша других потоков за время сверки (core/two_tier_cache.py)
+        time.sleep(settings.CACHES['default']['OPTIONS']['SYNC_INTERVAL'])
+        variants = thumbnails.get_variants(self.post.image)
+        self.assertContains(self.client.get(url),
+                            thumbnails.srcset(variants))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class MigrateMediaStorageCommandTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        # файлы в прежней плоской раскладке
+        flat = FileSystemStorage()
+        self.old_names = [
+            flat.save(f'posts/legacy_{i}.gif', ContentFile(SMALL_GIF))
+            for i in range(2)
+        ]
+        self.posts = [
+            Post.objects.create(author=self.author, text=f'Пост {i}',
+                                image=name)
+            for i, name in enumerate(self.old_names)
+        ]
+
+    def test_files_moved_and_deduplicated(self):
+        """Проверка: файлы переносятся в новое хранилище пачками,
+        одинаковые файлы объединяются, старые удаляются"""
+        out = StringIO()
+        call_command('migrate_media_storage', batch_size=1, stdout=out)
+        self.assertIn('Перенесено постов: 2, файлов не найдено: 0, '
+                      'удалено старых файлов: 2', out.getvalue())
+        names = set()
+        for post in self.posts:
+            post.refresh_from_db()
+            names.add(post.image.name)
+            with self.subTest(post=post.pk):
+                self.assertTrue(is_hashed_name(post.image.name))
+                self.assertEqual(post.image_hash,
+                                 hashlib.sha256(SMALL_GIF).hexdigest())
+        self.assertEqual(len(names), 1)
+        self.assertTrue(default_storage.exists(names.pop()))
+        for name in self.old_names:
+            with self.subTest(name=name):
+                self.assertFalse(default_storage.exists(name))
+
+    def test_dry_run_changes_nothing(self):
+        """Проверка: с --dry-run файлы и посты не меняются"""
+        out = StringIO()
+        call_command('migrate_media_storage', '--dry-run', stdout=out)
+        self.assertIn('Постов для переноса: 2', out.getvalue())
+        self.assertEqual(
+            list(Post.objects.order_by('pk').values_list('image',
+                                                         flat=True)),
+            self.old_names
+        )
+
+
+class ThumbnailEngineTest(TestCase):
+
+    def test_same_result_as_default_engine(self):
+        """Проверка: движок с draft и reduce дает миниатюры того же
+        размера и ориентации, что и стандартный, декодируя меньше"""
+        exif = Image.Exif()
+        # ориентация 6: снимок нужно повернуть на 90 градусов
+        exif[0x0112] = 6
+        buffer = BytesIO()
+        Image.new('RGB', (3000, 2000), 'red').save(buffer, 'JPEG',
+                                                   exif=exif.tobytes())
+        options = get_options()
+        for geometry in settings.POST_THUMBNAIL_SIZES:
+            sizes = []
+            for engine in (DefaultEngine(), Engine()):
+                image = engine.get_image(BytesIO(buffer.getvalue()))
+                box = parse_geometry(
+                    geometry, engine.get_image_ratio(image, options)
+                )
+                sizes.append(engine.create(image, box, options).size)
+            with self.subTest(geometry=geometry):
+                self.assertEqual(sizes[1], sizes[0])
+                self.assertEqual(sizes[1], parse_geometry(geometry))
+        image = Engine().get_image(BytesIO(buffer.getvalue()))
+        Engine().create(image, (480, 170), options)
+        self.assertLess(image.size, (3000, 2000))
+
+    def test_benchmark_compares_engines(self):
+        """Проверка: бенчмарк печатает время и память обоих движков"""
+        out = StringIO()
+        call_command('benchmark_thumbnail_engine', sizes=['800x600'],
+                     repeat=1, stdout=out)
+        for engine in ('default', 'reduce', 'Ускорение'):
+            with self.subTest(engine=engine):
+                self.assertIn(engine, out.getvalue())
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class CollectMediaGarbageCommandTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.live = self.create_post('live.gif', SMALL_GIF)
+        orphan = self.create_post('orphan.gif', SMALL_GIF + b'\x00')
+        self.orphan_name = orphan.image.name
+        self.orphan_thumbnails = [
+            variant.name for variant in thumbnails.get_variants(
+                self.orphan_name
+            )
+        ]
+        orphan.delete()
+
+    def create_post(self, filename, content):
+        post = Post.objects.create(
+            author=self.author, text=filename,
+            image=SimpleUploadedFile(filename, content,
+                                     content_type='image/gif')
+        )
+        thumbnails.generate(post.image.name)
+        return post
+
+    def collect(self, *args):
+        out = StringIO()
+        call_command('collect_media_garbage', '--min-age', '0',
+                     '--rate', '0', *args, stdout=out)
+        return out.getvalue()
+
+    def test_dry_run_deletes_nothing(self):
+        """Проверка: с --dry-run файлы только подсчитываются"""
+        self.assertIn('Будет удалено исходников: 1',
+                      self.collect('--dry-run'))
+        self.assertTrue(default_storage.exists(self.orphan_name))
+
+    def test_orphans_removed_live_kept(self):
+        """Проверка: удаляются исходник удаленного поста, его миниатюры
+        и записи kvstore; файлы живого поста остаются"""
+        self.assertIn('Удалено исходников: 1', self.collect())
+        self.assertFalse(default_storage.exists(self.orphan_name))
+        for name in self.orphan_thumbnails:
+            with self.subTest(name=name):
+                self.assertFalse(default_storage.exists(name))
+        self.assertTrue(default_storage.exists(self.live.image.name))
+        for variant in thumbnails.get_variants(self.live.image):
+            with self.subTest(name=variant.name):
+                self.assertTrue(default_storage.exists(variant.name))
+        self.assertIn('Удалено исходников: 0, записей kvstore: 0, '
+                      'миниатюр: 0', self.collect())
+
+    def test_rereferenced_source_kept(self):
+        """Проверка: исходник, который получил новый пост после сверки
+        пачки, не удаляется"""
+        live_images = media_gc.live_images
+
+        def reuse(names):
+            live = live_images(names)
+            Post.objects.create(author=self.author, text='Повтор',
+                                image=self.orphan_name)
+            return live
+
+        with mock.patch('posts.media_gc.live_images', side_effect=reuse):
+            self.assertIn('Удалено исходников: 0', self.collect())
+        self.assertTrue(default_storage.exists(self.orphan_name))
+
+    def test_stray_thumbnail_removed(self):
+        """Проверка: удаляется файл миниатюры, которого нет в kvstore"""
+        stray = default_storage.save('cache/00/00/stray.jpg',
+                                     ContentFile(SMALL_GIF))
+        self.assertIn('миниатюр: 1', self.collect())
+        self.assertFalse(default_storage.exists(stray))
+
+
+class ExportDataCommandTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='author')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.old_post = Post.objects.create(author=cls.author,
+                                           text='Старый пост')
+        Post.objects.filter(pk=cls.old_post.pk).update(
+            pub_date=timezone.now() - timezone.timedelta(days=30)
+        )
+        cls.post = Post.objects.create(author=cls.author,
+                                       text='Пост, "с кавычками"')
+        Comment.objects.create(post=cls.post, author=cls.reader,
+                               text='Комментарий')
+
+    def export(self, *args):
+        out = StringIO()
+        call_command('export_data', *args, chunk_size=1, stdout=out)
+        return out.getvalue()
+
+    def test_ndjson(self):
+        """Проверка: каждая строка NDJSON - объект записи"""
+        lines = self.export('posts').splitlines()
+        self.assertEqual(
+            [json.loads(line)['text'] for line in lines],
+            [self.old_post.text, self.post.text]
+        )
+        follow = json.loads(self.export('follows'))
+        self.assertEqual((follow['user'], follow['author']),
+                         ('reader', 'author'))
+
+    def test_csv_since(self):
+        """Проверка: CSV с заголовком, --since отсекает старые записи"""
+        since = (timezone.now() - timezone.timedelta(days=1)).date()
+        rows = list(csv.DictReader(StringIO(
+            self.export('posts', '--format', 'csv', '--since',
+                        since.isoformat())
+        )))
+        self.assertEqual([row['text'] for row in rows], [self.post.text])
+        self.assertEqual(rows[0]['author'], 'author')
+
+    def test_gzip_file(self):
+        """Проверка: --gzip пишет сжатую выгрузку в файл"""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'comments.ndjson.gz')
+        self.export('comments', '--gzip', '--output', path)
+        with gzip.open(path) as export_file:
+            comment = json.loads(export_file.read())
+        self.assertEqual((comment['post'], comment['text']),
+                         (self.post.pk, 'Комментарий'))
+
+
+class BulkImportCommandTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='author')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.group = Group.objects.create(title='Группа', slug='group',
+                                         description='Описание')
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        opener = gzip.open if name.endswith('.gz') else open
+        with opener(path, 'wt', encoding='utf-8') as input_file:
+            input_file.write(content)
+        return path
+
+    def ndjson(self, name, rows):
+        return self.write(name, ''.join(
+            json.dumps(row, ensure_ascii=False) + '\n' for row in rows
+        ))
+
+    def run_import(self, *args):
+        out = StringIO()
+        call_command('bulk_import', *args, batch_size=2, stdout=out)
+        return out.getvalue()
+
+    def test_users_and_posts(self):
+        """Проверка: пользователи из CSV, посты сохраняют id и даты,
+        посты неизвестных авторов и испорченные строки пропускаются,
+        счетчики и ленты подписчиков обновляются"""
+        self.run_import('users', self.write(
+            'users.csv', 'username,email\nwriter,w@example.com\nauthor,\n'
+        ))
+        writer = User.objects.get(username='writer')
+        self.assertFalse(writer.has_usable_password())
+        self.assertTrue(UserStats.objects.filter(user=writer).exists())
+        path = self.write('posts.ndjson', '\n'.join([
+            json.dumps({'id': 500, 'author': 'author', 'group': 'group',
+                        'text': 'Старый пост',
+                        'pub_date': '2020-01-02T03:04:05Z'}),
+            json.dumps({'author': 'writer', 'text': 'Новый пост'}),
+            json.dumps({'author': 'ghost', 'text': 'Пост'}),
+            '{испорчено',
+        ]))
+        output = self.run_import('posts', path)
+        self.assertIn('Загружено: 2, пропущено дубликатов: 0, '
+                      'с неизвестными ссылками: 1, испорченных: 1', output)
+        post = Post.objects.get(pk=500)
+        self.assertEqual((post.group, post.pub_date.year),
+                         (self.group, 2020))
+        self.assertEqual(UserStats.objects.get(user=self.author).posts_count,
+                         1)
+        self.assertTrue(TimelineEntry.objects.filter(user=self.reader,
+                                                     post=post).exists())
+
+    def test_finish_bumps_pages(self):
+        """Проверка: после импорта страницы с новыми постами
+        пересобираются, остальной кэш не очищается, даты из файла
+        сохраняются и у постов без id"""
+        url = reverse('posts:group_list', kwargs={'slug': 'group'})
+        self.client.get(url)
+        cache.set('bulk-import-test', 'kept')
+        self.run_import('posts', self.ndjson('posts.ndjson', [
+            {'author': 'author', 'group': 'group', 'text': 'Импорт',
+             'pub_date': '2020-01-02T03:04:05Z',
+             'updated_at': '2020-01-03T03:04:05Z'},
+        ]))
+        self.assertContains(self.client.get(url), 'Импорт')
+        self.assertEqual(cache.get('bulk-import-test'), 'kept')
+        post = Post.objects.get(text='Импорт')
+        self.assertEqual((post.pub_date.day, post.updated_at.day), (2, 3))
+
+    def test_finish_reconciles_touched_counters(self):
+        """Проверка: пересчитываются счетчики только затронутых
+        импортом пользователей"""
+        UserStats.objects.filter(user=self.reader).update(posts_count=5)
+        self.run_import('posts', self.ndjson('posts.ndjson', [
+            {'author': 'author', 'text': 'Пост'},
+        ]))
+        self.assertEqual(UserStats.objects.get(user=self.author).posts_count,
+                         1)
+        self.assertEqual(UserStats.objects.get(user=self.reader).posts_count,
+                         5)
+
+    def test_no_finish_warns(self):
+        """Проверка: без пересчета команда предупреждает о нем"""
+        err = StringIO()
+        call_command('bulk_import', 'posts', self.ndjson('posts.ndjson', [
+            {'author': 'author', 'text': 'Пост'},
+        ]), no_finish=True, stdout=StringIO(), stderr=err)
+        self.assertIn('reconcile_counters', err.getvalue())
+
+    def test_follow_duplicates_skipped(self):
+        """Проверка: повторные подписки и подписка на себя
+        пропускаются"""
+        User.objects.create_user(username='writer')
+        path = self.ndjson('follows.ndjson', [
+            {'user': 'reader', 'author': 'author'},
+            {'user': 'reader', 'author': 'writer'},
+            {'user': 'author', 'author': 'writer'},
+            {'user': 'reader', 'author': 'writer'},
+            {'user': 'writer', 'author': 'writer'},
+        ])
+        output = self.run_import('follows', path)
+        self.assertIn('Загружено: 2, пропущено дубликатов: 2', output)
+        self.assertEqual(Follow.objects.filter(author__username='writer')
+                         .count(), 2)
+        self.assertEqual(
+            UserStats.objects.get(user=self.reader).following_count, 2
+        )
+
+    def test_comments_gzip_rerun(self):
+        """Проверка: комментарии из gzip ссылаются на посты по id,
+        повторный запуск ничего не дублирует"""
+        post = Post.objects.create(author=self.author, text='Пост')
+        path = self.ndjson('comments.ndjson.gz', [
+            {'id': 900, 'post': post.pk, 'author': 'reader',
+             'text': 'Комментарий', 'created': '2021-05-06T07:08:09'},
+            {'post': 0, 'author': 'reader', 'text': 'Комментарий'},
+        ])
+        self.run_import('comments', path)
+        output = self.run_import('comments', path)
+        self.assertIn('Загружено: 0, пропущено дубликатов: 1, '
+                      'с неизвестными ссылками: 1', output)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(Comment.objects.get(pk=900).created.month, 5)
+
+
+class SeedBenchmarkDataCommandTest(TestCase):
+    OPTIONS = {'users': 30, 'posts': 60, 'groups': 3, 'comments': 20,
+               'follows': 5, 'seed': 7, 'stdout': StringIO()}
+
+    def snapshot(self):
+        posts = Post.objects.filter(author__username__startswith='bench_')
+        return (
+            list(posts.order_by('pub_date').values_list(
+                'author__username', 'group__slug', 'text', 'pub_date'
+            )),
+            sorted(Follow.objects.values_list('user__username',
+                                              'author__username')),
+            sorted(Comment.objects.values_list('author__username', 'text')),
+        )
+
+    def test_deterministic(self):
+        """Проверка: одинаковый seed дает одинаковые данные,
+        повторный запуск без --replace запрещен"""
+        call_command('seed_benchmark_data', **self.OPTIONS)
+        first = self.snapshot()
+        self.assertEqual((len(first[0]), len(first[2])), (60, 20))
+        with self.assertRaises(CommandError):
+            call_command('seed_benchmark_data', **self.OPTIONS)
+        call_command('seed_benchmark_data', replace=True, **self.OPTIONS)
+        self.assertEqual(self.snapshot(), first)
+        self.assertEqual(User.objects.filter(
+            username__startswith='bench_'
+        ).count(), 30)
+
+    def test_power_law(self):
+        """Проверка: у 10% самых популярных авторов больше трети
+        подписчиков (при равномерном выборе - десятая часть)"""
+        call_command('seed_benchmark_data', **{**self.OPTIONS,
+                                               'users': 200, 'follows': 10})
+        followers = sorted(UserStats.objects.values_list(
+            'followers_count', flat=True
+        ), reverse=True)
+        self.assertGreater(sum(followers[:20]), sum(followers) / 3)
+
+
+class BenchmarkViewsCommandTest(TestCase):
+
+    def test_all_views_covered(self):
+        """Проверка: замеры есть для каждого маршрута posts/urls.py"""
+        call_command('seed_benchmark_data', users=10, posts=10, comments=5,
+                     stdout=StringIO())
+        context = benchmarks.find_context('bench')
+        self.assertEqual(
+            benchmarks.uncovered(benchmarks.view_scenarios(context)), []
+        )
+
+    def test_baseline_and_regressions(self):
+        """Проверка: результаты сохраняются как базовые, рост числа
+        запросов относительно базы - регрессия"""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'baseline.json')
+        options = {'sizes': [20], 'repeat': 1, 'baseline': path,
+                   'stdout': StringIO()}
+        call_command('benchmark_views', save_baseline=True, **options)
+        with open(path) as baseline_file:
+            baseline = json.load(baseline_file)
+        self.assertIn('follow_index', baseline['20'])
+        self.assertIn('feed:timeline', baseline['20'])
+        self.assertFalse(User.objects.filter(
+            username__startswith='bench'
+        ).exists())
+        baseline['20']['api_index']['queries'] = 0
+        with open(path, 'w') as baseline_file:
+            json.dump(baseline, baseline_file)
+        with self.assertRaisesMessage(CommandError, 'api_index: запросов'):
+            call_command('benchmark_views', **options)
+
+    def test_default_cache_untouched(self):
+        """Проверка: замеры идут с временным кэшем, кэш сервера
+        не очищается"""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        cache.set('benchmark-test', 'kept')
+        call_command('benchmark_views', sizes=[20], repeat=1,
+                     baseline=os.path.join(directory, 'baseline.json'),
+                     save_baseline=True, stdout=StringIO())
+        self.assertEqual(cache.get('benchmark-test'), 'kept')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class LoadTestCommandTest(TransactionTestCase):
+    # запросы обрабатываются в потоках WSGI-сервера со своими
+    # соединениями с БД
+
+    def setUp(self):
+        cache.clear()
+        call_command('seed_benchmark_data', users=10, posts=20, groups=2,
+                     comments=5, stdout=StringIO())
+
+    def tearDown(self):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    # перекодирование в пуле сохраняет пост в транзакции параллельно
+    # с запросами, а SQLite в памяти тестов не ждет снятия блокировки
+    @override_settings(POST_IMAGE_INGEST=False)
+    def test_mixed_traffic(self):
+        """Проверка: все сценарии смеси выполняются без ошибок,
+        созданные прогоном записи удаляются"""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'load.json')
+        comments = Comment.objects.count()
+        posts = Post.objects.count()
+        mix = ','.join(f'{name}=1' for name in load_test.SCENARIOS)
+        # один клиент: SQLite в памяти тестов не ждет снятия блокировки
+        # таблицы, и параллельные записи падали бы с ошибкой
+        call_command('load_test', concurrency=1, requests=42, mix=mix,
+                     output=path, stdout=StringIO())
+        with open(path) as output:
+            summary = json.load(output)
+        self.assertEqual(summary['total']['requests'], 42)
+        self.assertEqual(summary['total']['error_rate'], 0)
+        self.assertEqual(set(summary['scenarios']),
+                         set(load_test.SCENARIOS))
+        self.assertEqual(summary['counter_drift'], 0)
+        self.assertEqual(Comment.objects.count(), comments)
+        self.assertEqual(Post.objects.count(), posts)
+
+    def test_concurrent_reads(self):
+        """Проверка: параллельное чтение лент проходит без ошибок"""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'load.json')
+        call_command('load_test', concurrency=4, requests=40,
+                     mix='index=2,group=1,profile=1,post=1,follow=2',
+                     output=path, stdout=StringIO())
+        with open(path) as output:
+            summary = json.load(output)
+        self.assertEqual(summary['concurrency'], 4)
+        self.assertEqual(summary['total']['requests'], 40)
+        self.assertEqual(summary['total']['error_rate'], 0)
+        self.assertEqual(summary['counter_drift'], 0)
+
+    def test_bad_mix(self):
+        """Проверка: неизвестный сценарий в смеси - ошибка команды"""
+        with self.assertRaisesMessage(CommandError, 'like'):
+            call_command('load_test', mix='index=1,like=2')
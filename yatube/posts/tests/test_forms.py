@@ -1,19 +1,28 @@
+import hashlib
+import os
 import shutil
-import tempfile
+import threading
+from io import BytesIO
+from unittest import mock
 
-from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase, override_settings
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
 from django.urls import reverse
+from PIL import Image
 
+from core.storage import hashed_name
+
+from .. import images
 from ..models import Comment, Group, Post
+from .utils import SMALL_GIF, TEMP_MEDIA_ROOT
 
 User = get_user_model()
 
-TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
-
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class PostFormTest(TestCase):
@@ -79,15 +88,63 @@ class PostFormTest(TestCase):
         self.assertEqual(Post.objects.count(), posts_count + 1)
         # Проверка соответствия полей нового поста данным, введенным в форме
         post = Post.objects.latest('pub_date')
+        image_name = hashed_name('posts/test_image.png',
+                                 hashlib.sha256(image).hexdigest())
         new_post_expected_data = {'text': form_data['text'],
                                   'group': group,
                                   'author': PostFormTest.user,
-                                  'image': 'posts/test_image.png'}
+                                  'image': image_name}
         for field, expected in new_post_expected_data.items():
             with self.subTest(field=field):
                 self.assertEqual(post.__getattribute__(field),
                                  expected or None)
 
+    def test_identical_uploads_stored_once(self):
+        """Проверка: одинаковые изображения хранятся одним файлом
+        во вложенном каталоге"""
+        names = []
+        for filename in ('first.gif', 'second.gif'):
+            self.auth_user.post(reverse('posts:post_create'), data={
+                'text': f'Пост с {filename}',
+                'image': SimpleUploadedFile(filename, SMALL_GIF,
+                                            content_type='image/gif')
+            })
+            names.append(Post.objects.get(
+                text=f'Пост с {filename}'
+            ).image.name)
+        digest = hashlib.sha256(SMALL_GIF).hexdigest()
+        self.assertEqual(names, [f'posts/{digest[:2]}/{digest[2:4]}/'
+                                 f'{digest}.gif'] * 2)
+        _, files = default_storage.listdir(
+            f'posts/{digest[:2]}/{digest[2:4]}'
+        )
+        self.assertEqual(files.count(f'{digest}.gif'), 1)
+
+    def test_uploaded_file_permissions(self):
+        """Проверка: права файла как у FileSystemStorage - 0o666
+        за вычетом umask, а не 0o600 временного файла"""
+        umask = os.umask(0)
+        os.umask(umask)
+        name = default_storage.save('posts/mode.txt',
+                                    ContentFile(b'permissions'))
+        mode = os.stat(default_storage.path(name)).st_mode & 0o777
+        self.assertEqual(mode, 0o666 & ~umask)
+
+    def test_reused_file_is_not_discarded(self):
+        """Проверка: файл, повторно выданный другой загрузке,
+        не удаляется, пока на него не сослался пост"""
+        name = default_storage.save('posts/reused.txt',
+                                    ContentFile(b'reused'))
+        path = default_storage.path(name)
+        uploaded = os.path.getmtime(path) - 60
+        os.utime(path, (uploaded, uploaded))
+        self.assertEqual(default_storage.save('posts/again.txt',
+                                              ContentFile(b'reused')), name)
+        self.assertFalse(images.discard(name, since=uploaded))
+        self.assertTrue(default_storage.exists(name))
+        self.assertTrue(images.discard(name, since=images.modified(name)))
+        self.assertFalse(default_storage.exists(name))
+
     def test_edit_post(self):
         """Проверка: редактирование поста"""
         post = PostFormTest.post
@@ -168,3 +225,111 @@ class PostFormTest(TestCase):
                 self.assertEqual(last_comment_on_page
                                  .__getattribute__(field),
                                  last_comment_expected.__getattribute__(field))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, POST_IMAGE_MAX_SIZE=200)
+class ImageIngestTest(TestCase):
+    """Тестирование обработки загруженных изображений."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='test_user')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        image = Image.new('RGB', (600, 300), 'red')
+        exif = Image.Exif()
+        exif[0x010F] = 'Камера'
+        # ориентация 6: снимок нужно повернуть на 90 градусов
+        exif[0x0112] = 6
+        buffer = BytesIO()
+        image.save(buffer, 'JPEG', exif=exif.tobytes())
+        client = Client()
+        client.force_login(self.user)
+        client.post(reverse('posts:post_create'), data={
+            'text': 'Пост с фотографией',
+            'image': SimpleUploadedFile('photo.jpg', buffer.getvalue(),
+                                        content_type='image/jpeg')
+        })
+        self.post = Post.objects.get(text='Пост с фотографией')
+
+    def test_image_downscaled_reencoded_and_stripped(self):
+        """Проверка: изображение уменьшается, поворачивается,
+        перекодируется и теряет EXIF, оригинал удаляется"""
+        original = self.post.image.name
+        name = images.ingest(self.post.pk, original)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.image.name, name)
+        self.assertTrue(
+            name.endswith('.' + images.EXTENSIONS[images.get_format()])
+        )
+        self.assertFalse(default_storage.exists(original))
+        with Image.open(default_storage.open(name)) as image:
+            self.assertEqual(image.size, (100, 200))
+            self.assertEqual(image.format, images.get_format())
+            self.assertFalse(image.getexif())
+
+    def test_metadata_follows_image(self):
+        """Проверка: размеры и хэш сохраняются при загрузке и
+        обновляются после обработки"""
+        self.assertEqual(
+            (self.post.image_width, self.post.image_height),
+            (300, 600)
+        )
+        images.ingest(self.post.pk, self.post.image.name)
+        self.post.refresh_from_db()
+        with default_storage.open(self.post.image.name) as image_file:
+            data = image_file.read()
+        self.assertEqual(
+            (self.post.image_width, self.post.image_height),
+            (100, 200)
+        )
+        self.assertEqual(self.post.image_hash,
+                         hashlib.sha256(data).hexdigest())
+
+    def test_replaced_image_is_not_overwritten(self):
+        """Проверка: если изображение поста заменили во время обработки,
+        результат обработки отбрасывается"""
+        original = self.post.image.name
+        Post.objects.filter(pk=self.post.pk).update(image='posts/other.jpg')
+        self.assertIsNone(images.ingest(self.post.pk, original))
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.image.name, 'posts/other.jpg')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, POST_IMAGE_WORKERS=2)
+class ImageProcessingQueueTest(TransactionTestCase):
+    # задачи ставятся в пул после фиксации транзакции
+
+    def tearDown(self):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_request_does_not_wait_for_processing(self):
+        """Проверка: ответ на загрузку не ждет обработки изображения,
+        wait_pending дожидается ее"""
+        release = threading.Event()
+        processed = []
+
+        def process_upload(post_id, name):
+            release.wait(5)
+            processed.append(post_id)
+
+        client = Client()
+        client.force_login(User.objects.create_user(username='author'))
+        with mock.patch.object(images, 'process_upload', process_upload):
+            response = client.post(reverse('posts:post_create'), data={
+                'text': 'Пост с картинкой',
+                'image': SimpleUploadedFile('small.gif', SMALL_GIF,
+                                            content_type='image/gif')
+            })
+            self.assertEqual(response.status_code, 302)
+            self.assertEqual(processed, [])
+            release.set()
+            images.wait_pending()
+        self.assertEqual(processed,
+                         [Post.objects.get(text='Пост с картинкой').pk])
@@ -1,8 +1,10 @@
+from unittest import mock
+
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import DatabaseError, models
 from django.test import TestCase
 
-from ..models import Group, Post
+from ..models import Comment, Follow, Group, Post, UserStats
 
 User = get_user_model()
 
@@ -69,3 +71,59 @@ class PostModelTest(TestCase):
                                  f'\nУстановите атрибут on_delete поля {field}'
                                  f'в режим {expected_mode.__name__}'
                                  )
+
+
+class CountersTest(TestCase):
+    """Проверяем денормализованные счетчики."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='author')
+
+    def get_counters(self, user):
+        user.stats.refresh_from_db()
+        return (user.stats.posts_count, user.stats.followers_count,
+                user.stats.following_count)
+
+    def test_counters_follow_create_and_delete(self):
+        """Счетчики меняются при создании и удалении объектов."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        comment = Comment.objects.create(author=self.reader, post=post,
+                                         text='Комментарий')
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(self.get_counters(self.author), (1, 1, 0))
+        self.assertEqual(self.get_counters(self.reader), (0, 0, 1))
+        comment.delete()
+        follow.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+        self.assertEqual(self.get_counters(self.reader), (0, 0, 0))
+        post.delete()
+        self.assertEqual(self.get_counters(self.author), (0, 0, 0))
+
+    def test_drifted_counters_do_not_go_negative(self):
+        """Удаление не падает, если счетчик уже разошелся с данными."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        comment = Comment.objects.create(author=self.reader, post=post,
+                                         text='Комментарий')
+        Post.objects.filter(pk=post.pk).update(comments_count=0)
+        UserStats.objects.filter(user=self.author).update(posts_count=0)
+        comment.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+        post.delete()
+        self.assertEqual(self.get_counters(self.author), (0, 0, 0))
+
+    def test_failed_counter_update_rolls_back_save(self):
+        """Комментарий не сохраняется без обновления счетчика поста."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        with mock.patch('posts.stats.bump_post',
+                        side_effect=DatabaseError('database is locked')):
+            with self.assertRaises(DatabaseError):
+                Comment.objects.create(author=self.reader, post=post,
+                                       text='Комментарий')
+        self.assertFalse(Comment.objects.filter(post=post).exists())
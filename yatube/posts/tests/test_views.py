@@ -1,12 +1,27 @@
+import gzip
+import json
 import random
+import re
+import shutil
+import time
+import unittest
 
 from django import forms
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
-from django.test import Client, TestCase
-from django.urls import reverse
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
 
-from ..models import Follow, Group, Post
+from core import stampede
+from core.decorators import QueryBudgetExceeded, query_budget
+
+from .. import cards, counts, follow_graph, thumbnails
+from ..models import Comment, Follow, Group, Post, TimelineEntry
+from .utils import SMALL_GIF, TEMP_MEDIA_ROOT, run_on_commit
 
 User = get_user_model()
 
@@ -221,6 +236,32 @@ class PaginatorViewsTest(TestCase):
         response = self.client.get(reverse('posts:index') + '?page=2')
         self.assertEqual(len(response.context['page_obj']), 3)
 
+    def test_cursor_pages(self):
+        """Проверка: листание по курсору вперед и назад."""
+        url = reverse('posts:index')
+        first_page = self.client.get(url).context['page_obj']
+        self.assertEqual(len(first_page), 10)
+        self.assertIsNone(first_page.previous_cursor)
+        second_page = self.client.get(
+            url, {'cursor': first_page.next_cursor}
+        ).context['page_obj']
+        self.assertEqual(len(second_page), 3)
+        self.assertIsNone(second_page.next_cursor)
+        back_page = self.client.get(
+            url, {'cursor': second_page.previous_cursor}
+        ).context['page_obj']
+        self.assertEqual(list(back_page), list(first_page))
+        self.assertIsNone(back_page.previous_cursor)
+        all_posts = list(first_page) + list(second_page)
+        self.assertEqual(len(set(all_posts)), 13)
+
+    def test_invalid_cursor_shows_first_page(self):
+        """Проверка: некорректный курсор отдает первую страницу."""
+        response = self.client.get(reverse('posts:index'),
+                                   {'cursor': 'broken'})
+        self.assertEqual(len(response.context['page_obj']), 10)
+        self.assertIsNone(response.context['page_obj'].previous_cursor)
+
     def test_pages_show_correct_posts(self):
         """Проверка: на страницах группы и пользователя отображаются
         только соотетствующие им посты"""
@@ -310,6 +351,72 @@ class SubscriptionsTest(TestCase):
         )
         self.assertEqual(followers_count - 1, Follow.objects.count())
 
+    def test_follow_feed_engines(self):
+        """Проверка: ленты подписок всех движков совпадают"""
+        Follow.objects.create(user=self.user1, author=self.user2)
+        with run_on_commit():
+            Post.objects.create(author=self.user2,
+                                text='Новый пост автора 2')
+        pages = {}
+        for engine in ('query', 'timeline', 'merge'):
+            with self.subTest(engine=engine):
+                cache.clear()
+                with self.settings(FOLLOW_FEED_ENGINE=engine):
+                    response = self.auth_user.get(
+                        reverse('posts:follow_index')
+                    )
+                pages[engine] = list(response.context['page_obj'])
+                self.assertEqual(len(pages[engine]), 2)
+        self.assertEqual(pages['query'], pages['timeline'])
+        self.assertEqual(pages['query'], pages['merge'])
+
+    def test_merge_feed_cursor_pages(self):
+        """Проверка: листание ленты 'merge' по курсору"""
+        user3 = User.objects.create_user(username='user3')
+        Follow.objects.create(user=self.user1, author=self.user2)
+        Follow.objects.create(user=self.user1, author=user3)
+        for i in range(12):
+            Post.objects.create(author=random.choice([self.user2, user3]),
+                                text=f'Пост {i}')
+        url = reverse('posts:follow_index')
+        with self.settings(FOLLOW_FEED_ENGINE='merge'):
+            first = self.auth_user.get(url).context['page_obj']
+            second = self.auth_user.get(
+                url, {'cursor': first.next_cursor}
+            ).context['page_obj']
+            back = self.auth_user.get(
+                url, {'cursor': second.previous_cursor}
+            ).context['page_obj']
+        expected = list(Post.objects.filter(
+            author__in=[self.user2, user3]
+        ).order_by('-pub_date', '-pk'))
+        self.assertEqual(list(first) + list(second), expected)
+        self.assertEqual(list(back), list(first))
+
+    def test_timeline_is_trimmed(self):
+        """Проверка: длина материализованной ленты ограничена"""
+        Follow.objects.create(user=self.user1, author=self.user2)
+        with self.settings(TIMELINE_LENGTH=2):
+            for i in range(3):
+                with run_on_commit():
+                    Post.objects.create(author=self.user2, text=f'Пост {i}')
+        self.assertEqual(self.user1.timeline.count(), 2)
+        self.assertEqual(self.user1.timeline.first().post.text, 'Пост 2')
+
+    @override_settings(TIMELINE_FANOUT_BATCH_SIZE=1)
+    def test_fan_out_after_commit(self):
+        """Проверка: пост раскладывается в ленты после фиксации
+        транзакции, пачками"""
+        user3 = User.objects.create_user(username='user3')
+        Follow.objects.create(user=self.user1, author=self.user2)
+        Follow.objects.create(user=user3, author=self.user2)
+        with run_on_commit():
+            post = Post.objects.create(author=self.user2, text='Новый пост')
+            self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        self.assertEqual(set(TimelineEntry.objects.filter(
+            post=post
+        ).values_list('user_id', flat=True)), {self.user1.pk, user3.pk})
+
     def unauthorized_user_redirect(self):
         redirect_from = reverse(
             'posts:profile_follow',
@@ -322,3 +429,778 @@ class SubscriptionsTest(TestCase):
                 [reverse('users:login'),
                  redirect_from])
         )
+
+
+class FollowGraphTest(TestCase):
+    """Тестирование сервиса графа подписок."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.authors = [User.objects.create_user(username=f'author{i}')
+                       for i in range(3)]
+        Follow.objects.create(user=cls.reader, author=cls.authors[0])
+        Follow.objects.create(user=cls.reader, author=cls.authors[2])
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.reader)
+
+    def test_is_following_many_uses_one_query(self):
+        """Проверка: проверка подписок списка авторов - один запрос,
+        повторная - из кэша."""
+        with self.assertNumQueries(1):
+            graph = follow_graph.FollowGraph()
+            following = graph.is_following_many(self.reader, self.authors)
+            self.assertTrue(graph.is_following(self.reader,
+                                               self.authors[0]))
+        self.assertEqual(following, {self.authors[0].pk: True,
+                                     self.authors[1].pk: False,
+                                     self.authors[2].pk: True})
+        with self.assertNumQueries(0):
+            follow_graph.FollowGraph().is_following(self.reader,
+                                                    self.authors[2])
+
+    def test_follow_and_unfollow_invalidate_graph(self):
+        """Проверка: подписка и отписка сбрасывают кэш графа."""
+        author = self.authors[1]
+        profile_url = reverse('posts:profile',
+                              kwargs={'username': author.username})
+        self.assertFalse(self.client.get(profile_url).context['following'])
+        self.client.get(reverse('posts:profile_follow',
+                                kwargs={'username': author.username}))
+        self.assertTrue(self.client.get(profile_url).context['following'])
+        self.client.get(reverse('posts:profile_unfollow',
+                                kwargs={'username': author.username}))
+        self.assertFalse(self.client.get(profile_url).context['following'])
+
+
+class AnonymousPageCacheTest(TestCase):
+    """Тестирование кэша страниц для анонимных посетителей."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(title='Группа', slug='group',
+                                         description='Описание')
+        cls.post = Post.objects.create(author=cls.author, group=cls.group,
+                                       text='Пост')
+
+    def setUp(self):
+        cache.clear()
+        self.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': self.author.username}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        )
+
+    def test_anonymous_pages_are_cached(self):
+        """Проверка: повторный запрос анонима не обращается к БД."""
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                with self.assertNumQueries(0):
+                    cached = self.client.get(url)
+                self.assertEqual(cached.content, response.content)
+
+    def test_pages_invalidated_on_new_post(self):
+        """Проверка: новый пост сразу появляется на страницах."""
+        for url in self.urls:
+            self.client.get(url)
+        Post.objects.create(author=self.author, group=self.group,
+                            text='Свежий пост')
+        # у главной страницы есть собственный фрагментный кэш
+        for url in self.urls[1:3]:
+            with self.subTest(url=url):
+                self.assertContains(self.client.get(url), 'Свежий пост')
+        # на странице поста меняется число постов автора
+        self.assertEqual(
+            self.client.get(self.urls[3]).context['post'].author.stats
+            .posts_count,
+            2
+        )
+
+    def test_post_detail_invalidated_on_comment(self):
+        """Проверка: новый комментарий сразу виден на странице поста."""
+        url = self.urls[3]
+        self.client.get(url)
+        Comment.objects.create(post=self.post, author=self.author,
+                               text='Свежий комментарий')
+        self.assertContains(self.client.get(url), 'Свежий комментарий')
+
+    def test_missing_post_author_not_cached(self):
+        """Проверка: запрос еще не созданного поста не запоминает
+        пустого автора, страница нового поста сбрасывается с лентой
+        автора."""
+        post_id = self.post.pk + 1
+        url = reverse('posts:post_detail', kwargs={'post_id': post_id})
+        self.assertEqual(self.client.get(url).status_code, 404)
+        Post.objects.create(id=post_id, author=self.author, text='Новый')
+        self.assertEqual(self.client.get(url).context['post'].author.stats
+                         .posts_count, 2)
+        Post.objects.create(author=self.author, text='Еще один')
+        self.assertEqual(self.client.get(url).context['post'].author.stats
+                         .posts_count, 3)
+
+    def test_pages_follow_author_rename(self):
+        """Проверка: после смены имени профиль доступен по новому имени,
+        по старому - нет, а страницы сбрасываются новыми постами."""
+        for url in self.urls:
+            self.client.get(url)
+        self.author.username = 'renamed'
+        self.author.save()
+        self.addCleanup(setattr, self.author, 'username', 'author')
+        self.assertEqual(self.client.get(self.urls[2]).status_code, 404)
+        renamed = reverse('posts:profile', kwargs={'username': 'renamed'})
+        self.assertEqual(self.client.get(renamed).status_code, 200)
+        Post.objects.create(author=self.author, text='После смены имени')
+        self.assertContains(self.client.get(renamed), 'После смены имени')
+        self.assertEqual(
+            self.client.get(self.urls[3]).context['post'].author.stats
+            .posts_count,
+            2
+        )
+
+    def test_feeds_invalidated_on_comment(self):
+        """Проверка: число комментариев на карточке в лентах меняется
+        сразу после комментария."""
+        for url in self.urls[1:3]:
+            self.client.get(url)
+        comment = Comment.objects.create(post=self.post, author=self.author,
+                                         text='Комментарий')
+        for url in self.urls[1:3]:
+            with self.subTest(url=url):
+                self.assertContains(self.client.get(url),
+                                    'Комментариев: 1')
+        comment.delete()
+        for url in self.urls[1:3]:
+            with self.subTest(url=url):
+                self.assertContains(self.client.get(url),
+                                    'Комментариев: 0')
+
+    def test_authorized_pages_are_not_cached(self):
+        """Проверка: авторизованному пользователю страница не
+        отдается из кэша."""
+        self.client.get(self.urls[0])
+        self.client.force_login(self.author)
+        response = self.client.get(self.urls[0])
+        self.assertIsNotNone(response.context)
+
+
+class ConditionalGetTest(TestCase):
+    """Тестирование условных GET-запросов."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Группа', slug='group',
+                                         description='Описание')
+        cls.post = Post.objects.create(author=cls.author, group=cls.group,
+                                       text='Пост')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': self.author.username}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        )
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def test_unchanged_pages_not_modified(self):
+        """Проверка: неизменная страница отдается как 304 без
+        рендеринга и запросов к данным"""
+        pages = [(self.client, url, 0) for url in self.urls]
+        # авторизованному пользователю нужны только сессия и он сам
+        pages.append((self.reader_client, reverse('posts:follow_index'), 2))
+        for client, url, queries in pages:
+            with self.subTest(url=url):
+                etag = client.get(url)['ETag']
+                with self.assertNumQueries(queries):
+                    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertFalse(response.content)
+
+    def test_no_last_modified(self):
+        """Проверка: Last-Modified не отдается, а одного
+        If-Modified-Since недостаточно для 304: дата последнего поста
+        не меняется при правке и удалении"""
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.assertNotIn('Last-Modified', self.client.get(url))
+                response = self.client.get(
+                    url, HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 '
+                                                '00:00:00 GMT'
+                )
+                self.assertEqual(response.status_code, 200)
+
+    def test_follow_changes_profile_etag(self):
+        """Проверка: подписка и отписка меняют ETag профиля автора
+        для подписчика"""
+        url = self.urls[2]
+        etag = self.reader_client.get(url)['ETag']
+        Follow.objects.filter(user=self.reader).delete()
+        response = self.reader_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(self.reader_client.get(
+            url, HTTP_IF_NONE_MATCH=etag
+        ).status_code, 200)
+
+    def test_changes_invalidate_etag(self):
+        """Проверка: новый пост, правка поста, комментарий и подписка
+        меняют ETag зависящих от них страниц"""
+        etags = {url: self.client.get(url)['ETag'] for url in self.urls}
+        follow_url = reverse('posts:follow_index')
+        follow_etag = self.reader_client.get(follow_url)['ETag']
+        Comment.objects.create(post=self.post, author=self.reader,
+                               text='Комментарий')
+        changes = [
+            (self.client, self.urls[3], etags[self.urls[3]]),
+        ]
+        Post.objects.create(author=self.author, group=self.group,
+                            text='Свежий пост')
+        changes += [(self.client, url, etags[url]) for url in self.urls[:3]]
+        changes.append((self.reader_client, follow_url, follow_etag))
+        for client, url, etag in changes:
+            with self.subTest(url=url):
+                response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+        follow_etag = self.reader_client.get(follow_url)['ETag']
+        Follow.objects.filter(user=self.reader).delete()
+        self.assertEqual(self.reader_client.get(
+            follow_url, HTTP_IF_NONE_MATCH=follow_etag
+        ).status_code, 200)
+
+    def test_comment_invalidates_feed_etag(self):
+        """Проверка: один только комментарий меняет ETag лент HTML
+        и API, на карточках которых выводится число комментариев"""
+        api_urls = (
+            reverse('posts:api_index'),
+            reverse('posts:api_group_list',
+                    kwargs={'slug': self.group.slug}),
+            reverse('posts:api_profile',
+                    kwargs={'username': self.author.username}),
+        )
+        changes = [(self.client, url) for url in (*self.urls, *api_urls)]
+        changes += [(self.reader_client, reverse('posts:follow_index')),
+                    (self.reader_client, reverse('posts:api_follow_index'))]
+        etags = [client.get(url)['ETag'] for client, url in changes]
+        Comment.objects.create(post=self.post, author=self.reader,
+                               text='Комментарий')
+        for (client, url), etag in zip(changes, etags):
+            with self.subTest(url=url):
+                response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+    def test_etag_depends_on_user(self):
+        """Проверка: ETag анонима не подходит авторизованному
+        пользователю"""
+        etag = self.client.get(self.urls[0])['ETag']
+        response = self.reader_client.get(self.urls[0],
+                                          HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class ExportDataViewTest(TestCase):
+    """Тестирование выгрузки данных для сотрудников."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.staff = User.objects.create_user(username='staff',
+                                             is_staff=True)
+        cls.author = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(author=cls.author, text='Пост')
+        cls.url = reverse('posts:export_data', kwargs={'dataset': 'posts'})
+
+    def setUp(self):
+        self.staff_client = Client()
+        self.staff_client.force_login(self.staff)
+
+    def test_only_staff(self):
+        """Проверка: выгрузка недоступна обычному пользователю"""
+        client = Client()
+        client.force_login(self.author)
+        self.assertEqual(client.get(self.url).status_code, 302)
+
+    def test_streaming_export(self):
+        """Проверка: выгрузка отдается потоком, в том числе gzip"""
+        response = self.staff_client.get(self.url)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        row = json.loads(b''.join(response.streaming_content))
+        self.assertEqual((row['id'], row['author']),
+                         (self.post.pk, 'author'))
+        response = self.staff_client.get(self.url, {'gzip': '1',
+                                                    'format': 'csv'})
+        self.assertIn('posts.csv.gz', response['Content-Disposition'])
+        content = gzip.decompress(b''.join(response.streaming_content))
+        self.assertTrue(content.decode().startswith('id,author,'))
+
+    def test_bad_parameters(self):
+        """Проверка: неизвестный набор - 404, испорченная дата - 400"""
+        self.assertEqual(self.staff_client.get(reverse(
+            'posts:export_data', kwargs={'dataset': 'users'}
+        )).status_code, 404)
+        self.assertEqual(self.staff_client.get(
+            self.url, {'since': 'вчера'}
+        ).status_code, 400)
+
+
+class PostCardCacheTest(TestCase):
+    """Тестирование кэша карточек постов."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(title='Группа', slug='group',
+                                         description='Описание')
+        cls.post = Post.objects.create(author=cls.author, group=cls.group,
+                                       text='Пост')
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.author)
+
+    def card_key(self, post):
+        return cards.fragment_key(post)
+
+    def test_card_is_shared_between_feeds(self):
+        """Проверка: карточка, отрисованная в одной ленте, берется
+        из кэша в другой."""
+        self.authorized_client.get(
+            reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        )
+        key = self.card_key(self.post)
+        self.assertIsNotNone(cache.get(key))
+        stampede.set(key, 'карточка из кэша', None)
+        response = self.authorized_client.get(
+            reverse('posts:profile', kwargs={'username': self.author})
+        )
+        self.assertContains(response, 'карточка из кэша')
+
+    def test_card_rerendered_after_edit(self):
+        """Проверка: после редактирования поста карточка обновляется."""
+        url = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        self.authorized_client.get(url)
+        self.authorized_client.post(
+            reverse('posts:post_edit', kwargs={'post_id': self.post.pk}),
+            data={'text': 'Исправленный пост', 'group': self.group.pk}
+        )
+        self.assertContains(self.authorized_client.get(url),
+                            'Исправленный пост')
+
+    def test_card_rerendered_after_author_rename(self):
+        """Проверка: новое имя автора сразу видно в карточке."""
+        url = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        self.authorized_client.get(url)
+        self.author.first_name = 'Лев'
+        self.author.last_name = 'Толстой'
+        self.author.save()
+        self.assertContains(self.authorized_client.get(url), 'Лев Толстой')
+
+    @override_settings(POST_CARD_CACHE_TIMEOUT=60)
+    def test_card_expires(self):
+        """Проверка: карточка хранится в кэше ограниченное время, ключ
+        зависит от настроек миниатюр."""
+        key = self.card_key(self.post)
+        self.authorized_client.get(
+            reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        )
+        self.assertLessEqual(cache.get(key)[1] - time.time(), 60)
+        with override_settings(POST_THUMBNAIL_SIZES=('480x170', '960x339')):
+            self.assertNotEqual(self.card_key(self.post), key)
+
+    def test_card_rerendered_after_comment(self):
+        """Проверка: новый комментарий меняет счетчик в карточке."""
+        url = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        self.authorized_client.get(url)
+        Comment.objects.create(post=self.post, author=self.author,
+                               text='Комментарий')
+        self.assertContains(self.authorized_client.get(url),
+                            'Комментариев: 1')
+
+
+class StampedeCacheTest(TestCase):
+    """Тестирование защиты кэша от одновременного пересчета."""
+    KEY = 'stampede-test'
+
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        return 'новое'
+
+    def test_fresh_value_is_not_recomputed(self):
+        """Проверка: свежее значение берется из кэша."""
+        stampede.set(self.KEY, 'старое', 60)
+        self.assertEqual(stampede.get_or_set(self.KEY, self.compute, 60),
+                         'старое')
+        self.assertEqual(self.calls, 0)
+
+    def test_expired_value_served_while_locked(self):
+        """Проверка: пока пересчитывает другой процесс, отдается
+        устаревшее значение."""
+        stampede.set(self.KEY, 'старое', 0)
+        cache.add(stampede.lock_key(self.KEY), True)
+        self.assertEqual(stampede.get_or_set(self.KEY, self.compute, 60),
+                         'старое')
+        self.assertEqual(self.calls, 0)
+
+    def test_expired_value_recomputed_once(self):
+        """Проверка: истекшее значение пересчитывается, блокировка
+        снимается."""
+        stampede.set(self.KEY, 'старое', 0)
+        self.assertEqual(stampede.get_or_set(self.KEY, self.compute, 60),
+                         'новое')
+        self.assertEqual(stampede.get_or_set(self.KEY, self.compute, 60),
+                         'новое')
+        self.assertEqual(self.calls, 1)
+        self.assertIsNone(cache.get(stampede.lock_key(self.KEY)))
+
+    def test_early_recompute(self):
+        """Проверка: долгий расчет обновляется до истечения срока."""
+        stampede.set(self.KEY, 'старое', 60, delta=10 ** 6)
+        self.assertEqual(stampede.get_or_set(self.KEY, self.compute, 60),
+                         'новое')
+
+    def test_not_cacheable_value_is_not_stored(self):
+        """Проверка: значение, отклоненное cacheable, не сохраняется."""
+        stampede.get_or_set(self.KEY, self.compute, 60,
+                            cacheable=lambda value: False)
+        self.assertIsNone(cache.get(self.KEY))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailPreloadTest(TestCase):
+    """Тестирование пакетной загрузки миниатюр страницы ленты."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        author = User.objects.create_user(username='author')
+        cls.posts = [
+            Post.objects.create(
+                author=author, text=f'Пост {i}',
+                image=SimpleUploadedFile('small.gif', SMALL_GIF,
+                                         content_type='image/gif')
+            )
+            for i in range(3)
+        ]
+        Post.objects.create(author=author, text='Пост без картинки')
+        for post in cls.posts:
+            thumbnails.get_variants(post.image)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        thumbnails._resolved.clear()
+
+    def test_page_resolved_in_one_query(self):
+        """Проверка: миниатюры страницы загружаются одним запросом,
+        повторно - из памяти процесса."""
+        posts = list(Post.objects.all())
+        with self.assertNumQueries(1):
+            thumbnails.preload(posts)
+        for post in posts:
+            with self.subTest(post=post.text):
+                if post.image:
+                    self.assertEqual(
+                        post.thumbnail,
+                        thumbnails.describe(
+                            thumbnails.get_variants(post.image)
+                        )
+                    )
+                else:
+                    self.assertIsNone(post.thumbnail)
+        with self.assertNumQueries(0):
+            thumbnails.preload(Post.objects.all()[:0])
+            thumbnails.preload(posts)
+
+    def test_size_computed_without_files(self):
+        """Проверка: размер миниатюры по сохраненным размерам исходника
+        совпадает с размером, который получил sorl."""
+        posts = list(Post.objects.exclude(image=''))
+        thumbnails.preload(posts)
+        for post in posts:
+            with self.subTest(post=post.text):
+                self.assertEqual(
+                    (post.image_width, post.image_height), (2, 1)
+                )
+                main = thumbnails.get_variants(post.image)[
+                    settings.POST_THUMBNAIL_SIZES.index(
+                        settings.POST_THUMBNAIL_DEFAULT
+                    )
+                ]
+                self.assertEqual(
+                    (post.thumbnail['width'], post.thumbnail['height']),
+                    tuple(main.size)
+                )
+
+    def test_cached_cards_are_not_preloaded(self):
+        """Проверка: миниатюры загружаются только для карточек,
+        которых нет в кэше."""
+        posts = list(Post.objects.select_related('author'))
+        self.assertEqual(cards.uncached(posts), posts)
+        self.client.get(reverse('posts:profile',
+                                kwargs={'username': 'author'}))
+        self.assertEqual(cards.uncached(posts), [])
+
+    def test_invalidate_forgets_resolved(self):
+        """Проверка: после удаления миниатюр запомненные данные
+        сбрасываются, в том числе по версии из общего кэша."""
+        posts = list(Post.objects.exclude(image=''))
+        thumbnails.preload(posts)
+        thumbnails.invalidate()
+        self.assertFalse(thumbnails._resolved)
+        thumbnails.preload(posts)
+        # другой процесс удалил миниатюры
+        cache.set(thumbnails.VERSION_KEY, 'другая версия', None)
+        self.assertEqual(thumbnails.resolve_many([]), {})
+        self.assertFalse(thumbnails._resolved)
+
+    def test_feed_renders_preloaded_thumbnails(self):
+        """Проверка: лента выводит srcset из загруженных данных."""
+        response = self.client.get(reverse('posts:index'))
+        for post in response.context['page_obj']:
+            if post.image:
+                self.assertContains(response, post.thumbnail['srcset'])
+
+
+class FeedCountsTest(TestCase):
+    """Тестирование кэшируемых счетчиков постов в лентах."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.follower = User.objects.create_user(username='follower')
+        cls.group = Group.objects.create(
+            title='Тестовое название группы',
+            slug='test-slug',
+            description='Тестовое описание'
+        )
+        Follow.objects.create(user=cls.follower, author=cls.author)
+        Post.objects.create(author=cls.author, text='Текст', group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+
+    def get_counts(self):
+        scopes = ((counts.GLOBAL, None, Post.objects.all()),
+                  (counts.GROUP, self.group.pk, self.group.posts.all()),
+                  (counts.AUTHOR, self.author.pk, self.author.posts.all()),
+                  (counts.FOLLOW, self.follower.pk,
+                   Post.objects.filter(author__following__user=self.follower)))
+        return [counts.get_count(queryset, scope, pk)
+                for scope, pk, queryset in scopes]
+
+    def test_counts_are_cached(self):
+        """Проверка: повторное чтение счетчиков не обращается к БД."""
+        self.assertEqual(self.get_counts(), [1, 1, 1, 1])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_counts(), [1, 1, 1, 1])
+
+    def test_counts_invalidated_on_post_create_and_delete(self):
+        """Проверка: счетчики сбрасываются при создании и удалении поста."""
+        self.get_counts()
+        post = Post.objects.create(author=self.author, text='Новый',
+                                   group=self.group)
+        self.assertEqual(self.get_counts(), [2, 2, 2, 2])
+        post.delete()
+        self.assertEqual(self.get_counts(), [1, 1, 1, 1])
+
+    def test_estimated_count(self):
+        """Проверка: в режиме оценки общий счетчик берется из оценки."""
+        with self.settings(FEED_COUNT_MODE='estimated',
+                           FEED_COUNT_ESTIMATE_THRESHOLD=0):
+            count = counts.get_count(Post.objects.all(), counts.GLOBAL)
+        self.assertEqual(count, counts.estimate_count(Post))
+
+
+class QueryBudgetTest(TestCase):
+    """Тестирование бюджета SQL-запросов view-функций."""
+    # бюджеты запросов view-функций
+    BUDGETS = {'posts:index': 4,
+               'posts:group_list': 5,
+               'posts:profile': 6,
+               'posts:post_detail': 4,
+               'posts:post_create': 7,
+               'posts:post_edit': 6,
+               'posts:add_comment': 3,
+               'posts:follow_index': 3,
+               'posts:profile_follow': 9,
+               'posts:profile_unfollow': 6}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.authors = [User.objects.create_user(username=f'author{i}')
+                       for i in range(3)]
+        cls.reader = User.objects.create_user(username='reader')
+        cls.groups = [
+            Group.objects.create(title=f'Группа {i}', slug=f'group-{i}',
+                                 description='Описание')
+            for i in range(2)
+        ]
+        for author in cls.authors:
+            Follow.objects.create(user=cls.reader, author=author)
+        cls.posts = [
+            Post.objects.create(author=cls.authors[i % 3],
+                                group=cls.groups[i % 2],
+                                text=f'Пост {i}')
+            for i in range(25)
+        ]
+        cls.post = cls.posts[0]
+        for author in cls.authors:
+            Comment.objects.create(post=cls.post, author=author,
+                                   text='Комментарий')
+
+    def setUp(self):
+        self.author_client = Client()
+        self.author_client.force_login(self.post.author)
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+        cache.clear()
+
+    def get_requests(self):
+        """Запросы к view: (имя, метод, аргументы URL, данные)"""
+        post_kwargs = {'post_id': self.post.pk}
+        author_kwargs = {'username': self.authors[0].username}
+        return [
+            ('posts:index', 'get', None, {}),
+            ('posts:group_list', 'get', {'slug': self.groups[0].slug}, {}),
+            ('posts:profile', 'get', author_kwargs, {}),
+            ('posts:post_detail', 'get', post_kwargs, {}),
+            ('posts:post_create', 'get', None, {}),
+            ('posts:post_create', 'post', None,
+             {'text': 'Новый пост', 'group': self.groups[0].pk}),
+            ('posts:post_edit', 'get', post_kwargs, {}),
+            ('posts:post_edit', 'post', post_kwargs,
+             {'text': 'Измененный пост', 'group': self.groups[1].pk}),
+            ('posts:add_comment', 'post', post_kwargs,
+             {'text': 'Новый комментарий'}),
+            ('posts:follow_index', 'get', None, {}),
+            ('posts:profile_unfollow', 'get', author_kwargs, {}),
+            ('posts:profile_follow', 'get', author_kwargs, {}),
+        ]
+
+    def test_views_budgets_are_pinned(self):
+        """Проверка: бюджеты view-функций не менялись незаметно."""
+        for view_name, budget in self.BUDGETS.items():
+            with self.subTest(view_name=view_name):
+                view = resolve(reverse(
+                    view_name, kwargs=next(
+                        kwargs for name, method, kwargs, data
+                        in self.get_requests() if name == view_name
+                    )
+                )).func
+                self.assertEqual(view.query_budget, budget)
+
+    def test_views_fit_budget(self):
+        """Проверка: view-функции укладываются в бюджет запросов
+        на любой странице и при любом движке ленты подписок."""
+        clients = (self.author_client, self.reader_client)
+        engines = ('query', 'timeline', 'merge')
+        with self.settings(QUERY_BUDGET_MODE='raise'):
+            for view_name, method, kwargs, data in self.get_requests():
+                url = reverse(view_name, kwargs=kwargs)
+                queries = ({}, {'page': 2}, {'page': 3}) if not data else (
+                    data,
+                )
+                for client in clients:
+                    for query in queries:
+                        for engine in engines:
+                            with self.subTest(view_name=view_name,
+                                              method=method,
+                                              query=query, engine=engine):
+                                cache.clear()
+                                with self.settings(
+                                    FOLLOW_FEED_ENGINE=engine
+                                ):
+                                    getattr(client, method)(url, query)
+            for view_name, method, kwargs, data in self.get_requests():
+                if method == 'get':
+                    with self.subTest(view_name=view_name, client='guest'):
+                        Client().get(reverse(view_name, kwargs=kwargs))
+
+    def test_budget_exceeded(self):
+        """Проверка: превышение бюджета приводит к ошибке или записи
+        в журнал в зависимости от режима."""
+        @query_budget(0)
+        def view(request):
+            return list(Post.objects.all())
+
+        request = RequestFactory().get('/')
+        with self.settings(QUERY_BUDGET_MODE='raise'):
+            with self.assertRaises(QueryBudgetExceeded):
+                view(request)
+        with self.settings(QUERY_BUDGET_MODE='log'):
+            with self.assertLogs('core.decorators', level='WARNING'):
+                view(request)
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite',
+                     'EXPLAIN QUERY PLAN есть только в SQLite')
+class QueryPlanTest(TestCase):
+    """Проверка: запросы лент не читают таблицы постов целиком."""
+    # полный просмотр таблицы в плане SQLite: SCAN без индекса
+    FULL_SCAN = re.compile(r'^SCAN (TABLE )?posts_\w+( AS \w+)?$')
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Группа', slug='group',
+                                         description='Описание')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.post = Post.objects.create(author=cls.author, group=cls.group,
+                                       text='Пост')
+        Comment.objects.create(post=cls.post, author=cls.reader,
+                               text='Комментарий')
+
+    def setUp(self):
+        self.client.force_login(self.reader)
+        cache.clear()
+
+    def get_full_scans(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            plan = [row[-1] for row in cursor.fetchall()]
+        return [step for step in plan if self.FULL_SCAN.match(step)]
+
+    def test_views_use_indexes(self):
+        urls = (reverse('posts:index'),
+                reverse('posts:group_list', kwargs={'slug': 'group'}),
+                reverse('posts:profile', kwargs={'username': 'author'}),
+                reverse('posts:post_detail',
+                        kwargs={'post_id': self.post.pk}),
+                reverse('posts:follow_index'))
+        for url in urls:
+            for engine in ('query', 'timeline', 'merge'):
+                for query in ({}, {'page': 1}):
+                    cache.clear()
+                    with self.settings(FOLLOW_FEED_ENGINE=engine):
+                        with CaptureQueriesContext(connection) as context:
+                            self.client.get(url, query)
+                    for captured in context.captured_queries:
+                        sql = captured['sql']
+                        if not sql.startswith('SELECT'):
+                            continue
+                        with self.subTest(url=url, engine=engine,
+                                          query=query, sql=sql):
+                            self.assertEqual(self.get_full_scans(sql), [])
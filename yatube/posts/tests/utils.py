@@ -0,0 +1,30 @@
+"""Общие данные тестов приложения posts."""
+import tempfile
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+# каталог медиафайлов тестов; модули удаляют его в tearDownClass,
+# хранилище создает его заново при следующем сохранении
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+# GIF 2x1
+SMALL_GIF = (b'\x47\x49\x46\x38\x39\x61\x02\x00'
+             b'\x01\x00\x80\x00\x00\x00\x00\x00'
+             b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+             b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+             b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+             b'\x0A\x00\x3B')
+
+
+@contextmanager
+def run_on_commit():
+    """Выполняет на выходе из блока функции transaction.on_commit,
+    зарегистрированные в нем: транзакция TestCase не фиксируется"""
+    start = len(connection.run_on_commit)
+    yield
+    callbacks = connection.run_on_commit[start:]
+    del connection.run_on_commit[start:]
+    for _, callback in callbacks:
+        callback()
@@ -0,0 +1,68 @@
+"""Движок sorl-thumbnail с уменьшением исходника до полного
+декодирования.
+
+Стандартный движок Pillow декодирует исходник в полном размере
+и масштабирует его одним resize. Этот движок:
+
+* для JPEG вызывает draft(): декодер сразу получает изображение,
+  уменьшенное в 2, 4 или 8 раз (масштабирование в DCT), поэтому
+  в память не попадает полноразмерный снимок;
+* при кратном уменьшении сначала вызывает Image.reduce() - быстрое
+  усреднение блоков пикселей - и только затем resample до точного
+  размера.
+
+Оба шага оставляют запас REDUCING_GAP над итоговым размером, как и
+Image.thumbnail в Pillow, поэтому финальный LANCZOS сглаживает
+результат и качество не отличается от стандартного движка.
+
+Имена миниатюр от движка не зависят, смена движка не требует
+пересоздания уже созданных файлов.
+"""
+from PIL import Image
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.engines import pil_engine
+from sorl.thumbnail.helpers import toint
+
+REDUCING_GAP = 2.0
+
+
+class Engine(pil_engine.Engine):
+
+    def create(self, image, geometry, options):
+        self.draft(image, geometry, options)
+        return super().create(image, geometry, options)
+
+    def target_size(self, image, geometry, options):
+        """Размер после scale() в ориентации файла или None,
+        если изображение не уменьшается"""
+        x_image, y_image = map(float, self.get_image_size(image))
+        flip = self.flip_dimensions(image)
+        if flip:
+            x_image, y_image = y_image, x_image
+        factor = self._calculate_scaling_factor(x_image, y_image, geometry,
+                                                options)
+        if factor >= 1:
+            return None
+        width, height = toint(x_image * factor), toint(y_image * factor)
+        return (height, width) if flip else (width, height)
+
+    def draft(self, image, geometry, options):
+        """Просит декодер JPEG уменьшить изображение при чтении"""
+        # draft возможен только до декодирования; crop-box и удаление
+        # рамок работают в координатах исходника, а альтернативные
+        # разрешения создаются из того же объекта изображения
+        if (image.format != 'JPEG' or options.get('cropbox')
+                or options.get('remove_border')
+                or thumbnail_settings.THUMBNAIL_ALTERNATIVE_RESOLUTIONS):
+            return
+        size = self.target_size(image, geometry, options)
+        if size:
+            image.draft(None, tuple(int(side * REDUCING_GAP)
+                                    for side in size))
+
+    def _scale(self, image, width, height):
+        factor = int(min(image.size[0] / width, image.size[1] / height)
+                     / REDUCING_GAP)
+        if factor >= 2:
+            image = image.reduce(factor)
+        return image.resize((width, height), resample=Image.LANCZOS)
@@ -0,0 +1,252 @@
+"""Миниатюры изображений постов.
+
+Для каждого изображения строится набор вариантов разной ширины
+(settings.POST_THUMBNAIL_SIZES), которые шаблоны отдают через srcset.
+Варианты генерируются сразу после сохранения поста в пуле потоков
+(posts/images.py), чтобы первый посетитель не ждал декодирования
+и масштабирования исходника. Если варианты не успели появиться,
+при рендеринге создается только основной вариант, а остальные
+ставятся в очередь пула.
+
+Метаданные миниатюр постов страницы, карточек которых нет в кэше
+(preload), читаются из kvstore sorl одним get_many из кэша и одним
+запросом к БД для промахов вместо отдельного обращения на каждый тег;
+результат запоминается в LRU процесса. После удаления миниатюр
+invalidate сбрасывает LRU всех процессов.
+"""
+import hashlib
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from sorl.thumbnail import default, delete, get_thumbnail
+from sorl.thumbnail.conf import defaults as thumbnail_defaults
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.helpers import toint
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import (
+    EMPTY_VALUE, KVStore as CachedDBKVStore
+)
+from sorl.thumbnail.models import KVStore
+from sorl.thumbnail.parsers import parse_geometry
+
+logger = logging.getLogger(__name__)
+
+# имя исходного файла -> данные для тега <img>
+_resolved = OrderedDict()
+_resolved_lock = threading.Lock()
+# версия миниатюр в общем кэше, с которой согласован _resolved
+VERSION_KEY = 'thumbnails:version'
+_resolved_version = None
+
+
+def get_variants(image):
+    """Варианты миниатюры изображения, от меньшего к большему.
+
+    Исходник передается в sorl по имени: ключ kvstore зависит и от
+    класса хранилища, а имя всегда открывается через THUMBNAIL_STORAGE.
+    """
+    name = getattr(image, 'name', image)
+    return [get_thumbnail(name, geometry, **settings.POST_THUMBNAIL_OPTIONS)
+            for geometry in settings.POST_THUMBNAIL_SIZES]
+
+
+def config_digest():
+    """Хэш настроек вариантов: при их изменении меняются имена файлов
+    и размеры миниатюр"""
+    config = (settings.POST_THUMBNAIL_SIZES, settings.POST_THUMBNAIL_DEFAULT,
+              sorted(settings.POST_THUMBNAIL_OPTIONS.items()))
+    return hashlib.md5(repr(config).encode()).hexdigest()
+
+
+def srcset(variants):
+    # размер неизвестен у миниатюр, которые sorl не смог создать
+    return ', '.join(f'{variant.url} {variant.width}w'
+                     for variant in variants if variant and variant.size)
+
+
+def describe(variants):
+    """Данные для тега <img>: src основного варианта и srcset;
+    вместо еще не созданных вариантов - None"""
+    main = variants[
+        settings.POST_THUMBNAIL_SIZES.index(settings.POST_THUMBNAIL_DEFAULT)
+    ]
+    image = {'src': main.url, 'srcset': srcset(variants)}
+    if main.size:
+        image['width'], image['height'] = main.size
+    return image
+
+
+def scaled_size(width, height, geometry=None):
+    """Размер миниатюры исходника width x height без обращения
+    к файлам; повторяет расчет движка sorl (scale и crop)"""
+    options = settings.POST_THUMBNAIL_OPTIONS
+    box = parse_geometry(geometry or settings.POST_THUMBNAIL_DEFAULT,
+                         width / height)
+    factors = (box[0] / width, box[1] / height)
+    factor = max(factors) if options.get('crop') else min(factors)
+    if factor < 1 or options.get('upscale',
+                                 thumbnail_settings.THUMBNAIL_UPSCALE):
+        width, height = toint(width * factor), toint(height * factor)
+    if options.get('crop'):
+        width, height = min(width, box[0]), min(height, box[1])
+    return width, height
+
+
+def _options(source):
+    """Опции миниатюры, дополненные так же, как это делает
+    ThumbnailBackend.get_thumbnail: от них зависит имя файла"""
+    backend = default.backend
+    options = dict(settings.POST_THUMBNAIL_OPTIONS)
+    if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(thumbnail_settings, attr)
+        if value != getattr(thumbnail_defaults, attr):
+            options.setdefault(key, value)
+    return options
+
+
+def _kvstore_keys(name):
+    """Ключи kvstore всех вариантов миниатюры файла name"""
+    source = ImageFile(name)
+    options = _options(source)
+    return [
+        add_prefix(ImageFile(
+            default.backend._get_thumbnail_filename(source, geometry,
+                                                    options),
+            default.storage
+        ).key)
+        for geometry in settings.POST_THUMBNAIL_SIZES
+    ]
+
+
+def _fetch(keys):
+    """Значения kvstore по ключам: get_many из кэша и один запрос
+    к БД для промахов"""
+    kvstore = default.kvstore
+    if not isinstance(kvstore, CachedDBKVStore):
+        return {key: kvstore._get_raw(key) for key in keys}
+    values = kvstore.cache.get_many(keys)
+    missing = [key for key in keys if key not in values]
+    if missing:
+        loaded = dict(KVStore.objects.filter(key__in=missing)
+                      .values_list('key', 'value'))
+        kvstore.cache.set_many(loaded,
+                               thumbnail_settings.THUMBNAIL_CACHE_TIMEOUT)
+        values.update(loaded)
+    return {key: value for key, value in values.items()
+            if value and value != EMPTY_VALUE}
+
+
+def _remember(name, image):
+    with _resolved_lock:
+        _resolved[name] = image
+        _resolved.move_to_end(name)
+        while len(_resolved) > settings.POST_THUMBNAIL_LRU_SIZE:
+            _resolved.popitem(last=False)
+
+
+def invalidate():
+    """Сбрасывает запомненные миниатюры в этом и, через версию в общем
+    кэше, в остальных процессах; вызывается после удаления миниатюр"""
+    global _resolved_version
+    version = uuid.uuid4().hex
+    cache.set(VERSION_KEY, version, None)
+    with _resolved_lock:
+        _resolved.clear()
+        _resolved_version = version
+
+
+def _sync_version():
+    global _resolved_version
+    version = cache.get(VERSION_KEY)
+    with _resolved_lock:
+        if version != _resolved_version:
+            _resolved.clear()
+            _resolved_version = version
+
+
+def _variants(name, keys, values):
+    """Варианты из kvstore; недостающий основной вариант создается
+    сразу, остальные - в пуле. Возвращает (варианты, все ли есть)"""
+    variants = [deserialize_image_file(values[key]) if key in values
+                else None for key in keys]
+    if None not in variants:
+        return variants, True
+    main = settings.POST_THUMBNAIL_SIZES.index(
+        settings.POST_THUMBNAIL_DEFAULT
+    )
+    if variants[main] is None:
+        variants[main] = get_thumbnail(name, settings.POST_THUMBNAIL_DEFAULT,
+                                       **settings.POST_THUMBNAIL_OPTIONS)
+    # images импортирует этот модуль
+    from . import images
+    images.defer_thumbnails(name)
+    return variants, False
+
+
+def resolve_many(names):
+    """Данные для тегов <img> по именам исходных файлов.
+
+    Если в kvstore нет основного варианта, он создается через sorl.
+    """
+    _sync_version()
+    resolved = {}
+    with _resolved_lock:
+        for name in names:
+            if name in _resolved:
+                _resolved.move_to_end(name)
+                resolved[name] = _resolved[name]
+    pending = {name: _kvstore_keys(name)
+               for name in names if name not in resolved}
+    if not pending:
+        return resolved
+    values = _fetch([key for keys in pending.values() for key in keys])
+    for name, keys in pending.items():
+        try:
+            variants, complete = _variants(name, keys, values)
+            resolved[name] = describe(variants)
+        except Exception:
+            # как и тег thumbnail из sorl, не ломаем страницу из-за картинки
+            logger.exception('Не удалось получить миниатюры %s', name)
+            continue
+        if complete:
+            _remember(name, resolved[name])
+    return resolved
+
+
+def preload(posts):
+    """Разрешает миниатюры всех постов страницы разом и сохраняет
+    результат в post.thumbnail"""
+    posts = list(posts)
+    resolved = resolve_many({post.image.name for post in posts
+                             if post.image})
+    for post in posts:
+        image = resolved.get(post.image.name) if post.image else None
+        if image and post.image_width and post.image_height:
+            image = dict(image)
+            image['width'], image['height'] = scaled_size(
+                post.image_width, post.image_height
+            )
+        post.thumbnail = image
+
+
+def generate(name, force=False):
+    """Создает все варианты миниатюры файла name; force - сначала
+    удалить существующие миниатюры. Возвращает успех операции"""
+    try:
+        if force:
+            delete(name, delete_file=False)
+            invalidate()
+        get_variants(name)
+        return True
+    except Exception:
+        logger.exception('Не удалось создать миниатюры %s', name)
+        return False
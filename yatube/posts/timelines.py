@@ -0,0 +1,107 @@
+"""Материализованные ленты подписок (fan-out on write).
+
+Каждый новый пост раскладывается в ленты подписчиков автора,
+подписка добавляет в ленту последние посты автора, отписка - удаляет.
+Длина ленты ограничена settings.TIMELINE_LENGTH.
+
+Раскладка нового поста идет после фиксации транзакции его сохранения,
+пачками по TIMELINE_FANOUT_BATCH_SIZE подписчиков в отдельных
+транзакциях: пост автора с десятками тысяч подписчиков не держит
+блокировку записи на все время раскладки.
+"""
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+
+from core.utils import chunked
+
+from . import counts
+from .models import Post, TimelineEntry
+
+
+def _insert(user_id, posts):
+    """Добавляет в ленту пользователя пары (id поста, pub_date)"""
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+         for post_id, pub_date in posts],
+        ignore_conflicts=True
+    )
+
+
+def _latest(posts):
+    return posts.order_by('-pub_date', '-pk').values_list(
+        'pk', 'pub_date'
+    )[:settings.TIMELINE_LENGTH]
+
+
+TRIM_SQL = """
+    DELETE FROM {table} WHERE id IN (
+        SELECT id FROM (
+            SELECT id, ROW_NUMBER() OVER (
+                PARTITION BY user_id ORDER BY pub_date DESC, post_id DESC
+            ) AS position
+            FROM {table} WHERE user_id IN ({users})
+        ) ranked WHERE position > %s
+    )
+"""
+
+
+def trim(user_ids):
+    """Обрезает ленты пользователей до settings.TIMELINE_LENGTH
+    одним запросом"""
+    if not user_ids:
+        return
+    sql = TRIM_SQL.format(table=TimelineEntry._meta.db_table,
+                          users=', '.join(['%s'] * len(user_ids)))
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*user_ids, settings.TIMELINE_LENGTH])
+
+
+def deliver(post_id, pub_date, follower_ids):
+    """Раскладывает пост в ленты подписчиков пачками"""
+    for user_ids in chunked(follower_ids,
+                            settings.TIMELINE_FANOUT_BATCH_SIZE):
+        try:
+            with transaction.atomic():
+                TimelineEntry.objects.bulk_create(
+                    [TimelineEntry(user_id=user_id, post_id=post_id,
+                                   pub_date=pub_date)
+                     for user_id in user_ids],
+                    ignore_conflicts=True
+                )
+                trim(user_ids)
+        except IntegrityError:
+            # пост удалили, пока шла раскладка
+            return
+        counts.invalidate(*[(counts.FOLLOW, user_id)
+                            for user_id in user_ids])
+
+
+def fan_out(post, follower_ids):
+    """Раскладывает новый пост в ленты подписчиков автора после
+    фиксации транзакции"""
+    post_id, pub_date = post.pk, post.pub_date
+    transaction.on_commit(
+        lambda: deliver(post_id, pub_date, list(follower_ids))
+    )
+
+
+def add_author(user_id, author_id):
+    """Дополняет ленту последними постами нового автора подписки"""
+    _insert(user_id, _latest(Post.objects.filter(author_id=author_id)))
+    trim([user_id])
+
+
+def remove_author(user_id, author_id):
+    """Убирает из ленты посты автора, от которого отписались"""
+    TimelineEntry.objects.filter(
+        user_id=user_id,
+        post__author_id=author_id
+    ).delete()
+
+
+def rebuild(user_id):
+    """Пересобирает ленту пользователя по текущим подпискам"""
+    TimelineEntry.objects.filter(user_id=user_id).delete()
+    _insert(user_id, _latest(Post.objects.filter(
+        author__following__user_id=user_id
+    )))
@@ -1,8 +1,9 @@
 from django.urls import path
 
-from .views import (add_comment, follow_index, group_posts, index, post_create,
-                    post_detail, post_edit, profile, profile_follow,
-                    profile_unfollow)
+from . import api
+from .views import (add_comment, export_data, follow_index, group_posts, index,
+                    post_create, post_detail, post_edit, profile,
+                    profile_follow, profile_unfollow)
 
 app_name = 'posts'
 
@@ -30,4 +31,13 @@ urlpatterns = [
         profile_unfollow,
         name="profile_unfollow"
     ),
+    # выгрузка данных для сотрудников
+    path('export/<str:dataset>/', export_data, name='export_data'),
+    # JSON API только для чтения
+    path('api/posts/', api.index, name='api_index'),
+    path('api/group/<slug:slug>/', api.group_posts, name='api_group_list'),
+    path('api/profile/<str:username>/', api.profile, name='api_profile'),
+    path('api/posts/<int:post_id>/', api.post_detail,
+         name='api_post_detail'),
+    path('api/follow/', api.follow_index, name='api_follow_index'),
 ]
@@ -1,22 +1,31 @@
-from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from django.http import Http404, HttpResponseBadRequest, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 
+from core.conditional import conditional_page
+from core.decorators import query_budget
+from core.page_cache import cache_anonymous_page
+
+from . import (cards, conditional, counts, export, feeds, follow_graph,
+               images, page_cache, thumbnails)
 from .forms import CommentForm, PostForm
 from .models import Follow, Group, Post
+from .paginators import paginate
 
 User = get_user_model()
 
 
+@conditional_page(conditional.index_validators)
+@cache_anonymous_page(page_cache.index_scopes)
+@query_budget(4)
 def index(request):
     template = 'posts/index.html'
-    posts = Post.objects.all()
-    paginator = Paginator(posts, settings.RECORDS_PER_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    posts = Post.objects.select_related('author', 'group')
+    page_obj = paginate(request, posts, count_scope=(counts.GLOBAL, None))
+    thumbnails.preload(cards.uncached(page_obj))
     return render(
         request,
         template,
@@ -26,49 +35,59 @@ def index(request):
     )
 
 
+@conditional_page(conditional.group_validators)
+@cache_anonymous_page(page_cache.group_scopes)
+@query_budget(5)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
     template = 'posts/group_list.html'
-    posts = group.posts.all()
-    paginator = Paginator(posts, settings.RECORDS_PER_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    posts = group.posts.select_related('author')
+    page_obj = paginate(request, posts, count_scope=(counts.GROUP, group.pk))
+    thumbnails.preload(cards.uncached(page_obj))
 
     return render(request, template, context={'group': group,
                                               'page_obj': page_obj})
 
 
+@conditional_page(conditional.profile_validators)
+@cache_anonymous_page(page_cache.profile_scopes)
+@query_budget(6)
 def profile(request, username):
-    user = get_object_or_404(User, username=username)
+    user = get_object_or_404(User.objects.select_related('stats'),
+                             username=username)
     template = 'posts/profile.html'
-    if request.user.is_authenticated:
-        following = user.pk in request.user.follower.values_list('author',
-                                                                 flat=True)
-    else:
-        following = False
-    posts = user.posts.all()
-    paginator = Paginator(posts, settings.RECORDS_PER_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    following = follow_graph.for_request(request).is_following(
+        request.user, user
+    )
+    posts = user.posts.select_related('group')
+    page_obj = paginate(request, posts, count_scope=(counts.AUTHOR, user.pk))
+    thumbnails.preload(cards.uncached(page_obj))
     context = {'author': user,
                'page_obj': page_obj,
                'following': following}
     return render(request, template, context)
 
 
+@conditional_page(conditional.post_validators)
+@cache_anonymous_page(page_cache.post_scopes)
+@query_budget(4)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'),
+        pk=post_id
+    )
     template = 'posts/post_detail.html'
     reader_is_author = request.user == post.author
     form = CommentForm(request.POST or None)
     context = {'post': post,
-               'comments': post.comments.all(),
+               'comments': post.comments.select_related('author'),
                'form': form,
                'reader_is_author': reader_is_author}
     return render(request, template, context)
 
 
 @login_required
+@query_budget(7)
 def post_create(request):
     template = 'posts/create_post.html'
     form = PostForm(request.POST or None,
@@ -78,6 +97,7 @@ def post_create(request):
         new_post = form.save(commit=False)
         new_post.author = user
         new_post.save()
+        images.schedule(new_post)
         redirect_url = reverse('posts:profile',
                                kwargs={'username': user.username})
         return redirect(redirect_url)
@@ -86,6 +106,7 @@ def post_create(request):
 
 
 @login_required
+@query_budget(6)
 def post_edit(request, post_id):
     template = 'posts/create_post.html'
     post = get_object_or_404(Post, pk=post_id)
@@ -99,15 +120,23 @@ def post_edit(request, post_id):
                     files=request.FILES or None,
                     instance=post)
     if form.is_valid():
-        form.save()
+        # счетчики поста поддерживаются сигналами и не перезаписываются
+        post = form.save(commit=False)
+        post.save(update_fields=[*PostForm.Meta.fields,
+                                 *images.METADATA_FIELDS, 'updated_at'])
+        if 'image' in form.changed_data:
+            images.schedule(post)
         return redirect(redirect_url)
     context = {'form': form, 'is_edit': True, 'post': post}
     return render(request, template, context)
 
 
 @login_required
+@query_budget(3)
 def add_comment(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    # группа нужна сигналу, сбрасывающему ленты с карточкой поста
+    post = get_object_or_404(Post.objects.select_related('group'),
+                             pk=post_id)
     form = CommentForm(request.POST or None)
     if form.is_valid():
         comment = form.save(commit=False)
@@ -118,16 +147,11 @@ def add_comment(request, post_id):
 
 
 @login_required
+@conditional_page(conditional.follow_validators)
+@query_budget(3)
 def follow_index(request):
-    posts = Post.objects.filter(
-        author_id__in=request.user.follower.values_list(
-            'author',
-            flat=True
-        )
-    )
-    paginator = Paginator(posts, settings.RECORDS_PER_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = feeds.follow_page(request)
+    thumbnails.preload(cards.uncached(page_obj))
     return render(
         request,
         'posts/follow.html',
@@ -138,23 +162,22 @@ def follow_index(request):
 
 
 @login_required
+@query_budget(9)
 def profile_follow(request, username):
     """Подписаться на автора"""
     followed_user = get_object_or_404(User, username=username)
     following_user = request.user
     if following_user != followed_user:
-        if not Follow.objects.filter(
+        # повторная подписка отсекается ограничением unique_follow
+        Follow.objects.get_or_create(
             user=following_user,
             author=followed_user
-        ).exists():
-            Follow.objects.create(
-                user=following_user,
-                author=followed_user
-            )
+        )
     return redirect(reverse('posts:follow_index'))
 
 
 @login_required
+@query_budget(6)
 def profile_unfollow(request, username):
     """Дизлайк, отписка"""
     followed_user = get_object_or_404(User, username=username)
@@ -164,3 +187,28 @@ def profile_unfollow(request, username):
         author=followed_user
     ).delete()
     return redirect(reverse('posts:follow_index'))
+
+
+@staff_member_required
+def export_data(request, dataset):
+    """Потоковая выгрузка набора данных для аналитики:
+    ?format=ndjson|csv, ?since=<ISO-дата>, ?gzip=1"""
+    export_format = request.GET.get('format', 'ndjson')
+    if dataset not in export.DATASETS or export_format not in export.FORMATS:
+        raise Http404
+    since = request.GET.get('since')
+    try:
+        since = export.parse_since(since) if since else None
+    except ValueError as error:
+        return HttpResponseBadRequest(str(error))
+    compress = request.GET.get('gzip') == '1'
+    response = StreamingHttpResponse(
+        export.export(dataset, export_format, since, compress),
+        content_type=('application/gzip' if compress
+                      else export.FORMATS[export_format])
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="'
+        f'{export.filename(dataset, export_format, compress)}"'
+    )
+    return response
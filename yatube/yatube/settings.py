@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -140,6 +141,13 @@ USE_TZ = True
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# загружаемые файлы именуются по SHA-256 содержимого и раскладываются
+# по вложенным каталогам; одинаковые загрузки хранятся один раз
+DEFAULT_FILE_STORAGE = 'core.storage.ContentAddressedStorage'
+# sorl сам выбирает имена миниатюр и не должен их менять
+THUMBNAIL_STORAGE = 'django.core.files.storage.FileSystemStorage'
+# уменьшает JPEG при декодировании (draft) и кратно - через reduce()
+THUMBNAIL_ENGINE = 'posts.thumbnail_engine.Engine'
 
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
@@ -154,11 +162,96 @@ EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 # указываем количество записей, выводимых на страницу
 RECORDS_PER_PAGE = 10
+# листать ленты по курсору (pub_date, id); ?page= работает всегда
+CURSOR_PAGINATION = True
+# наибольший размер страницы JSON API (?limit=)
+API_MAX_PAGE_SIZE = 100
+# счетчики постов в лентах: 'exact' - кэшируемый COUNT(*),
+# 'estimated' - оценка СУБД для общей ленты больших таблиц
+FEED_COUNT_MODE = 'exact'
+FEED_COUNT_ESTIMATE_THRESHOLD = 100000
+FEED_COUNT_CACHE_TIMEOUT = 60 * 60
+# сборка ленты подписок: 'query', 'timeline' (материализованная лента)
+# или 'merge' (слияние кэшируемых списков последних постов авторов)
+FOLLOW_FEED_ENGINE = 'timeline'
+# максимальная длина материализованной ленты подписок
+TIMELINE_LENGTH = 1000
+# по скольку подписчиков новый пост раскладывается в ленты за одну
+# транзакцию
+TIMELINE_FANOUT_BATCH_SIZE = 500
+# длина и время жизни кэшируемого списка последних постов автора
+AUTHOR_RECENT_LENGTH = 200
+AUTHOR_RECENT_TIMEOUT = 60 * 60 * 24
+# время жизни кэшированного списка подписок пользователя
+FOLLOW_GRAPH_TIMEOUT = 60 * 60 * 24
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
+# время жизни страниц в кэше для анонимных посетителей; страницы
+# сбрасываются сразу при изменении данных (core/page_cache.py)
+PAGE_CACHE_TIMEOUT = 60 * 60 * 24
+# время жизни отрисованных карточек постов (posts/cards.py)
+POST_CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+# бюджет SQL-запросов view (core.decorators.query_budget):
+# 'raise' - исключение при превышении, 'log' - предупреждение, 'off'
+QUERY_BUDGET_MODE = 'log'
+
+# защита кэша от одновременного пересчета (core/stampede.py):
+# beta - агрессивность досрочного пересчета, STALE_TTL - сколько
+# секунд после истечения хранится устаревшее значение, LOCK_TIMEOUT -
+# время жизни блокировки пересчета, LOCK_WAIT - сколько ждать чужой
+# пересчет, если устаревшего значения нет
+STAMPEDE_BETA = 1.0
+STAMPEDE_SINGLE_FLIGHT = True
+STAMPEDE_STALE_TTL = 60
+STAMPEDE_LOCK_TIMEOUT = 10
+STAMPEDE_LOCK_WAIT = 1
+
+# варианты миниатюр изображений постов для srcset (posts/thumbnails.py);
+# после изменения размеров выполнить manage.py regenerate_thumbnails
+POST_THUMBNAIL_SIZES = ('480x170', '960x339', '1440x509')
+POST_THUMBNAIL_DEFAULT = '960x339'
+POST_THUMBNAIL_OPTIONS = {'crop': 'center', 'upscale': True}
+# генерировать миниатюры сразу после сохранения поста в пуле потоков
+POST_THUMBNAIL_PREGENERATE = True
+# число изображений, метаданные миниатюр которых хранятся в памяти процесса
+POST_THUMBNAIL_LRU_SIZE = 4096
+
+# обработка загруженных изображений постов (posts/images.py): размер
+# по большей стороне, формат хранения ('WEBP' или 'JPEG' - прогрессивный),
+# качество и число потоков пула обработки. По умолчанию пула нет
+# и изображение обрабатывается сразу после фиксации транзакции: потоки
+# пула пишут в БД параллельно с запросами, а SQLite тестов не ждет
+# снятия блокировок. Сервер включает пул через YATUBE_IMAGE_WORKERS
+POST_IMAGE_INGEST = True
+POST_IMAGE_MAX_SIZE = 2048
+POST_IMAGE_FORMAT = 'WEBP'
+POST_IMAGE_QUALITY = 82
+POST_IMAGE_WORKERS = int(os.environ.get('YATUBE_IMAGE_WORKERS', 0))
+# сколько секунд тесты и команды ждут завершения обработки
+# (posts.images.wait_pending)
+POST_IMAGE_WAIT_TIMEOUT = 30
+# файл, загруженный или повторно выданный хранилищем позже стольких
+# секунд назад, не удаляется: на него может еще не ссылаться новый пост
+POST_IMAGE_DISCARD_GRACE = 600
+
+# двухуровневый кэш: LRU процесса перед общим для всех процессов
+# SQLite-файлом (core/two_tier_cache.py); файл задается переменной
+# окружения YATUBE_CACHE_LOCATION и по умолчанию лежит вне проекта,
+# тесты используют свой временный файл (yatube/test_settings.py)
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.two_tier_cache.TwoTierCache',
+        'LOCATION': os.environ.get(
+            'YATUBE_CACHE_LOCATION',
+            os.path.join(tempfile.gettempdir(), 'yatube', 'cache.sqlite3')
+        ),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+            'LOCAL_MAX_ENTRIES': 1000,
+            'SYNC_INTERVAL': 0.2,
+            'TOMBSTONE_TTL': 300,
+        },
     }
 }
@@ -0,0 +1,31 @@
+"""Настройки для запуска тестов.
+
+Общий кэш хранится во временном файле процесса тестов: тесты
+и очистка кэша после миграций (core/signals.py) не трогают файл кэша
+сервера разработки или продакшена.
+
+Изображения обрабатываются сразу после фиксации транзакции, без пула
+(posts/images.py), даже если YATUBE_IMAGE_WORKERS задана: SQLite
+в памяти тестов не ждет снятия блокировок, и запись из пула
+параллельно со следующим запросом теста падала бы.
+"""
+import atexit
+import os
+import shutil
+import tempfile
+
+from .settings import *  # noqa: F401,F403
+from .settings import CACHES
+
+_cache_directory = tempfile.mkdtemp(prefix='yatube-test-cache-')
+atexit.register(shutil.rmtree, _cache_directory, ignore_errors=True)
+
+CACHES = {
+    **CACHES,
+    'default': {
+        **CACHES['default'],
+        'LOCATION': os.path.join(_cache_directory, 'cache.sqlite3'),
+    },
+}
+
+POST_IMAGE_WORKERS = 0